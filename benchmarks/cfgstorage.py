@@ -0,0 +1,58 @@
+""" cfg storage lookups: `resolve()` and `get_settings()` before and
+    after configuration freeze
+
+    python benchmarks/cfgstorage.py
+"""
+import timeit
+
+import ptah
+from ptah import config
+from ptah.uri import ID_RESOLVER
+from ptah.testing import PtahTestCase
+
+NUMBER = 200000
+
+
+class Benchmark(PtahTestCase):
+
+    _init_sqla = False
+    _init_static = False
+
+    def runTest(self):  # pragma: no cover
+        pass
+
+
+def bench_resolver(uri):
+    return uri
+
+
+def measure():
+    tests = (
+        ('get_cfg_storage', lambda: config.get_cfg_storage(ID_RESOLVER)),
+        ('resolve', lambda: ptah.resolve('bench:1')),
+        ('get_settings', lambda: ptah.get_settings(ptah.CFG_ID_PTAH)),
+    )
+    return [(name, min(timeit.repeat(func, number=NUMBER, repeat=5))/NUMBER)
+            for name, func in tests]
+
+
+def run():
+    case = Benchmark()
+    case.setUp()
+    try:
+        case.config.ptah_uri_resolver('bench', bench_resolver)
+        case.config.commit()
+
+        before = measure()
+        config.freeze(case.registry)
+        after = measure()
+
+        print('%-20s %10s %10s' % ('', 'before', 'frozen'))
+        for (name, t1), (_, t2) in zip(before, after):
+            print('%-20s %7.0f ns %7.0f ns' % (name, t1*1e9, t2*1e9))
+    finally:
+        case.tearDown()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,46 @@
+""" `import ptah` time, based on ``python -X importtime``
+
+    python benchmarks/importtime.py [module]
+"""
+import os
+import sys
+import subprocess
+
+NUMBER = 5
+
+
+def importtime(module):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)))
+    proc = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    _, err = proc.communicate()
+
+    times = []
+    for line in err.decode('utf-8').splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line[12:].split('|')
+            try:
+                times.append((int(cumulative), name.rstrip()))
+            except ValueError:
+                continue
+    return times
+
+
+def run(module='ptah'):
+    results = [importtime(module) for i in range(NUMBER)]
+    total = min(
+        [t for t, name in times if name.strip() == module][0]
+        for times in results)
+    print('import %-20s %8.2f ms, %s modules' % (
+        module, total / 1000.0, len(results[-1])))
+
+    print('\nslowest imports:')
+    for t, name in sorted(results[-1], reverse=True)[1:16]:
+        print('%10.2f ms %s' % (t / 1000.0, name))
+
+
+if __name__ == '__main__':
+    run(*sys.argv[1:])
@@ -0,0 +1,47 @@
+""" encode/decode throughput of available json codecs
+
+    python benchmarks/jsoncodec.py
+"""
+import timeit
+from datetime import datetime
+
+from ptah import util
+
+NUMBER = 2000
+
+ROW = {'title': 'Content title',
+       'description': 'Long content description ' * 10,
+       'created': datetime(2014, 10, 1, 1, 56),
+       'modified': datetime(2014, 10, 2, 11, 6),
+       'tags': ['tag%s' % i for i in range(20)],
+       'roles': {'user:%s' % i: ['role:viewer', 'role:editor']
+                 for i in range(10)},
+       'weight': 1.5,
+       'hidden': False}
+
+
+def run():
+    data = util.json_codecs['json'].dumps(ROW)
+    size = len(data) / (1024.0 * 1024.0)
+
+    for name, codec in util.json_codecs.items():
+        encoded = codec.dumps(ROW)
+
+        enc = min(timeit.repeat(
+            lambda: codec.dumps(ROW), number=NUMBER, repeat=3)) / NUMBER
+        dec = min(timeit.repeat(
+            lambda: codec.loads(encoded), number=NUMBER, repeat=3)) / NUMBER
+
+        print('%-10s encode %7.1f us %7.1f MB/s, decode %7.1f us %7.1f MB/s'%(
+            name, enc * 1000000, size / enc, dec * 1000000, size / dec))
+
+    # previous implementation, kwargs are merged on every call
+    enc = min(timeit.repeat(
+        lambda: util.jsonmod.dumps(ROW, **util.kwargs),
+        number=NUMBER, repeat=3)) / NUMBER
+    print('%-10s encode %7.1f us %7.1f MB/s' % (
+        'kwargs', enc * 1000000, size / enc))
+
+
+if __name__ == '__main__':
+    run()
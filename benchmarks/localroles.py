@@ -0,0 +1,73 @@
+""" local roles resolution benchmark for 10-level deep trees
+
+    python benchmarks/localroles.py
+"""
+import timeit
+from zope import interface
+
+import ptah
+from ptah import security
+from ptah.testing import PtahTestCase
+
+DEPTH = 10
+SIBLINGS = 50
+NUMBER = 200
+
+
+class Content(object):
+
+    def __init__(self, parent=None):
+        self.__parent__ = parent
+        self.__local_roles__ = {}
+        interface.directlyProvides(self, ptah.ILocalRolesAware)
+
+
+class Principal(object):
+    properties = {'groups': ('group:1', 'group:2')}
+
+
+class Benchmark(PtahTestCase):
+
+    _init_sqla = False
+    _init_static = False
+
+    def runTest(self):  # pragma: no cover
+        pass
+
+
+def build_tree():
+    parent = None
+    for level in range(DEPTH - 1):
+        parent = Content(parent)
+        parent.__local_roles__['user:1'] = ('role:%s' % level,)
+        parent.__local_roles__['group:1'] = ('role:group',)
+
+    return [Content(parent) for i in range(SIBLINGS)]
+
+
+def run(cached):
+    case = Benchmark()
+    case.setUp()
+    try:
+        case.config.ptah_uri_resolver('user', lambda uri: Principal())
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH)
+        cfg['local_roles_cache'] = cached
+
+        siblings = build_tree()
+
+        def request():
+            ptah.tldata.clear()
+            for content in siblings:
+                security.get_local_roles('user:1', context=content)
+
+        return min(timeit.repeat(request, number=NUMBER, repeat=3)) / NUMBER
+    finally:
+        case.tearDown()
+
+
+if __name__ == '__main__':
+    for cached in (False, True):
+        t = run(cached)
+        print('local_roles_cache=%-5s %d siblings: %8.3f ms/request' % (
+            cached, SIBLINGS, t * 1000))
@@ -0,0 +1,71 @@
+""" QueryFreezer vs plain Session.query for token and uri resolver lookups
+
+    python benchmarks/queryfreezer.py
+"""
+import timeit
+import datetime
+import sqlalchemy as sqla
+
+import ptah
+from ptah.token import Token, TokenType
+from ptah.testing import PtahTestCase
+
+NUMBER = 2000
+
+TOKEN_TYPE = TokenType(
+    'bench-token', datetime.timedelta(hours=1))
+
+
+class Benchmark(PtahTestCase):
+
+    _init_ptah = False
+    _init_static = False
+
+    def runTest(self):  # pragma: no cover
+        pass
+
+
+def run():
+    case = Benchmark()
+    case.setUp()
+    try:
+        @ptah.tinfo('bench-content', 'Benchmark content')
+        class Content(ptah.get_base()):
+            __tablename__ = 'bench_queryfreezer'
+
+            id = sqla.Column(sqla.Integer, primary_key=True)
+            title = sqla.Column(sqla.Unicode)
+
+        case.init_ptah()
+        ptah.get_base().metadata.create_all()
+
+        Session = ptah.get_session()
+        item = Content(title='title')
+        Session.add(item)
+        Session.flush()
+
+        uri = item.__uri__
+        token = ptah.token.service.generate(TOKEN_TYPE, 'data')
+
+        tests = (
+            ('token, Session.query',
+             lambda: Session.query(Token)
+                .filter(Token.token == token).first()),
+            ('token, QueryFreezer',
+             lambda: ptah.token.service.get(token)),
+            ('resolver, Session.query',
+             lambda: Session.query(Content)
+                .filter(Content.id == item.id).first()),
+            ('resolver, QueryFreezer',
+             lambda: ptah.resolve(uri)),
+        )
+
+        for name, func in tests:
+            t = min(timeit.repeat(func, number=NUMBER, repeat=3)) / NUMBER
+            print('%-25s %8.1f us/lookup' % (name, t * 1000000))
+    finally:
+        case.tearDown()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,141 @@
+""" settings loading: compiled group loader vs previous extract,
+    full vs per-group load_fromdb
+
+    python benchmarks/settings.py
+"""
+import timeit
+
+import ptah
+from ptah import form
+from ptah.settings import Group, SettingRecord
+from ptah.settings import ID_SETTINGS_GROUP, SETTINGS_OB_ID
+from ptah.testing import PtahTestCase
+
+NUMBER = 20
+GROUPS = 20
+FIELDS = 25
+
+
+def make_fields():
+    fields = []
+    for i in range(FIELDS):
+        kind = i % 4
+        if kind == 0:
+            fields.append(form.TextField('text%s' % i, default='text'))
+        elif kind == 1:
+            fields.append(form.IntegerField('int%s' % i, default=10))
+        elif kind == 2:
+            fields.append(form.BoolField('bool%s' % i, default=False))
+        else:
+            fields.append(form.LinesField('lines%s' % i, default=()))
+    return fields
+
+
+def rawdata():
+    data = {}
+    for grp in range(GROUPS):
+        for field in make_fields():
+            key = 'bench%s.%s' % (grp, field.name)
+            if isinstance(field, form.BoolField):
+                data[key] = 'true'
+            elif isinstance(field, form.IntegerField):
+                data[key] = '25'
+            elif isinstance(field, form.LinesField):
+                data[key] = '["a", "b", "c"]'
+            else:
+                data[key] = 'Some setting value'
+    return data
+
+
+def legacy_extract(group, rawdata):
+    # previous implementation
+    fieldset = group.__fields__
+    name = fieldset.name
+
+    data = {}
+    errors = form.FieldsetErrors(fieldset)
+
+    for field in fieldset.fields():
+        value = rawdata.get('{0}.{1}'.format(name, field.name), None)
+
+        if value is None:
+            value = group.get(field.name)
+        else:
+            try:
+                try:
+                    value = ptah.json.loads(value)
+                except:
+                    if not value.startswith('"'):
+                        value = '"{0}"'.format(value)
+                    value = value.replace('\n', '\\n')
+                    value = ptah.json.loads(value)
+
+                field.validate(value)
+
+                if field.preparer is not None:
+                    value = field.preparer(value)
+            except form.Invalid as e:
+                errors.append(e)
+                value = field.default
+
+        data[field.name] = value
+
+    if not errors:
+        try:
+            fieldset.validate(data)
+        except form.Invalid as e:
+            errors.append(e)
+
+    return data, errors
+
+
+class Benchmark(PtahTestCase):
+
+    _init_static = False
+
+    def runTest(self):  # pragma: no cover
+        pass
+
+
+def run():
+    case = Benchmark()
+    case.setUp()
+    try:
+        storage = ptah.get_cfg_storage(ID_SETTINGS_GROUP)
+        for grp in range(GROUPS):
+            group = Group(name='bench%s' % grp, *make_fields())
+            storage[group.__name__] = group.clone(case.registry)
+
+        data = rawdata()
+        groups = [ptah.get_settings('bench%s' % grp) for grp in range(GROUPS)]
+
+        tests = (
+            ('extract, previous',
+             lambda: [legacy_extract(group, data) for group in groups]),
+            ('extract, compiled',
+             lambda: [group.extract(data) for group in groups]),
+        )
+        for name, func in tests:
+            t = min(timeit.repeat(func, number=NUMBER, repeat=3)) / NUMBER
+            print('%-25s %8.2f ms / %s settings' % (
+                name, t * 1000, len(data)))
+
+        Session = ptah.get_session()
+        for key, value in data.items():
+            Session.add(SettingRecord(name=key, value=value))
+        Session.flush()
+
+        settings = ptah.get_cfg_storage(SETTINGS_OB_ID)
+        tests = (
+            ('load_fromdb, all', lambda: settings.load_fromdb()),
+            ('load_fromdb, one group', lambda: settings.load_fromdb(['bench0'])),
+        )
+        for name, func in tests:
+            t = min(timeit.repeat(func, number=NUMBER, repeat=3)) / NUMBER
+            print('%-25s %8.2f ms' % (name, t * 1000))
+    finally:
+        case.tearDown()
+
+
+if __name__ == '__main__':
+    run()
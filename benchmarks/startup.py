@@ -0,0 +1,65 @@
+""" ptah configuration: full commit vs restored config snapshot
+
+    python benchmarks/startup.py
+"""
+import os
+import time
+import shutil
+import tempfile
+
+from ptah import config
+from ptah.testing import PtahTestCase
+
+NUMBER = 20
+
+
+class Benchmark(PtahTestCase):
+
+    _init_ptah = False
+    _init_sqla = False
+    _init_static = False
+
+    def runTest(self):  # pragma: no cover
+        pass
+
+
+def boot(settings):
+    case = Benchmark()
+    case._settings = settings
+    case.setUp()
+    try:
+        start = time.time()
+        case.init_ptah()
+        elapsed = time.time() - start
+
+        snapshot = getattr(case.registry, '__ptah_snapshot__', None)
+        restored = sorted(snapshot.restored) if snapshot is not None else []
+        config.save_snapshot(case.registry)
+        return elapsed, restored
+    finally:
+        case.tearDown()
+
+
+def run():
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'snapshot')
+        settings = {'ptah.config_snapshot': path}
+
+        tests = (
+            ('full configuration', {}),
+            ('restored snapshot', settings),
+        )
+        for name, settings in tests:
+            boot(settings)
+            results = [boot(settings) for i in range(NUMBER)]
+            t = min(elapsed for elapsed, _ in results)
+            print('%-25s %8.2f ms' % (name, t * 1000))
+
+        print('restored storages: %s' % ', '.join(results[-1][1]))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    run()
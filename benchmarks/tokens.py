@@ -0,0 +1,53 @@
+""" database vs signed token generate/get
+
+    python benchmarks/tokens.py
+"""
+import timeit
+import datetime
+
+import ptah
+from ptah.token import TokenType
+from ptah.testing import PtahTestCase
+
+NUMBER = 2000
+
+DB_TOKEN = TokenType(
+    'bench-token', datetime.timedelta(hours=1))
+
+SIGNED_TOKEN = TokenType(
+    'bench-signed-token', datetime.timedelta(hours=1), signed=True)
+
+
+class Benchmark(PtahTestCase):
+
+    _init_static = False
+
+    def runTest(self):  # pragma: no cover
+        pass
+
+
+def run():
+    case = Benchmark()
+    case.setUp()
+    try:
+        ptah.get_settings(ptah.CFG_ID_PTAH)['secret'] = 'benchmark'
+        service = ptah.token.service
+
+        for name, tt in (('database', DB_TOKEN), ('signed', SIGNED_TOKEN)):
+            token = service.generate(tt, 'data')
+
+            gen = min(timeit.repeat(
+                lambda: service.generate(tt, 'data'),
+                number=NUMBER, repeat=3)) / NUMBER
+            get = min(timeit.repeat(
+                lambda: service.get(token),
+                number=NUMBER, repeat=3)) / NUMBER
+
+            print('%-10s generate %8.1f us, get %8.1f us' % (
+                name, gen * 1000000, get * 1000000))
+    finally:
+        case.tearDown()
+
+
+if __name__ == '__main__':
+    run()
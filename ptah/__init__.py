@@ -1,138 +1,186 @@
 # ptah api
-
-# layout
-from ptah.renderer import layout
-from ptah.renderer import layout_config
-
-
-# config
-from ptah import config
-from ptah.config import subscriber
-from ptah.config import get_cfg_storage
-from ptah.config import shutdown
-from ptah.config import shutdown_handler
-
-# uri
-from ptah.uri import resolve
-from ptah.uri import resolver
-from ptah.uri import extract_uri_schema
-from ptah.uri import UriFactory
-
-# sqla
-from ptah.sqlautils import get_base
-from ptah.sqlautils import get_session
-
-# events
-from ptah import events
-from ptah.events import event
-
-# view api
-from ptah.view import View
-
-# settings
-from ptah.settings import get_settings
-from ptah.settings import register_settings
-from ptah.settings import load_dbsettings
-
-# security
-from ptah.authentication import auth_service
-from ptah.authentication import SUPERUSER_URI
-
-from ptah.authentication import auth_checker
-from ptah.authentication import auth_provider
-
-from ptah.authentication import search_principals
-from ptah.authentication import principal_searcher
-
-# acl
-from ptah.security import ACL
-from ptah.security import ACLsProperty
-from ptah.security import get_acls
-from ptah.interfaces import IACLsAware
-
-# role
-from ptah.security import Role
-from ptah.security import get_roles
-from ptah.security import get_local_roles
-from ptah.security import roles_provider
-from ptah.interfaces import IOwnersAware
-from ptah.interfaces import ILocalRolesAware
-
-# permission
-from ptah.security import Permission
-from ptah.security import get_permissions
-from ptah.security import check_permission
-
-# default roles and permissions
-from ptah.security import Everyone
-from ptah.security import Authenticated
-from ptah.security import Owner
-from ptah.security import DEFAULT_ACL
-from ptah.security import NOT_ALLOWED
-from pyramid.security import ALL_PERMISSIONS
-from pyramid.security import NO_PERMISSION_REQUIRED
-
-# type information
-from ptah.typeinfo import tinfo
-from ptah.typeinfo import TypeInformation
-from ptah.typeinfo import get_type, get_types
-from ptah.interfaces import NotFound, Forbidden
+import importlib.util
 
 # ptah settings ids
 CFG_ID_PTAH = 'ptah'
 
-# password tool
-from ptah.password import pwd_tool
-from ptah.password import password_changer
-
-# mail templates
-from ptah import mail
-
-# pagination
-from ptah.util import Pagination
-
-# thread local data
-from ptah.util import tldata
-
-# ReST renderer
-from ptah.rst import rst_to_html
-
-# sqlalchemy utils
-from ptah.sqlautils import QueryFreezer
-from ptah.sqlautils import JsonDictType
-from ptah.sqlautils import JsonListType
-from ptah.sqlautils import set_jsontype_serializer
-from ptah.sqla import generate_fieldset
-from ptah.sqla import build_sqla_fieldset
-
-# simple ui actions
-from ptah.uiactions import uiaction
-from ptah.uiactions import list_uiactions
-
-# manage
-from ptah import manage
-
 # populate
 POPULATE = False
+
+#: public api, name: (module, attribute), attributes are imported on
+#: first access, ``None`` attribute means module itself
+_API = {
+    # layout
+    'layout': ('ptah.renderer', 'layout'),
+    'layout_config': ('ptah.renderer', 'layout_config'),
+
+    # config
+    'config': ('ptah.config', None),
+    'subscriber': ('ptah.config', 'subscriber'),
+    'get_cfg_storage': ('ptah.config', 'get_cfg_storage'),
+    'shutdown': ('ptah.config', 'shutdown'),
+    'shutdown_handler': ('ptah.config', 'shutdown_handler'),
+
+    # uri
+    'resolve': ('ptah.uri', 'resolve'),
+    'resolve_many': ('ptah.uri', 'resolve_many'),
+    'resolver': ('ptah.uri', 'resolver'),
+    'extract_uri_schema': ('ptah.uri', 'extract_uri_schema'),
+    'UriFactory': ('ptah.uri', 'UriFactory'),
+
+    # sqla
+    'get_base': ('ptah.sqlautils', 'get_base'),
+    'get_session': ('ptah.sqlautils', 'get_session'),
+
+    # events
+    'events': ('ptah.events', None),
+    'event': ('ptah.events', 'event'),
+
+    # view api
+    'View': ('ptah.view', 'View'),
+
+    # settings
+    'get_settings': ('ptah.settings', 'get_settings'),
+    'register_settings': ('ptah.settings', 'register_settings'),
+    'load_dbsettings': ('ptah.settings', 'load_dbsettings'),
+
+    # security
+    'auth_service': ('ptah.authentication', 'auth_service'),
+    'SUPERUSER_URI': ('ptah.authentication', 'SUPERUSER_URI'),
+    'auth_checker': ('ptah.authentication', 'auth_checker'),
+    'auth_provider': ('ptah.authentication', 'auth_provider'),
+    'search_principals': ('ptah.authentication', 'search_principals'),
+    'resolve_principal': ('ptah.authentication', 'resolve_principal'),
+    'principal_searcher': ('ptah.authentication', 'principal_searcher'),
+
+    # acl
+    'ACL': ('ptah.security', 'ACL'),
+    'ACLsProperty': ('ptah.security', 'ACLsProperty'),
+    'get_acls': ('ptah.security', 'get_acls'),
+    'IACLsAware': ('ptah.interfaces', 'IACLsAware'),
+
+    # role
+    'Role': ('ptah.security', 'Role'),
+    'get_roles': ('ptah.security', 'get_roles'),
+    'get_local_roles': ('ptah.security', 'get_local_roles'),
+    'roles_provider': ('ptah.security', 'roles_provider'),
+    'IOwnersAware': ('ptah.interfaces', 'IOwnersAware'),
+    'ILocalRolesAware': ('ptah.interfaces', 'ILocalRolesAware'),
+
+    # permission
+    'Permission': ('ptah.security', 'Permission'),
+    'get_permissions': ('ptah.security', 'get_permissions'),
+    'check_permission': ('ptah.security', 'check_permission'),
+    'check_permissions': ('ptah.security', 'check_permissions'),
+    'check_permissions_many': ('ptah.security', 'check_permissions_many'),
+
+    # default roles and permissions
+    'Everyone': ('ptah.security', 'Everyone'),
+    'Authenticated': ('ptah.security', 'Authenticated'),
+    'Owner': ('ptah.security', 'Owner'),
+    'DEFAULT_ACL': ('ptah.security', 'DEFAULT_ACL'),
+    'NOT_ALLOWED': ('ptah.security', 'NOT_ALLOWED'),
+    'ALL_PERMISSIONS': ('pyramid.security', 'ALL_PERMISSIONS'),
+    'NO_PERMISSION_REQUIRED': ('pyramid.security', 'NO_PERMISSION_REQUIRED'),
+
+    # type information
+    'tinfo': ('ptah.typeinfo', 'tinfo'),
+    'TypeInformation': ('ptah.typeinfo', 'TypeInformation'),
+    'get_type': ('ptah.typeinfo', 'get_type'),
+    'get_types': ('ptah.typeinfo', 'get_types'),
+    'NotFound': ('ptah.interfaces', 'NotFound'),
+    'Forbidden': ('ptah.interfaces', 'Forbidden'),
+
+    # password tool
+    'pwd_tool': ('ptah.password', 'pwd_tool'),
+    'password_changer': ('ptah.password', 'password_changer'),
+
+    # mail templates
+    'mail': ('ptah.mail', None),
+
+    # pagination
+    'Pagination': ('ptah.util', 'Pagination'),
+
+    # thread local data
+    'tldata': ('ptah.util', 'tldata'),
+
+    # ReST renderer
+    'rst_to_html': ('ptah.rst', 'rst_to_html'),
+
+    # sqlalchemy utils
+    'QueryFreezer': ('ptah.sqlautils', 'QueryFreezer'),
+    'iter_keyset': ('ptah.sqlautils', 'iter_keyset'),
+    'JsonDictType': ('ptah.sqlautils', 'JsonDictType'),
+    'JsonListType': ('ptah.sqlautils', 'JsonListType'),
+    'set_jsontype_serializer': ('ptah.sqlautils', 'set_jsontype_serializer'),
+    'generate_fieldset': ('ptah.sqla', 'generate_fieldset'),
+    'build_sqla_fieldset': ('ptah.sqla', 'build_sqla_fieldset'),
+
+    # simple ui actions
+    'uiaction': ('ptah.uiactions', 'uiaction'),
+    'list_uiactions': ('ptah.uiactions', 'list_uiactions'),
+
+    # manage
+    'manage': ('ptah.manage', None),
+
+    # simple test case
+    'PtahTestCase': ('ptah.testing', 'PtahTestCase'),
+
+    # register migration
+    'register_migration': ('ptah.migrate', 'register_migration'),
+
+    # json
+    'json': ('ptah.util', 'json'),
+
+    # extra fields
+    'TextEditorField': ('ptah.jsfields', 'TextEditorField'),
+    'JSDateField': ('ptah.jsfields', 'JSDateField'),
+    'JSDateTimeField': ('ptah.jsfields', 'JSDateTimeField'),
+}
+
+
+def __getattr__(name):
+    try:
+        module, attr = _API[name]
+    except KeyError:
+        # ptah submodules, i.e. ``ptah.token``
+        if importlib.util.find_spec('ptah.' + name) is None:
+            raise AttributeError(
+                "module 'ptah' has no attribute '%s'" % name)
+        module, attr = 'ptah.' + name, None
+
+    value = importlib.import_module(module)
+    if attr is not None:
+        value = getattr(value, attr)
+
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()).union(_API))
+
+
+# populate decorator shadows ``ptah.populate`` module, so it is
+# imported eagerly
 from ptah.populate import populate
 from ptah.populate import POPULATE_DB_SCHEMA
 
-# simple test case
-from ptah.testing import PtahTestCase
 
-# register migration
-from ptah.migrate import register_migration
-
-# json
-from ptah.util import json
+def includeme(cfg):
+    from pyramid.settings import asbool
+    from ptah import config
+    from ptah.uri import resolver
+    from ptah.password import password_changer
+    from ptah.security import get_local_roles
 
-# extra fields
-from ptah.jsfields import TextEditorField
-from ptah.jsfields import JSDateField
-from ptah.jsfields import JSDateTimeField
+    if asbool(cfg.registry.settings.get('ptah.profile_startup', False)):
+        config.enable_profiler()
 
+    snapshot = cfg.registry.settings.get('ptah.config_snapshot')
+    if snapshot:
+        config.load_snapshot(cfg.registry, snapshot)
 
-def includeme(cfg):
     cfg.include('ptah.form')
     cfg.include('ptah.formatter')
     cfg.include('ptah.message')
@@ -183,9 +231,10 @@ def includeme(cfg):
     cfg.add_directive('ptah_init_mailer', ptahsettings.set_mailer)
 
     # ptah.config directives
-    from ptah.config import pyramid_get_cfg_storage
+    from ptah.config import pyramid_get_cfg_storage, pyramid_scan
     cfg.add_directive(
         'get_cfg_storage', pyramid_get_cfg_storage)
+    cfg.add_directive('ptah_scan', pyramid_scan)
 
     # ptah.config.settings directives
     from ptah.settings import pyramid_get_settings
@@ -237,18 +286,20 @@ def includeme(cfg):
         view=LayoutManage, parent='ptah')
 
     # scan ptah
-    cfg.scan('ptah.authentication')
-    cfg.scan('ptah.events')
-    cfg.scan('ptah.jsfields')
-    cfg.scan('ptah.mail')
-    cfg.scan('ptah.manage')
-    cfg.scan('ptah.password')
-    cfg.scan('ptah.populate')
-    cfg.scan('ptah.ptahsettings')
-    cfg.scan('ptah.security')
-    cfg.scan('ptah.settings')
-    cfg.scan('ptah.typeinfo')
-    cfg.scan('ptah.uri')
+    cfg.ptah_scan('ptah.authentication')
+    cfg.ptah_scan('ptah.events')
+    cfg.ptah_scan('ptah.jsfields')
+    cfg.ptah_scan('ptah.mail')
+    cfg.ptah_scan('ptah.manage')
+    cfg.ptah_scan('ptah.password')
+    cfg.ptah_scan('ptah.populate')
+    cfg.ptah_scan('ptah.ptahsettings')
+    cfg.ptah_scan('ptah.security')
+    cfg.ptah_scan('ptah.settings')
+    cfg.ptah_scan('ptah.token')
+    cfg.ptah_scan('ptah.typeinfo')
+    cfg.ptah_scan('ptah.uri')
+    cfg.ptah_scan('ptah.util')
 
     # translation
     cfg.add_translation_dirs('ptah:locale')
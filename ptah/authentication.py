@@ -1,9 +1,24 @@
+import time
+import queue
+import logging
+import threading
+import transaction
+from fnmatch import fnmatchcase
+from collections import OrderedDict
+import sqlalchemy as sqla
+from pyramid.compat import string_types
 from pyramid.security import authenticated_userid
-from pyramid.threadlocal import get_current_request
+from pyramid.threadlocal import manager
+from pyramid.threadlocal import get_current_request, get_current_registry
 
+import ptah
 from ptah import config
-from ptah.uri import resolve, resolver
-from ptah.util import tldata
+from ptah.uri import resolve, resolver, ResolverCache
+from ptah.util import tldata, LatencyStats
+from ptah.events import PrincipalAddedEvent, PrincipalRegisteredEvent
+from ptah.events import PrincipalModifiedEvent, PrincipalDeletingEvent
+from ptah.events import PrincipalPasswordChangedEvent, UriInvalidateEvent
+from ptah.events import SettingsGroupModified
 
 
 class _Superuser(object):
@@ -32,6 +47,11 @@ def superuser_resolver(uri):
 AUTH_CHECKER_ID = 'ptah:authchecker'
 AUTH_PROVIDER_ID = 'ptah:authprovider'
 AUTH_SEARCHER_ID = 'ptah:authsearcher'
+AUTH_ROUTER_ID = 'ptah:authrouter'
+AUTH_SEARCHER_STATS_ID = 'ptah:authsearcher-stats'
+AUTH_PRINCIPAL_CACHE_ID = 'ptah:principal-cache'
+
+log = logging.getLogger('ptah.authentication')
 
 
 def auth_checker(checker, __cfg=None, __depth=1):
@@ -92,22 +112,27 @@ class auth_provider(object):
     Auth provider interface :py:class:`ptah.interfaces.AuthProvider`
 
     :param name: provider name
+    :param route: login pattern or list of patterns (``fnmatch`` syntax),
+        provider is used only for matching logins. Logins that do not
+        match any pattern are authenticated with providers without route.
 
     .. code-block:: python
 
-      @ptah.auth_provider('my-provider')
+      @ptah.auth_provider('my-provider', route='*@example.com')
       class AuthProvider(object):
            ...
 
     """
-    def __init__(self, name, __depth=1):
+    def __init__(self, name, __depth=1, route=None):
         self.depth = __depth
+        self.route = route
         self.info = config.DirectiveInfo(__depth)
 
         self.discr = (AUTH_PROVIDER_ID, name)
         self.intr = config.Introspectable(
             AUTH_PROVIDER_ID, self.discr, name, 'ptah-authprovider')
         self.intr['id'] = name
+        self.intr['route'] = route
         self.intr['codeinfo'] = self.info.codeinfo
 
     def __call__(self, cls, __cfg=None):
@@ -117,15 +142,14 @@ class auth_provider(object):
 
         self.info.attach(
             config.Action(
-                lambda config, n, p: config.get_cfg_storage(AUTH_PROVIDER_ID)\
-                    .update({n: cls()}),
-                (self.intr['name'], cls),
+                _register_provider,
+                (self.intr['id'], cls, self.route),
                 discriminator=self.discr, introspectables=(self.intr,)),
             __cfg, self.depth)
         return cls
 
     @classmethod
-    def register(cls, name, provider):
+    def register(cls, name, provider, route=None):
         """ authentication provider registration::
 
         .. code-block:: python
@@ -136,12 +160,110 @@ class auth_provider(object):
           ptah.auth_provider.register('my-provider', AuthProvider)
 
         """
-        cls(name, 2)(provider)
+        cls(name, 2, route)(provider)
 
     @classmethod
-    def pyramid(cls, cfg, name, provider):
+    def pyramid(cls, cfg, name, provider, route=None):
         """ ``ptah_auth_provider`` directive implementation """
-        cls(name, 3)(provider, cfg)
+        cls(name, 3, route)(provider, cfg)
+
+
+def _register_provider(cfg, name, cls, route):
+    config.get_cfg_storage(AUTH_PROVIDER_ID, cfg.registry)\
+        .update({name: cls()})
+
+    if route:
+        get_auth_router(cfg.registry).add_route(name, route)
+
+
+def get_auth_router(registry=None):
+    """ Return :py:class:`AuthRouter` """
+    return config.get_cfg_storage(
+        AUTH_ROUTER_ID, registry, default_factory=AuthRouter)
+
+
+#: Result of auth provider `authenticate` for login that does not exist
+UNKNOWN_LOGIN = 'ptah:unknown-login'
+
+
+class AuthRouter(object):
+    """ Login to auth providers routing index, cache of unknown
+    logins and auth providers latency counters """
+
+    #: maximum size of unknown logins cache
+    negative_size = 10000
+
+    def __init__(self):
+        self.routes = OrderedDict()
+        self.domains = {}
+        self.patterns = []
+        self.negative = ResolverCache(self.negative_size)
+        self.stats = {}
+
+    def add_route(self, name, route):
+        if isinstance(route, string_types):
+            route = (route,)
+
+        self.routes[name] = tuple(route)
+        for pattern in route:
+            domain = pattern[2:]
+            if pattern.startswith('*@') and \
+                    not any(ch in domain for ch in '*?['):
+                self.domains.setdefault(domain.lower(), []).append(name)
+            else:
+                self.patterns.append((pattern, name))
+
+    def providers(self, login, providers):
+        """ Return list of (name, provider) pairs for `login` """
+        if not self.routes or not login:
+            return list(providers.items())
+
+        matched = set()
+        if '@' in login:
+            matched.update(
+                self.domains.get(login.rsplit('@', 1)[1].lower(), ()))
+
+        for pattern, name in self.patterns:
+            if fnmatchcase(login, pattern):
+                matched.add(name)
+
+        if matched:
+            return [(name, provider) for name, provider in providers.items()
+                    if name in matched]
+
+        return [(name, provider) for name, provider in providers.items()
+                if name not in self.routes]
+
+    def is_unknown(self, login):
+        """ Login is unknown to all providers """
+        return self.negative.get(login) is not None
+
+    def set_unknown(self, login, ttl):
+        """ Remember unknown login for `ttl` seconds """
+        negative = self.negative
+        if negative.maxsize != self.negative_size or negative.ttl != ttl:
+            negative.configure(self.negative_size, ttl)
+        negative.set(login, True)
+
+    def forget(self, login):
+        self.negative.invalidate(login)
+
+    def call(self, name, func, *args):
+        """ Call provider method, update provider latency counters """
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats.setdefault(name, LatencyStats())
+
+        start = time.time()
+        try:
+            return func(*args)
+        finally:
+            stats.add(time.time() - start)
+
+    def info(self):
+        """ Latency counters of auth providers """
+        return dict((name, stats.info())
+                    for name, stats in self.stats.items())
 
 
 class AuthInfo(object):
@@ -182,9 +304,21 @@ class Authentication(object):
         :param credentials: Dictionary with `login` and `password`
         :rtype: :py:class:`ptah.authentication.AuthInfo`
         """
+        login = credentials.get('login')
+        router = get_auth_router()
+        if login and router.is_unknown(login):
+            return AuthInfo(None)
+
         providers = config.get_cfg_storage(AUTH_PROVIDER_ID)
-        for pname, provider in providers.items():
-            principal = provider.authenticate(credentials)
+        candidates = router.providers(login, providers)
+        unknown = bool(candidates)
+        for pname, provider in candidates:
+            principal = router.call(
+                pname, provider.authenticate, credentials)
+            if principal is UNKNOWN_LOGIN:
+                continue
+
+            unknown = False
             if principal is not None:
                 info = AuthInfo(principal)
 
@@ -194,8 +328,21 @@ class Authentication(object):
                         return info
 
                 info.status = True
+                password = credentials.get('password')
+                if password:
+                    try:
+                        ptah.pwd_tool.rehash(principal, password)
+                    except Exception:
+                        log.exception("Can't rehash password for %s",
+                                      principal.__uri__)
                 return info
 
+        # remember login if it is unknown to all providers
+        if login and unknown:
+            ttl = _negative_cache_ttl()
+            if ttl > 0:
+                router.set_unknown(login, ttl)
+
         return AuthInfo(None)
 
     def authenticate_principal(self, principal):
@@ -241,27 +388,355 @@ class Authentication(object):
 
     def get_current_principal(self):
         """ Resolve and return current user uri """
-        return resolve(self.get_userid())
+        return resolve_principal(self.get_userid())
 
     def get_principal_bylogin(self, login):
         """ Return principal by login """
-        providers = config.get_cfg_storage(AUTH_PROVIDER_ID)
+        router = get_auth_router()
+        if router.is_unknown(login):
+            return None
 
-        for pname, provider in providers.items():
-            principal = provider.get_principal_bylogin(login)
+        providers = config.get_cfg_storage(AUTH_PROVIDER_ID)
+        for pname, provider in router.providers(login, providers):
+            principal = router.call(
+                pname, provider.get_principal_bylogin, login)
             if principal is not None:
                 return principal
 
+        ttl = _negative_cache_ttl()
+        if ttl > 0:
+            router.set_unknown(login, ttl)
+
+
+def _negative_cache_ttl():
+    try:
+        return ptah.get_settings(ptah.CFG_ID_PTAH).snapshot\
+            .auth_negative_cache_ttl
+    except KeyError:
+        return 0
+
+
 auth_service = Authentication()
 
 
-def search_principals(term):
-    """ Search principals by term, it uses principal_searcher functions """
-    searchers = config.get_cfg_storage(AUTH_SEARCHER_ID)
-    for name, searcher in searchers.items():
-        for principal in searcher(term):
+@config.subscriber(PrincipalAddedEvent)
+@config.subscriber(PrincipalRegisteredEvent)
+@config.subscriber(PrincipalModifiedEvent)
+def forget_unknown_login(ev):
+    """ Remove new or renamed principal login from unknown
+    logins cache """
+    login = getattr(ev.principal, 'login', None)
+    if login:
+        get_auth_router().forget(login)
+
+
+def get_principal_cache(registry=None):
+    """ Return process wide principals cache, ``None`` if cache
+    is disabled (``ptah.principal_cache_ttl`` setting) """
+    cfg = ptah.get_settings(ptah.CFG_ID_PTAH, registry).snapshot
+    if cfg.principal_cache_ttl <= 0:
+        return None
+
+    return config.get_cfg_storage(
+        AUTH_PRINCIPAL_CACHE_ID, registry,
+        default_factory=_principal_cache_factory)
+
+
+def _principal_cache_settings(registry=None):
+    try:
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH, registry)
+        return (cfg['principal_cache_size'] or None,
+                cfg['principal_cache_ttl'] or None)
+    except KeyError:
+        return None, None
+
+
+def _principal_cache_factory():
+    return ResolverCache(*_principal_cache_settings())
+
+
+@config.subscriber(SettingsGroupModified)
+def configure_principal_cache(ev):
+    if ev.object.__name__ == ptah.CFG_ID_PTAH:
+        registry = ev.object.__registry__
+        config.get_cfg_storage(
+            AUTH_PRINCIPAL_CACHE_ID, registry,
+            default_factory=_principal_cache_factory)\
+            .configure(*_principal_cache_settings(registry))
+
+
+def resolve_principal(uri):
+    """ Resolve principal `uri`. With ``ptah.principal_cache_ttl``
+    setting principals are cached in process wide cache. For sqlalchemy
+    principals cache keeps identity key only, principal is loaded
+    by primary key through current session identity map. """
+    cache = get_principal_cache() if uri else None
+    if cache is None:
+        return resolve(uri)
+
+    cached = cache.get(uri, _not_set)
+    if cached is _not_set:
+        principal = resolve(uri)
+        if principal is not None:
+            cached = _principal_identity(principal)
+            if cached is not None:
+                cache.set(uri, cached)
+        return principal
+
+    if isinstance(cached, _PrincipalIdentity):
+        principal = ptah.get_session().query(cached.cls).get(cached.ident)
+        if principal is None:
+            cache.invalidate(uri)
+        return principal
+
+    return cached
+
+
+class _PrincipalIdentity(object):
+    """ mapped class and primary key of sqlalchemy principal """
+
+    __slots__ = ('cls', 'ident')
+
+    def __init__(self, cls, ident):
+        self.cls = cls
+        self.ident = ident
+
+
+def _principal_identity(principal):
+    state = sqla.inspect(principal, raiseerr=False)
+    if state is None:
+        return principal
+
+    # do not cache pending principals
+    if state.key is None:
+        return None
+
+    return _PrincipalIdentity(state.key[0], state.key[1])
+
+
+@config.subscriber(PrincipalModifiedEvent)
+@config.subscriber(PrincipalPasswordChangedEvent)
+@config.subscriber(PrincipalDeletingEvent)
+def invalidate_principal_cache(ev):
+    """ Evict modified principal from principals cache """
+    uri = getattr(ev.principal, '__uri__', None)
+    if uri:
+        config.get_cfg_storage(
+            AUTH_PRINCIPAL_CACHE_ID,
+            default_factory=_principal_cache_factory).invalidate(uri)
+
+
+@config.subscriber(UriInvalidateEvent)
+def invalidate_principal_uri(ev):
+    config.get_cfg_storage(
+        AUTH_PRINCIPAL_CACHE_ID, default_factory=_principal_cache_factory)\
+        .invalidate(ev.uri)
+
+
+def search_principals(term, limit=None, offset=0, timeout=None):
+    """ Search principals by term, it uses principal_searcher functions.
+    Principals are de-duplicated by ``__uri__``.
+
+    With ``ptah.search_workers`` setting up to given number of
+    searchers are running concurrently in separate threads, principals
+    are returned as they arrive and are merged into current session.
+    Searchers that do not finish in `timeout` seconds after start
+    (``ptah.search_timeout`` setting by default) are ignored, searcher
+    is skipped by following searches while timed out call is running.
+
+    :param term: Search term
+    :param limit: Maximum number of principals
+    :param offset: Number of principals to skip
+    :param timeout: Searchers timeout in seconds
+    """
+    if limit is not None and limit <= 0:
+        return
+
+    cfg = ptah.get_settings(ptah.CFG_ID_PTAH).snapshot
+    if timeout is None:
+        timeout = cfg.search_timeout / 1000.0 or None
+
+    searchers = list(config.get_cfg_storage(AUTH_SEARCHER_ID).items())
+    if cfg.search_workers and len(searchers) > 1:
+        results = _search_concurrent(
+            term, searchers, cfg.search_workers, timeout)
+    else:
+        results = _search(term, searchers)
+
+    seen = set()
+    count = 0
+    try:
+        for principal in results:
+            uri = principal.__uri__
+            if uri in seen:
+                continue
+            seen.add(uri)
+
+            if offset:
+                offset -= 1
+                continue
+
             yield principal
 
+            count += 1
+            if limit is not None and count >= limit:
+                return
+    finally:
+        results.close()
+
+
+class SearchStats(LatencyStats):
+    """ Principal searcher latency and timeouts counters, `hung` is
+    number of timed out calls that are still running """
+
+    timeouts = 0
+    hung = 0
+
+    def reset(self):
+        super(SearchStats, self).reset()
+        self.timeouts = 0
+
+    def info(self):
+        info = super(SearchStats, self).info()
+        info['timeouts'] = self.timeouts
+        info['hung'] = self.hung
+        return info
+
+
+def get_search_stats(name, registry=None):
+    """ Return :py:class:`SearchStats` of principal searcher `name` """
+    storage = config.get_cfg_storage(AUTH_SEARCHER_STATS_ID, registry)
+    stats = storage.get(name)
+    if stats is None:
+        stats = storage.setdefault(name, SearchStats())
+    return stats
+
+
+def _search(term, searchers):
+    for name, searcher in searchers:
+        start = time.time()
+        try:
+            for principal in searcher(term):
+                yield principal
+        finally:
+            get_search_stats(name).add(time.time() - start)
+
+
+_search_lock = threading.Lock()
+_search_done = object()
+
+
+class _SearchCall(object):
+    """ searcher call running in separate thread """
+
+    def __init__(self, name, searcher, stats):
+        self.name = name
+        self.searcher = searcher
+        self.stats = stats
+        self.started = time.time()
+        self.cancelled = False
+        self.timedout = False
+        self.done = False
+
+
+def _attach(principal):
+    # principals loaded by searcher thread are detached,
+    # merge them into current session
+    state = sqla.inspect(principal, raiseerr=False)
+    if state is None or state.key is None:
+        return principal
+    return ptah.get_session().merge(principal, load=False)
+
+
+def _search_concurrent(term, searchers, workers, timeout):
+    results = queue.Queue()
+    registry = get_current_registry()
+    request = get_current_request()
+
+    def run(call):
+        manager.push({'registry': registry, 'request': request})
+        try:
+            for principal in call.searcher(term):
+                if call.cancelled:
+                    break
+                results.put((call, principal))
+        except Exception:
+            log.exception('Principal searcher "%s" failed', call.name)
+        finally:
+            call.stats.add(time.time() - call.started)
+
+            ptah.get_session().remove()
+            transaction.abort()
+            manager.pop()
+
+            with _search_lock:
+                call.done = True
+                if call.timedout:
+                    call.stats.hung -= 1
+            results.put((call, _search_done))
+
+    # searchers with timed out calls still running are skipped
+    pending = []
+    for name, searcher in searchers:
+        stats = get_search_stats(name, registry)
+        if stats.hung:
+            stats.timeouts += 1
+            log.warning('Principal searcher "%s" is skipped, '
+                        'timed out call is still running', name)
+        else:
+            pending.append((name, searcher, stats))
+    pending.reverse()
+
+    running = set()
+
+    def start():
+        while pending and len(running) < workers:
+            call = _SearchCall(*pending.pop())
+            running.add(call)
+            thread = threading.Thread(
+                target=run, args=(call,),
+                name='ptah-search-%s' % call.name)
+            thread.daemon = True
+            thread.start()
+
+    try:
+        start()
+        while running:
+            wait = None
+            if timeout:
+                wait = min(c.started for c in running) + timeout - time.time()
+
+            try:
+                if wait is not None and wait <= 0:
+                    raise queue.Empty()
+                call, principal = results.get(timeout=wait)
+            except queue.Empty:
+                now = time.time()
+                for call in [c for c in running if c.started+timeout <= now]:
+                    running.discard(call)
+                    with _search_lock:
+                        call.cancelled = True
+                        if not call.done:
+                            call.timedout = True
+                            call.stats.hung += 1
+                    call.stats.timeouts += 1
+                    log.warning(
+                        'Principal searcher "%s" timed out', call.name)
+                start()
+                continue
+
+            if call not in running:
+                continue
+
+            if principal is _search_done:
+                running.discard(call)
+                start()
+            else:
+                yield _attach(principal)
+    finally:
+        for call in running:
+            call.cancelled = True
+
 
 class principal_searcher(object):
     """ Register principal searcher function.
@@ -295,7 +770,8 @@ class principal_searcher(object):
                     config.get_cfg_storage(AUTH_SEARCHER_ID)\
                         .update({name: searcher}),
                 (self.intr['name'], searcher),
-                discriminator=self.discr, introspectables=(self.intr,)),
+                discriminator=self.discr, introspectables=(self.intr,),
+                storage=AUTH_SEARCHER_ID),
             cfg, self.depth)
 
         return searcher
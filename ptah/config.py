@@ -1,11 +1,21 @@
+import os
 import sys
+import copy
+import json
+import time
+import heapq
+import hashlib
+import importlib
 import logging
 import signal
+import threading
 import traceback
+from functools import wraps
+from contextlib import contextmanager
 from collections import defaultdict, namedtuple, OrderedDict
 from pyramid.compat import NativeIO
 from pyramid.registry import Introspectable
-from pyramid.threadlocal import get_current_registry
+from pyramid.threadlocal import get_current_registry, manager
 
 import venusian
 from venusian.advice import getFrameInfo
@@ -13,9 +23,15 @@ from venusian.advice import getFrameInfo
 ATTACH_ATTR = '__ptah_actions__'
 ID_SUBSCRIBER = 'ptah:subscriber'
 
+#: environment variable, enables startup profiler
+PROFILER_ENV = 'PTAH_PROFILE_STARTUP'
+
 __all__ = ('initialize', 'get_cfg_storage', 'StopException',
            'event', 'subscriber', 'shutdown', 'shutdown_handler',
-           'Action', 'DirectiveInfo')
+           'Action', 'DirectiveInfo', 'Profiler', 'enable_profiler',
+           'get_profiler', 'profile', 'profiled', 'ConfigSnapshot',
+           'FrozenStorage', 'freeze', 'prebind', 'DeferredHandler',
+           'get_deferred_queue', 'DeferredObject')
 
 log = logging.getLogger('ptah')
 
@@ -56,25 +72,184 @@ class ObjectEventNotify(object):
 def get_cfg_storage(id, registry=None, default_factory=OrderedDict):
     """ Return current config storage """
     if registry is None:
-        registry = get_current_registry()
+        registry = manager.get()['registry']
 
     try:
-        storage = registry.__ptah_storage__
+        return registry.__ptah_storage__[id]
+    except (AttributeError, KeyError):
+        return _create_cfg_storage(id, registry, default_factory)
+
+
+def _create_cfg_storage(id, registry, default_factory):
+    try:
+        storages = registry.__ptah_storage__
     except AttributeError:
-        storage = defaultdict(lambda: OrderedDict())
-        registry.__ptah_storage__ = storage
+        storages = registry.__dict__.setdefault('__ptah_storage__', {})
 
-    if id not in storage:
-        storage[id] = default_factory()
-    return storage[id]
+    frozen = getattr(registry, '__ptah_frozen__', None)
+    if frozen is not None and default_factory is OrderedDict:
+        storage = FrozenStorage(id, frozen)
+    else:
+        storage = default_factory()
+    return storages.setdefault(id, storage)
 
 
 def pyramid_get_cfg_storage(config, id):
     return get_cfg_storage(id, config.registry)
 
 
-def subscriber(*args):
-    """ Register event subscriber. """
+class FrozenStorage(OrderedDict):
+    """ Cfg storage of frozen configuration, see :py:func:`freeze`.
+    Reads are plain dict reads. Storage is never changed in place,
+    runtime changes are copy-on-write: changes are serialized with
+    registry lock, applied to a copy of current storage and the copy
+    replaces storage in registry. Readers that hold old storage are not
+    affected. Prebound structures that depend on this storage are
+    rebuilt after change. """
+
+    def __init__(self, id, frozen, items=None):
+        super(FrozenStorage, self).__init__()
+        self.id = id
+        self.frozen = frozen
+        if items:
+            for key, value in items.items():
+                OrderedDict.__setitem__(self, key, value)
+
+    def __reduce__(self):
+        return OrderedDict, (list(self.items()),)
+
+    def _current(self):
+        return self.frozen.registry.__ptah_storage__.get(self.id, self)
+
+    def _write(self, change):
+        with self.frozen.lock:
+            storage = FrozenStorage(self.id, self.frozen, self._current())
+            result = change(storage)
+            self.frozen.registry.__ptah_storage__[self.id] = storage
+            self.frozen.changed(self.id)
+            return result
+
+    def __setitem__(self, key, value):
+        self._write(lambda st: OrderedDict.__setitem__(st, key, value))
+
+    def __delitem__(self, key):
+        self._write(lambda st: OrderedDict.__delitem__(st, key))
+
+    def update(self, *args, **kw):
+        def change(storage):
+            for key, value in items.items():
+                OrderedDict.__setitem__(storage, key, value)
+
+        items = OrderedDict(*args, **kw)
+        self._write(change)
+
+    def setdefault(self, key, default=None):
+        with self.frozen.lock:
+            current = self._current()
+            if key in current:
+                return current[key]
+            self[key] = default
+            return default
+
+    def pop(self, key, *default):
+        with self.frozen.lock:
+            if key not in self._current():
+                if default:
+                    return default[0]
+                raise KeyError(key)
+            return self._write(lambda st: OrderedDict.pop(st, key))
+
+    def popitem(self, last=True):
+        return self._write(lambda st: OrderedDict.popitem(st, last))
+
+    def move_to_end(self, key, last=True):
+        self._write(lambda st: OrderedDict.move_to_end(st, key, last))
+
+    def clear(self):
+        self._write(OrderedDict.clear)
+
+
+#: prebound structures, id -> (factory, storages ids)
+_prebound = {}
+
+
+def prebind(id, factory, *storages):
+    """ Register prebound structure. On :py:func:`freeze` structure is
+    built with ``factory(registry)`` and stored as cfg storage `id`,
+    it is rebuilt and replaced every time one of `storages` is changed.
+
+    .. code-block:: python
+
+      config.prebind(
+          'ptah:resolver-table', build_table,
+          'ptah:resolver', 'ptah:resolver-cache')
+
+      table = config.get_cfg_storage('ptah:resolver-table')
+
+    Storage `id` does not exist before configuration is frozen,
+    code that uses prebound structure should fall back to `storages`.
+    """
+    _prebound[id] = (factory, storages)
+
+
+class Frozen(object):
+    """ Frozen configuration state of registry """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.lock = threading.RLock()
+        self.depends = defaultdict(list)
+        for id, (factory, storages) in _prebound.items():
+            for sid in storages:
+                self.depends[sid].append(id)
+
+    def changed(self, id):
+        for pid in self.depends.get(id, ()):
+            self.build(pid)
+
+    def build(self, id):
+        """ Build prebound structure, it replaces previous structure,
+        readers that hold old structure are not affected """
+        factory, storages = _prebound[id]
+        self.registry.__ptah_storage__[id] = factory(self.registry)
+
+
+def freeze(registry=None):
+    """ Freeze configuration after commit. Dict storages are replaced
+    with :py:class:`FrozenStorage` and prebound structures are built,
+    see :py:func:`prebind`. It is called on application creation. """
+    if registry is None:
+        registry = get_current_registry()
+
+    frozen = getattr(registry, '__ptah_frozen__', None)
+    if frozen is None:
+        frozen = Frozen(registry)
+
+    with frozen.lock:
+        storages = registry.__dict__.setdefault('__ptah_storage__', {})
+        for id in frozen.depends:
+            storages.setdefault(id, OrderedDict())
+
+        for id, storage in list(storages.items()):
+            if type(storage) in (OrderedDict, dict):
+                storages[id] = FrozenStorage(id, frozen, storage)
+            elif isinstance(storage, FrozenStorage):
+                storage.frozen = frozen
+
+        registry.__ptah_frozen__ = frozen
+        for id in _prebound:
+            frozen.build(id)
+
+    return frozen
+
+
+def subscriber(*args, deferred=False):
+    """ Register event subscriber.
+
+    With `deferred` flag subscriber is not called during event
+    notification. Event is queued and subscriber is called after
+    successful commit of current transaction, see
+    :py:class:`DeferredHandler`. """
     info = DirectiveInfo(allowed_scope=('module', 'function call'))
 
     def wrapper(func):
@@ -85,9 +260,12 @@ def subscriber(*args):
             ID_SUBSCRIBER, discr, 'Subscriber', 'ptah-subscriber')
         intr['required'] = required
         intr['handler'] = func
+        intr['deferred'] = deferred
         intr['codeinfo'] = info.codeinfo
 
         def _register(cfg, func, required):
+            if deferred:
+                func = DeferredHandler(func)
             cfg.registry.registerHandler(func, required)
 
         info.attach(
@@ -100,12 +278,242 @@ def subscriber(*args):
     return wrapper
 
 
+class DeferredHandler(object):
+    """ Subscriber wrapper, queues event into after commit hook of
+    current transaction. Events are dropped if transaction is aborted.
+    Events of same class for same object uri (``event.uri`` or
+    ``event.object.__uri__``) are coalesced into one call.
+
+    Sqlalchemy instances are not passed to handlers as is, session
+    of committed transaction is closed already. Queue keeps their
+    identity and each handler call runs in its own transaction
+    (``transaction.manager``) with instances loaded by its session,
+    so handler changes are committed as well. Calls of objects that
+    do not exist anymore are skipped. Handlers run in threads pool of
+    ``ptah.event_workers`` size or in new thread, commit does not wait
+    for them.
+
+    Without current transaction (transaction is not begun or is
+    committed already) nothing would dispatch queue, handler is called
+    immediately. """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.__name__ = getattr(handler, '__name__', 'handler')
+        self.__doc__ = getattr(handler, '__doc__', None)
+
+    def __call__(self, *args):
+        queue = get_deferred_queue(True)
+        if queue is None:
+            log.info('No current transaction, deferred event handler '
+                     'is called immediately: %r', self.handler)
+            self.handler(*args)
+        else:
+            queue.add(self.handler, args)
+
+
+_deferred = threading.local()
+
+
+def _current_transaction():
+    """ Return current transaction without starting new one,
+    ``None`` if transaction is not begun """
+    import transaction
+
+    # transaction.get() starts implicit transaction, it may never commit
+    txn_manager = getattr(transaction.manager, 'manager', transaction.manager)
+    return getattr(txn_manager, '_txn', None)
+
+
+def get_deferred_queue(create=False):
+    """ Return deferred events queue of current transaction,
+    ``None`` if queue is not created or transaction is not begun """
+    txn = _current_transaction()
+    queue = getattr(_deferred, 'queue', None)
+    if queue is None or queue.txn is not txn:
+        if not create or txn is None:
+            return None
+        queue = DeferredQueue(txn, manager.get()['registry'])
+        txn.addAfterCommitHook(queue.dispatch)
+        _deferred.queue = queue
+    return queue
+
+
+class DeferredObject(object):
+    """ Identity of sqlalchemy instance in deferred events queue """
+
+    __slots__ = ('cls', 'ident')
+
+    def __init__(self, cls, ident):
+        self.cls = cls
+        self.ident = ident
+
+    def load(self):
+        from ptah import get_session
+        return get_session().query(self.cls).get(self.ident)
+
+
+def _detach(value):
+    from sqlalchemy import inspect
+    from sqlalchemy.orm.state import InstanceState
+
+    state = inspect(value, raiseerr=False)
+    if isinstance(state, InstanceState):
+        if state.key is None:
+            return None
+        return DeferredObject(state.key[0], state.key[1])
+
+    ob = getattr(value, 'object', None)
+    if ob is not None:
+        detached = _detach(ob)
+        if detached is not ob:
+            value = copy.copy(value)
+            value.object = detached
+    return value
+
+
+def _attach(value, loaded):
+    if isinstance(value, DeferredObject):
+        key = (value.cls, value.ident)
+        if key not in loaded:
+            loaded[key] = value.load()
+        return loaded[key]
+
+    ob = getattr(value, 'object', None)
+    if isinstance(ob, DeferredObject):
+        ob = _attach(ob, loaded)
+        if ob is None:
+            return None
+        value = copy.copy(value)
+        value.object = ob
+    return value
+
+
+class DeferredQueue(object):
+    """ Deferred events of transaction """
+
+    future = None
+
+    def __init__(self, txn, registry):
+        self.txn = txn
+        self.registry = registry
+        self.events = []
+        self.keys = set()
+        self.done = threading.Event()
+
+    def __len__(self):
+        return len(self.events)
+
+    def add(self, handler, args):
+        """ Queue handler call, return ``False`` if same event
+        is queued already """
+        event = args[-1] if args else None
+        uri = getattr(event, 'uri', None)
+        if uri is None:
+            uri = getattr(getattr(event, 'object', None), '__uri__', None)
+
+        if uri is not None:
+            key = (handler, event.__class__, uri)
+            if key in self.keys:
+                return False
+            self.keys.add(key)
+
+        self.events.append((handler, args))
+        return True
+
+    def dispatch(self, success):
+        """ After commit hook """
+        if getattr(_deferred, 'queue', None) is self:
+            _deferred.queue = None
+
+        self.txn = None
+        if not success or not self.events:
+            self.done.set()
+            return
+
+        # do not pass sqlalchemy instances to other threads
+        self.events = [(handler, tuple(_detach(arg) for arg in args))
+                       for handler, args in self.events]
+
+        # committed transaction can not be reused,
+        # handlers run with own transaction and session
+        executor = get_event_executor(_event_workers(self.registry))
+        if executor is not None:
+            self.future = executor.submit(self.run)
+        else:
+            thread = threading.Thread(
+                target=self.run, name='ptah-deferred-events')
+            thread.start()
+
+    def wait(self, timeout=None):
+        """ Wait for handlers, return ``False`` on timeout """
+        return self.done.wait(timeout)
+
+    def run(self):
+        import transaction
+
+        manager.push({'registry': self.registry, 'request': None})
+        try:
+            for handler, args in self.events:
+                try:
+                    with transaction.manager:
+                        self.call(handler, args)
+                except Exception:
+                    log.exception('Deferred event handler failed: %r', handler)
+        finally:
+            manager.pop()
+            self.done.set()
+
+    def call(self, handler, args):
+        loaded = {}
+        args = tuple(_attach(arg, loaded) for arg in args)
+        if any(arg is None for arg in args):
+            log.info('Deferred event object does not exist: %r', handler)
+            return
+        handler(*args)
+
+
+def _event_workers(registry):
+    import ptah
+    try:
+        return ptah.get_settings(
+            ptah.CFG_ID_PTAH, registry).snapshot.event_workers
+    except (KeyError, AttributeError):
+        return 0
+
+
+_event_executor = None
+_event_executor_workers = 0
+_event_lock = threading.Lock()
+
+
+def get_event_executor(workers):
+    """ Return deferred events workers pool of `workers` size,
+    ``None`` if `workers` is 0 """
+    global _event_executor, _event_executor_workers
+
+    if _event_executor_workers != workers:
+        with _event_lock:
+            if _event_executor_workers != workers:
+                if _event_executor is not None:
+                    _event_executor.shutdown(False)
+
+                _event_executor = None
+                if workers:
+                    from concurrent.futures import ThreadPoolExecutor
+                    _event_executor = ThreadPoolExecutor(workers)
+                _event_executor_workers = workers
+
+    return _event_executor
+
+
 class Action(object):
 
     hash = None
 
     def __init__(self, callable, args=(), kw={},
-                 discriminator=None, order=0, introspectables=(), info=None):
+                 discriminator=None, order=0, introspectables=(), info=None,
+                 storage=None):
         self.callable = callable
         self.args = args
         self.kw = kw
@@ -114,6 +522,11 @@ class Action(object):
         self.introspectables = introspectables
         self.discriminator = discriminator
 
+        # cfg storages populated by action, see ConfigSnapshot
+        if isinstance(storage, str):
+            storage = (storage,)
+        self.storage = storage
+
     def __hash__(self):
         return hash(self.hash)
 
@@ -124,11 +537,26 @@ class Action(object):
 
     def __call__(self, cfg):
         if self.callable:
+            profiler = _profiler
+            start = time.time()
             try:
                 self.callable(cfg, *self.args, **self.kw)
             except:  # pragma: no cover
                 log.exception(self.discriminator)
                 raise
+            finally:
+                if profiler is not None:
+                    profiler.add_action(self, time.time() - start)
+
+    @property
+    def category(self):
+        """ Discriminator category, used by startup profiler """
+        discr = self.discriminator
+        if isinstance(discr, tuple) and discr:
+            discr = discr[0]
+        if discr is None:
+            return getattr(self.callable, '__name__', repr(self.callable))
+        return str(discr)
 
 
 CodeInfo = namedtuple('Codeinfo', 'filename lineno function source module')
@@ -140,7 +568,12 @@ class AttachData(OrderedDict):
 
 class DirectiveInfo(object):
 
+    #: time spent in frame introspection, if profiler is enabled
+    elapsed = 0.0
+
     def __init__(self, depth=1, moduleLevel=False, allowed_scope=None):
+        start = time.time()
+
         scope, module, f_locals, f_globals, codeinfo = \
             getFrameInfo(sys._getframe(depth + 1))
 
@@ -165,6 +598,9 @@ class DirectiveInfo(object):
         else:
             self.hash = (module.__name__, codeinfo[1])
 
+        if _profiler is not None:
+            self.elapsed = time.time() - start
+
     @property
     def context(self): # pragma: no cover
         if self.scope == 'module':
@@ -174,9 +610,19 @@ class DirectiveInfo(object):
 
     def _runaction(self, action, cfg):
         cfg.__ptah_action__ = action
+
+        snapshot = getattr(cfg.registry, '__ptah_snapshot__', None)
+        if snapshot is not None and action.storage:
+            snapshot.add_source(self.module)
+            if snapshot.skip(action):
+                return
+            snapshot.execute(action)
+
         action(cfg)
 
     def attach(self, action, cfg=None, depth=1):
+        start = time.time()
+
         action.info = self
         if action.hash is None:
             action.hash = self.hash
@@ -208,12 +654,406 @@ class DirectiveInfo(object):
         else:
             venusian.attach(data, callback, category='ptah', depth=depth+1)
 
+        profiler = _profiler
+        if profiler is not None:
+            profiler.add('directive', action.category,
+                         time.time() - start + self.elapsed)
+            self.elapsed = 0.0
+
     def __repr__(self):
         filename, line, function, source, module = self.codeinfo
         return ' File "%s", line %d, in %s\n' \
                '      %s\n' % (filename, line, function, source)
 
 
+class Profiler(object):
+    """ Startup profiler, collects wall time of scanned packages,
+    attached directives, executed actions and startup steps.
+
+    Records are grouped by kind (``scan``, ``directive``, ``action``,
+    ``step``, ``populate``) and name. Directives and actions are named
+    by discriminator category (``ptah:resolver``, ``ptah:type``,
+    ``ptah:settings-group`` ...). """
+
+    #: number of remembered slowest actions
+    slowest_size = 20
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.records = OrderedDict()
+            self.slowest = []
+            self.counter = 0
+
+    def add(self, kind, name, elapsed):
+        with self.lock:
+            rec = self.records.get((kind, name))
+            if rec is None:
+                rec = self.records[(kind, name)] = [0, 0.0, 0.0]
+            rec[0] += 1
+            rec[1] += elapsed
+            if elapsed > rec[2]:
+                rec[2] = elapsed
+
+    def add_action(self, action, elapsed):
+        category = action.category
+        self.add('action', category, elapsed)
+
+        source = ''
+        if action.info is not None and getattr(action.info, 'codeinfo', None):
+            ci = action.info.codeinfo
+            source = '{0}:{1}'.format(ci.module, ci.lineno)
+
+        with self.lock:
+            self.counter += 1
+            item = (elapsed, self.counter, category, source)
+            if len(self.slowest) < self.slowest_size:
+                heapq.heappush(self.slowest, item)
+            else:
+                heapq.heappushpop(self.slowest, item)
+
+    def kinds(self):
+        """ List of recorded kinds """
+        return list(OrderedDict.fromkeys(kind for kind, _ in self.records))
+
+    def report(self, kind=None):
+        """ Return list of records, sorted by total time. Each record is
+        dict with `kind`, `name`, `calls`, `total` and `max` keys. """
+        with self.lock:
+            records = [
+                {'kind': k, 'name': name,
+                 'calls': rec[0], 'total': rec[1], 'max': rec[2]}
+                for (k, name), rec in self.records.items()
+                if kind is None or k == kind]
+
+        return sorted(records, key=lambda rec: rec['total'], reverse=True)
+
+    def summary(self):
+        """ Return total time and number of calls per kind """
+        summary = OrderedDict()
+        for rec in self.report():
+            total = summary.setdefault(
+                rec['kind'], {'calls': 0, 'total': 0.0})
+            total['calls'] += rec['calls']
+            total['total'] += rec['total']
+        return summary
+
+    def slowest_actions(self):
+        """ Slowest executed actions,
+        list of (elapsed, category, source) """
+        with self.lock:
+            return [(elapsed, category, source) for
+                    elapsed, _, category, source in
+                    sorted(self.slowest, reverse=True)]
+
+
+_profiler = None
+
+
+def enable_profiler(enabled=True):
+    """ Enable or disable startup profiler, return profiler.
+    Profiler is also enabled with ``PTAH_PROFILE_STARTUP``
+    environment variable. """
+    global _profiler
+
+    if not enabled:
+        _profiler = None
+    elif _profiler is None:
+        _profiler = Profiler()
+    return _profiler
+
+
+def get_profiler():
+    """ Return startup profiler, ``None`` if profiler is disabled """
+    return _profiler
+
+
+@contextmanager
+def profile(kind, name):
+    """ Record wall time of the block in startup profiler
+
+    .. code-block:: python
+
+      with config.profile('step', 'load data'):
+          ...
+    """
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+
+    start = time.time()
+    try:
+        yield
+    finally:
+        profiler.add(kind, name, time.time() - start)
+
+
+def profiled(kind, name):
+    """ Decorator, record wall time of function calls
+    in startup profiler """
+    def wrapper(func):
+        @wraps(func)
+        def profiled_func(*args, **kw):
+            if _profiler is None:
+                return func(*args, **kw)
+
+            with profile(kind, name):
+                return func(*args, **kw)
+
+        return profiled_func
+    return wrapper
+
+
+def pyramid_scan(cfg, package=None, **kw):
+    """ Pyramid `ptah_scan` directive, same as `cfg.scan` but scan
+    time is recorded in startup profiler """
+    if package is None:
+        package = cfg.package
+    package = cfg.maybe_dotted(package)
+
+    with profile('scan', package.__name__):
+        cfg.scan(package, **kw)
+
+
+if os.environ.get(PROFILER_ENV):  # pragma: no cover
+    enable_profiler()
+
+
+def snapshot_key(settings):
+    """ Hash of installed distributions and application settings """
+    import pkg_resources
+
+    md5 = hashlib.md5()
+    md5.update(str(ConfigSnapshot.version).encode('utf-8'))
+    md5.update(sys.version.encode('utf-8'))
+    for dist in sorted(pkg_resources.working_set, key=lambda d: d.key):
+        md5.update('{0}=={1};'.format(dist.key, dist.version).encode('utf-8'))
+    for name, value in sorted((settings or {}).items()):
+        md5.update('{0}={1!r};'.format(name, value).encode('utf-8'))
+    return md5.hexdigest()
+
+
+class ConfigSnapshot(object):
+    """ Persisted cfg storages of directives for fast startup.
+
+    Actions created with `storage` argument only populate cfg storages,
+    their key is second item of discriminator. After application start
+    references to these storages entries are saved into `path` file with
+    hash of installed distributions and application settings, modification
+    times of modules with these directives are saved as well. Entry is
+    saved as module and attribute name of module level object, functions
+    and classes by their qualified names, plain strings and numbers
+    by value. On next start with same key and unchanged modules entries
+    are looked up in imported modules, so storages contain same objects
+    as modules, and actions with restored keys are not executed.
+
+    Only entries populated by actions are saved, entries added by other
+    code (for example resolvers of sqlalchemy content types) are populated
+    on every start. Entries without action are removed, storages with
+    entries that are not module level objects or can not be found
+    are populated by actions as usual. """
+
+    #: snapshot format version
+    version = 3
+
+    def __init__(self, path, settings=None):
+        self.path = path
+        self.key = snapshot_key(settings)
+        self.restored = {}
+        self.claimed = defaultdict(set)
+        self.executed = set()
+        self.populated = defaultdict(set)
+        self.sources = set()
+        self.modules = set()
+
+    @staticmethod
+    def _stat(filename):
+        st = os.stat(filename)
+        return [st.st_mtime, st.st_size]
+
+    def add_source(self, module):
+        """ Record module of storage action """
+        self.modules.add(module.__name__)
+        filename = getattr(module, '__file__', None)
+        if filename:
+            self.sources.add(filename)
+
+    def outdated_sources(self, sources):
+        """ Check if any of saved modules is changed or removed """
+        for filename, stat in sources.items():
+            try:
+                if self._stat(filename) != stat:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    @staticmethod
+    def lookup(module, name):
+        """ Return module level object by module and qualified name """
+        ob = importlib.import_module(module)
+        for attr in name.split('.'):
+            ob = getattr(ob, attr)
+        return ob
+
+    def reference(self, value, objects):
+        """ Return reference of storage entry, `objects` maps ids of
+        module level objects to module and attribute name """
+        if value is None or type(value) in (str, int, float, bool):
+            return [None, value]
+
+        ref = objects.get(id(value))
+        if ref is not None:
+            return list(ref)
+
+        module = getattr(value, '__module__', None)
+        name = getattr(value, '__qualname__', None)
+        if module and name and '<locals>' not in name:
+            try:
+                if self.lookup(module, name) is value:
+                    return [module, name]
+            except (ImportError, AttributeError):
+                pass
+
+        raise ValueError('Not a module level object: %r' % (value,))
+
+    def load(self, registry):
+        """ Restore cfg storages, return ``True`` if snapshot is valid """
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception:
+            log.warning('Can not load config snapshot: %s', self.path)
+            return False
+
+        if not isinstance(data, dict) or data.get('key') != self.key or \
+                self.outdated_sources(data['sources']):
+            log.info('Config snapshot is outdated: %s', self.path)
+            return False
+
+        for id, refs in data['storages'].items():
+            try:
+                items = dict(
+                    (key, value if module is None
+                     else self.lookup(module, value))
+                    for key, (module, value) in refs.items())
+            except Exception:
+                log.info('Can not restore config storage: %s', id)
+                continue
+            self.restored[id] = items
+            get_cfg_storage(id, registry).update(items)
+
+        return True
+
+    def skip(self, action):
+        """ Check if action storages are restored and contain
+        action key """
+        restored = self.restored
+        if not restored:
+            return False
+
+        discr = action.discriminator
+        if not isinstance(discr, tuple) or len(discr) != 2:
+            return False
+
+        key = discr[1]
+        for id in action.storage:
+            if id not in restored:
+                return False
+        if key not in restored[action.storage[0]]:
+            return False
+
+        for id in action.storage:
+            self.claimed[id].add(key)
+        return True
+
+    def execute(self, action):
+        """ Record storages and key of executed action """
+        self.executed.update(action.storage)
+
+        discr = action.discriminator
+        if isinstance(discr, tuple) and len(discr) == 2:
+            for id in action.storage:
+                self.populated[id].add(discr[1])
+
+    def complete(self, registry):
+        """ Remove entries without actions from restored storages and
+        save new snapshot if restored snapshot is incomplete or outdated """
+        outdated = not self.restored or bool(
+            self.executed.intersection(self.restored))
+
+        for id, items in self.restored.items():
+            storage = get_cfg_storage(id, registry)
+            for key in set(items) - self.claimed[id]:
+                outdated = True
+                storage.pop(key, None)
+
+        if outdated:
+            self.save(registry)
+
+    def save(self, registry):
+        objects = {}
+        for name in self.modules:
+            module = sys.modules.get(name)
+            if module is not None:
+                for attr, ob in vars(module).items():
+                    objects.setdefault(id(ob), (name, attr))
+
+        storages = {}
+        for cfg_id in self.executed.union(self.restored):
+            keys = self.claimed[cfg_id] | self.populated[cfg_id]
+            try:
+                refs = {}
+                for key, value in get_cfg_storage(cfg_id, registry).items():
+                    if key in keys:
+                        if type(key) is not str:
+                            raise ValueError('Not a string key: %r' % (key,))
+                        refs[key] = self.reference(value, objects)
+            except ValueError:
+                log.info('Config storage can not be saved: %s', cfg_id)
+                continue
+            storages[cfg_id] = refs
+
+        sources = {}
+        for filename in self.sources:
+            try:
+                sources[filename] = self._stat(filename)
+            except OSError:
+                pass
+
+        tmp = '{0}.{1}'.format(self.path, os.getpid())
+        try:
+            with open(tmp, 'w') as f:
+                json.dump({'key': self.key, 'sources': sources,
+                           'storages': storages}, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            log.warning('Can not save config snapshot: %s', self.path)
+
+
+def load_snapshot(registry, path):
+    """ Restore config snapshot from `path`, snapshot is saved
+    by :py:func:`save_snapshot` """
+    snapshot = ConfigSnapshot(path, registry.settings)
+    snapshot.load(registry)
+    registry.__ptah_snapshot__ = snapshot
+    return snapshot
+
+
+def save_snapshot(registry):
+    """ Complete and save config snapshot after application start """
+    snapshot = getattr(registry, '__ptah_snapshot__', None)
+    if snapshot is not None:
+        snapshot.complete(registry)
+        registry.__ptah_snapshot__ = None
+
+
 handlers = []
 _handler_int = signal.getsignal(signal.SIGINT)
 _handler_term = signal.getsignal(signal.SIGTERM)
@@ -66,7 +66,10 @@ class AuthProvider(object):
 
     def authenticate(self, credentials):
         """ Authenticate credentials,
-        return :py:class:`ptah.interfaces.Principal` object or None """
+        return :py:class:`ptah.interfaces.Principal` object or None.
+        Return :py:data:`ptah.authentication.UNKNOWN_LOGIN` if login
+        does not exist, logins unknown to all providers are remembered
+        in unknown logins cache. """
 
     def get_principal_bylogin(self, login):
         """ return instance of :py:class:`ptah.interfaces.Principal` or None """
@@ -104,7 +104,8 @@ class PtahAccessManager(object):
 
 
 def check_access(userid, request):
-    manager = ptah.get_settings(ptah.CFG_ID_PTAH).get('access_manager')
+    manager = getattr(
+        ptah.get_settings(ptah.CFG_ID_PTAH).snapshot, 'access_manager', None)
     if manager is not None:
         return manager(userid, request)
     return False
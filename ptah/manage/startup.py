@@ -0,0 +1,42 @@
+""" startup profile module """
+import ptah.renderer
+from pyramid.view import view_config
+
+import ptah
+from ptah import config
+
+
+@ptah.manage.module('startup')
+class StartupModule(ptah.manage.PtahModule):
+    __doc__ = ('Startup profile, time spent in scans, directives, '
+               'actions and startup steps.')
+
+    title = 'Startup profile'
+
+    def available(self):
+        return config.get_profiler() is not None
+
+
+@view_config(
+    context=StartupModule,
+    renderer=ptah.renderer.layout('ptah-manage:startup.lt', 'ptah-manage'))
+
+class StartupView(ptah.View):
+    """ Startup profile view """
+
+    #: number of records for each kind
+    limit = 50
+
+    def update(self):
+        profiler = config.get_profiler()
+
+        self.kinds = []
+        self.slowest = ()
+        if profiler is None:
+            return
+
+        for kind, total in profiler.summary().items():
+            self.kinds.append(
+                (kind, total, profiler.report(kind)[:self.limit]))
+
+        self.slowest = profiler.slowest_actions()
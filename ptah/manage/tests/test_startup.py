@@ -0,0 +1,56 @@
+import ptah
+from ptah import config
+from ptah.testing import PtahTestCase
+from pyramid.view import render_view_to_response
+
+
+class TestStartupModule(PtahTestCase):
+
+    def tearDown(self):
+        config.enable_profiler(False)
+        super(TestStartupModule, self).tearDown()
+
+    def test_startup_module(self):
+        from ptah.manage.manage import PtahManageRoute
+        from ptah.manage.startup import StartupModule
+
+        request = self.make_request()
+
+        ptah.auth_service.set_userid('test')
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH, self.registry)
+        cfg['managers'] = ('*',)
+
+        mr = PtahManageRoute(request)
+        mod = mr['startup']
+
+        self.assertIsInstance(mod, StartupModule)
+        self.assertFalse(mod.available())
+
+        config.enable_profiler()
+        self.assertTrue(mod.available())
+
+    def test_view_disabled(self):
+        from ptah.manage.startup import StartupModule
+
+        request = self.make_request()
+        mod = StartupModule(None, request)
+
+        res = render_view_to_response(mod, request)
+        self.assertIn('Startup profiler is disabled', res.text)
+
+    def test_view(self):
+        from ptah.manage.startup import StartupModule
+
+        profiler = config.enable_profiler()
+        profiler.add('scan', 'test.package', 0.5)
+        profiler.add_action(
+            config.Action(None, discriminator=('test:action',)), 0.25)
+
+        request = self.make_request()
+        mod = StartupModule(None, request)
+
+        res = render_view_to_response(mod, request)
+        self.assertIn('test.package', res.text)
+        self.assertIn('0.5000', res.text)
+        self.assertIn('test:action', res.text)
+        self.assertIn('Slowest actions', res.text)
@@ -35,3 +35,30 @@ class TestUriView(PtahTestCase):
 
         self.assertEqual(view.data[0]['name'],
                          'ptah.authentication.superuser_resolver')
+
+    def test_uri_cache_stats(self):
+        import ptah
+        from ptah.manage.uri import UriResolver
+
+        class Ob(object):
+            pass
+
+        def resolver(uri):
+            return Ob()
+
+        self.config.ptah_uri_resolver('test', resolver, cache='request')
+
+        ptah.resolve('test:1')
+        ptah.resolve('test:1')
+
+        request = DummyRequest(GET = {'uri': 'test:1'})
+
+        view = UriResolver(None, request)
+        view.update()
+
+        self.assertEqual(view.cached_schemas, [('test', 'request')])
+
+        stats = dict(view.cache_stats)
+        self.assertEqual(stats['request']['size'], 1)
+        self.assertGreaterEqual(stats['request']['hits'], 1)
+        self.assertIn('misses', stats['process'])
@@ -6,7 +6,9 @@ from pyramid.view import view_config
 
 import ptah
 from ptah import config
-from ptah.uri import ID_RESOLVER
+from ptah.uri import ID_RESOLVER, ID_RESOLVER_CACHE
+from ptah.uri import get_request_cache, get_process_cache
+from ptah.uri import request_cache_stats
 from ptah.manage.manage import PtahManageRoute
 
 
@@ -41,6 +43,15 @@ class UriResolver(ptah.form.Form):
 
         resolvers = config.get_cfg_storage(ID_RESOLVER)
 
+        self.cached_schemas = sorted(
+            config.get_cfg_storage(ID_RESOLVER_CACHE).items())
+
+        request_stats = request_cache_stats.info()
+        request_stats['size'] = len(get_request_cache())
+        self.cache_stats = (
+            ('request', request_stats),
+            ('process', get_process_cache().info()))
+
         self.data = data = []
         for u in uri:
             if u:
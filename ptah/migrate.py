@@ -207,7 +207,8 @@ def register_migration(pkg, path, title='', force=False):
     info.attach(
         config.Action(
             _complete, (pkg, path),
-            discriminator=discr, introspectables=(intr,))
+            discriminator=discr, introspectables=(intr,),
+            storage=MIGRATION_ID)
         )
 
 
@@ -235,6 +236,7 @@ def update_versions(registry):
                 break
 
 
+@config.profiled('step', 'check_version')
 def check_version(ev):
     """ ApplicationCreated event handler """
     if not Version.__table__.exists():
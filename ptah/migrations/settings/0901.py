@@ -0,0 +1,32 @@
+"""Ptah settings versions
+
+Revision ID: 0901
+Revises: None
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '0901'
+down_revision = None
+
+import ptah
+import sqlalchemy as sqla
+from alembic import op
+from sqlalchemy.engine import reflection
+
+
+def upgrade():
+    # it possible that this script is being called on new database
+    # in this case table is already created
+    insp = reflection.Inspector.from_engine(ptah.get_base().metadata.bind)
+
+    if 'ptah_settings_versions' not in insp.get_table_names():
+        op.create_table(
+            'ptah_settings_versions',
+            sqla.Column('name', sqla.String(128), primary_key=True),
+            sqla.Column('version', sqla.Integer))
+
+
+def downgrade():
+    op.drop_table('ptah_settings_versions')
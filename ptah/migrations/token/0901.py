@@ -0,0 +1,42 @@
+"""Ptah token storage indexes
+
+Revision ID: 0901
+Revises: None
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '0901'
+down_revision = None
+
+import ptah
+from alembic import op
+from sqlalchemy.engine import reflection
+
+INDEXES = (
+    ('ix_ptah_tokens_token', ['token'], {}),
+    ('ix_ptah_tokens_valid', ['valid'], {}),
+    ('ix_ptah_tokens_type_data', ['type', 'data'],
+     {'mysql_length': {'data': 255}}),
+)
+
+
+def upgrade():
+    # it possible that this script is being called on new database
+    # in this case indexes are created with table
+    insp = reflection.Inspector.from_engine(ptah.get_base().metadata.bind)
+
+    if 'ptah_tokens' not in insp.get_table_names():
+        return
+
+    existing = set(ix['name'] for ix in insp.get_indexes('ptah_tokens'))
+
+    for name, columns, kw in INDEXES:
+        if name not in existing:
+            op.create_index(name, 'ptah_tokens', columns, **kw)
+
+
+def downgrade():
+    for name, columns, kw in INDEXES:
+        op.drop_index(name, 'ptah_tokens')
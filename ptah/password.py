@@ -1,4 +1,8 @@
 """ password tool """
+import hmac
+import time
+import hashlib
+import threading
 import ptah.form
 import translationstring
 from os import urandom
@@ -6,7 +10,8 @@ from datetime import timedelta
 from codecs import getencoder
 from hashlib import sha1
 from base64 import urlsafe_b64encode, urlsafe_b64decode
-from pyramid.compat import bytes_
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from pyramid.compat import bytes_, string_types
 
 import ptah
 from ptah import config, token
@@ -36,6 +41,7 @@ class PlainPasswordManager(object):
 class SSHAPasswordManager(object):
     """SSHA password manager."""
 
+    prefix = '{ssha}'
     _encoder = getencoder("utf-8")
 
     def encode(self, password, salt=None):
@@ -54,27 +60,208 @@ class SSHAPasswordManager(object):
         salt = byte_string[20:]
         return encoded_password == self.encode(password, salt)
 
+    def needs_rehash(self, encoded):
+        return False
+
+
+class PBKDF2PasswordManager(object):
+    """PBKDF2-HMAC password manager. Number of iterations is
+    configured with ``ptah.pwd_pbkdf2_iterations`` setting."""
+
+    prefix = '{pbkdf2}'
+    slow = True
+
+    def __init__(self, iterations=260000, digest='sha256'):
+        self.iterations = iterations
+        self.digest = digest
+
+    def configure(self, cfg):
+        if cfg.pwd_pbkdf2_iterations == self.iterations:
+            return self
+        return self.__class__(cfg.pwd_pbkdf2_iterations, self.digest)
+
+    def _hash(self, password, salt, digest, iterations):
+        return urlsafe_b64encode(hashlib.pbkdf2_hmac(
+            digest, password.encode('utf-8'), salt, iterations)).decode()
+
+    def encode(self, password, salt=None):
+        if salt is None:
+            salt = urandom(16)
+        return '%s%s$%s$%s$%s' % (
+            self.prefix, self.digest, self.iterations,
+            urlsafe_b64encode(salt).decode(),
+            self._hash(password, salt, self.digest, self.iterations))
+
+    def _parse(self, encoded):
+        digest, iterations, salt, hash = \
+            encoded[len(self.prefix):].split('$')
+        return digest, int(iterations), urlsafe_b64decode(salt), hash
+
+    def check(self, encoded, password):
+        try:
+            digest, iterations, salt, hash = self._parse(encoded)
+        except ValueError:
+            return False
+        return hmac.compare_digest(
+            hash, self._hash(password, salt, digest, iterations))
+
+    def needs_rehash(self, encoded):
+        try:
+            digest, iterations, salt, hash = self._parse(encoded)
+        except ValueError:
+            return True
+        return (digest, iterations) != (self.digest, self.iterations)
+
+
+class ScryptPasswordManager(object):
+    """scrypt password manager. Cost parameters are configured with
+    ``ptah.pwd_scrypt_n``, ``ptah.pwd_scrypt_r`` and ``ptah.pwd_scrypt_p``
+    settings."""
+
+    prefix = '{scrypt}'
+    slow = True
+
+    def __init__(self, n=16384, r=8, p=1):
+        self.n = n
+        self.r = r
+        self.p = p
+
+    def configure(self, cfg):
+        params = (cfg.pwd_scrypt_n, cfg.pwd_scrypt_r, cfg.pwd_scrypt_p)
+        if params == (self.n, self.r, self.p):
+            return self
+        return self.__class__(*params)
+
+    def _hash(self, password, salt, n, r, p):
+        return urlsafe_b64encode(hashlib.scrypt(
+            password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+            maxmem=256 * n * r * p, dklen=32)).decode()
+
+    def encode(self, password, salt=None):
+        if salt is None:
+            salt = urandom(16)
+        return '%s%s$%s$%s$%s$%s' % (
+            self.prefix, self.n, self.r, self.p,
+            urlsafe_b64encode(salt).decode(),
+            self._hash(password, salt, self.n, self.r, self.p))
+
+    def _parse(self, encoded):
+        n, r, p, salt, hash = encoded[len(self.prefix):].split('$')
+        return int(n), int(r), int(p), urlsafe_b64decode(salt), hash
+
+    def check(self, encoded, password):
+        try:
+            n, r, p, salt, hash = self._parse(encoded)
+        except ValueError:
+            return False
+        return hmac.compare_digest(hash, self._hash(password, salt, n, r, p))
+
+    def needs_rehash(self, encoded):
+        try:
+            n, r, p, salt, hash = self._parse(encoded)
+        except ValueError:
+            return True
+        return (n, r, p) != (self.n, self.r, self.p)
+
+
+def calibrate(manager, target=0.25):
+    """ Return password manager configured for hashing time close
+    to `target` seconds on current machine. `manager` is ``pbkdf2``
+    or ``scrypt`` """
+    def measure(pm):
+        start = time.time()
+        pm.encode('calibration password')
+        return time.time() - start
+
+    if manager == 'pbkdf2':
+        pm = PBKDF2PasswordManager(10000)
+        for i in range(3):
+            pm = PBKDF2PasswordManager(
+                max(1000, int(pm.iterations * target / measure(pm))))
+        return pm
+
+    elif manager == 'scrypt':
+        pm = ScryptPasswordManager(1024)
+        while measure(pm) < target and pm.n < 2 ** 20:
+            pm = ScryptPasswordManager(pm.n * 2, pm.r, pm.p)
+        return pm
+
+    raise ValueError('Unknown password manager: %s' % manager)
+
 
 class PasswordTool(object):
     """ Password management utility. """
 
     pm = {'{plain}': PlainPasswordManager(),
           '{ssha}': SSHAPasswordManager(),
+          '{pbkdf2}': PBKDF2PasswordManager(),
           }
 
+    if hasattr(hashlib, 'scrypt'): # pragma: no branch
+        pm['{scrypt}'] = ScryptPasswordManager()
+
+    #: hashing workers pool, created on first use
+    executor = None
+    executor_params = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
     @property
     def manager(self):
-        PWD_CONFIG = ptah.get_settings(ptah.CFG_ID_PTAH)
+        PWD_CONFIG = ptah.get_settings(ptah.CFG_ID_PTAH).snapshot
         try:
-            return self.pm['{%s}' % PWD_CONFIG['pwd_manager']]
+            manager = self.pm['{%s}' % PWD_CONFIG.pwd_manager]
         except KeyError:
             return self.pm['{plain}']
 
-    def check(self, encoded, password):
-        """ Compare encoded password with plain password.
+        configure = getattr(manager, 'configure', None)
+        if configure is not None:
+            manager = configure(PWD_CONFIG)
+        return manager
+
+    def get_executor(self):
+        """ Return hashing workers pool, ``ptah.pwd_workers`` setting
+        defines pool size, ``ptah.pwd_pool`` pool type """
+        PWD_CONFIG = ptah.get_settings(ptah.CFG_ID_PTAH).snapshot
+        params = (PWD_CONFIG.pwd_workers, PWD_CONFIG.pwd_pool)
+        if not params[0]:
+            return None
+
+        if self.executor_params != params:
+            with self.lock:
+                if self.executor_params != params:
+                    if self.executor is not None:
+                        self.executor.shutdown(False)
+
+                    factory = (ProcessPoolExecutor
+                               if params[1] == 'process'
+                               else ThreadPoolExecutor)
+                    self.executor = factory(params[0])
+                    self.executor_params = params
+
+        return self.executor
+
+    def run(self, manager, method, *args):
+        """ Call `method` of password `manager`, slow password managers
+        are executed in workers pool """
+        if getattr(manager, 'slow', False):
+            executor = self.get_executor()
+            if executor is not None:
+                return executor.submit(
+                    getattr(manager, method), *args).result()
+
+        return getattr(manager, method)(*args)
+
+    def check(self, encoded, password, principal=None):
+        """ Compare encoded password with plain password. If `principal`
+        is given and password is encoded with outdated password manager
+        or parameters, password is reencoded with current password manager
+        and stored with :py:class:`ptah.password_changer`.
 
         :param encoded: Encoded password
         :param password: Plain password
+        :param principal: Principal object
         """
         try:
             pm, pwd = encoded.split('}', 1)
@@ -83,12 +270,54 @@ class PasswordTool(object):
 
         manager = self.pm.get('%s}' % pm)
         if manager is not None:
-            return manager.check(encoded, password)
+            if self.run(manager, 'check', encoded, password):
+                if principal is not None:
+                    self.rehash(principal, password, encoded)
+                return True
         return False
 
+    def rehash(self, principal, password, encoded=None):
+        """ Reencode password of authenticated principal with current
+        password manager if it is encoded with outdated password manager
+        or parameters. New password is stored with
+        :py:class:`ptah.password_changer`. Return True if password
+        has been changed.
+
+        :param principal: Principal object
+        :param password: Plain password, already verified
+        :param encoded: Encoded password, by default ``principal.password``
+        """
+        if encoded is None:
+            encoded = getattr(principal, 'password', None)
+        if not isinstance(encoded, string_types) or \
+                encoded.split('}', 1)[0] + '}' not in self.pm or \
+                not self.needs_rehash(encoded):
+            return False
+
+        changer = config.get_cfg_storage(ID_PASSWORD_CHANGER).get(
+            ptah.extract_uri_schema(principal.__uri__))
+        if changer is None:
+            return False
+
+        changer(principal, self.encode(password))
+        return True
+
+    def needs_rehash(self, encoded):
+        """ Check if password is encoded with outdated password manager
+        or parameters. Passwords are never reencoded with
+        ``plain`` password manager. """
+        manager = self.manager
+        prefix = getattr(manager, 'prefix', None)
+        if prefix is None:
+            return False
+
+        if not encoded.startswith(prefix):
+            return True
+        return manager.needs_rehash(encoded)
+
     def encode(self, password, salt=None):
         """ Encode password with current password manager """
-        return self.manager.encode(password, salt)
+        return self.run(self.manager, 'encode', password, salt)
 
     def can_change_password(self, principal):
         """ Can principal password be changed.
@@ -138,17 +367,17 @@ class PasswordTool(object):
 
     def validate(self, password):
         """ Validate password """
-        PWD_CONFIG = ptah.get_settings(ptah.CFG_ID_PTAH)
+        PWD_CONFIG = ptah.get_settings(ptah.CFG_ID_PTAH).snapshot
 
-        if len(password) < PWD_CONFIG['pwd_min_length']:
+        if len(password) < PWD_CONFIG.pwd_min_length:
             #return _('Password should be at least ${count} characters.',
             #         mapping={'count': self.min_length})
             return 'Password should be at least %s characters.' % \
-                PWD_CONFIG['pwd_min_length']
-        elif PWD_CONFIG['pwd_letters_digits'] and \
+                PWD_CONFIG.pwd_min_length
+        elif PWD_CONFIG.pwd_letters_digits and \
                 (password.isalpha() or password.isdigit()):
             return _('Password should contain both letters and digits.')
-        elif PWD_CONFIG['pwd_letters_mixed_case'] and \
+        elif PWD_CONFIG.pwd_letters_mixed_case and \
                 (password.isupper() or password.islower()):
             return _('Password should contain letters in mixed case.')
 
@@ -186,7 +415,8 @@ class password_changer(object):
                     config.get_cfg_storage(ID_PASSWORD_CHANGER).update(
                             {schema: changer}),
                 (self.intr['schema'], changer),
-                discriminator=self.discr, introspectables=(self.intr,)),
+                discriminator=self.discr, introspectables=(self.intr,),
+                storage=ID_PASSWORD_CHANGER),
             cfg)
         return changer
 
@@ -1,13 +1,11 @@
 """ populate data """
 import logging
 import transaction
-from pyramid.request import Request
 from pyramid.interfaces import IRequestFactory
 from pyramid.threadlocal import manager as threadlocal_manager
 
 import ptah
 from ptah import config
-from ptah.migrate import update_versions
 
 POPULATE_ID = 'ptah:populate-step'
 POPULATE_DB_SCHEMA = 'ptah-db-schema'
@@ -129,6 +127,7 @@ class Populate(object):
     def execute(self, p_steps=None, request=None):
         registry = self.registry
         if request is None:
+            from pyramid.request import Request
             request_factory = registry.queryUtility(
                 IRequestFactory, default=Request)
             request = request_factory.blank('/')
@@ -143,7 +142,8 @@ class Populate(object):
 
         for step in steps:
             log.info('Executing populate step: %s', step['name'])
-            step['factory'](registry)
+            with config.profile('populate', step['name']):
+                step['factory'](registry)
 
         transaction.commit()
         threadlocal_manager.pop()
@@ -171,4 +171,5 @@ def create_db_schema(registry, update=True):
 
     # update db versions
     if update:
+        from ptah.migrate import update_versions
         update_versions(registry)
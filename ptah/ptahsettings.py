@@ -1,6 +1,7 @@
 """ ptah settings """
 import pytz
 import logging
+import threading
 import sqlalchemy
 import translationstring
 import ptah.form
@@ -9,6 +10,7 @@ from pyramid.events import ApplicationCreated
 from pyramid_mailer.interfaces import IMailer
 
 import ptah
+from ptah import util
 from ptah import settings
 
 _ = translationstring.TranslationStringFactory('ptah')
@@ -33,6 +35,42 @@ ptah.register_settings(
         default = '',
         tint = True),
 
+    ptah.form.IntegerField(
+        'auth_negative_cache_ttl',
+        title = _('Unknown logins cache ttl'),
+        description = _('Remember logins unknown to all auth providers '
+                        'for ttl seconds, 0 - disabled.'),
+        default = 0),
+
+    ptah.form.IntegerField(
+        'principal_cache_ttl',
+        title = _('Principals cache ttl'),
+        description = _('Cache resolved principals in process wide cache '
+                        'for ttl seconds, 0 - disabled.'),
+        default = 0),
+
+    ptah.form.IntegerField(
+        'principal_cache_size',
+        title = _('Principals cache size'),
+        description = _('Maximum number of principals in process wide '
+                        'cache.'),
+        default = 10000),
+
+    ptah.form.IntegerField(
+        'search_workers',
+        title = _('Principal searchers workers'),
+        description = _('Maximum number of principal searchers running '
+                        'concurrently in threads, 0 - sequentially.'),
+        default = 0),
+
+    ptah.form.IntegerField(
+        'search_timeout',
+        title = _('Principal searchers timeout'),
+        description = _('Ignore concurrent principal searchers that do not '
+                        'finish in time after start, in milliseconds, '
+                        '0 - no timeout.'),
+        default = 0),
+
     ptah.form.TextField(
         'hashalg',
         title = _('Authentication policy hash algorithm'),
@@ -90,11 +128,50 @@ ptah.register_settings(
         'pwd_manager',
         title = 'Password manager',
         description = 'Available password managers '\
-            '("plain", "ssha", "bcrypt")',
+            '("plain", "ssha", "pbkdf2", "scrypt")',
         vocabulary = ptah.form.Vocabulary(
-            "plain", "ssha",),
+            "plain", "ssha", "pbkdf2", "scrypt"),
         default = 'plain'),
 
+    ptah.form.IntegerField(
+        'pwd_pbkdf2_iterations',
+        title = 'PBKDF2 iterations',
+        description = 'Number of PBKDF2 iterations, '\
+                      'use "ptah-password --calibrate".',
+        default = 260000),
+
+    ptah.form.IntegerField(
+        'pwd_scrypt_n',
+        title = 'scrypt cost',
+        description = 'scrypt CPU/memory cost (power of 2), '\
+                      'use "ptah-password --calibrate".',
+        default = 16384),
+
+    ptah.form.IntegerField(
+        'pwd_scrypt_r',
+        title = 'scrypt block size',
+        default = 8),
+
+    ptah.form.IntegerField(
+        'pwd_scrypt_p',
+        title = 'scrypt parallelization',
+        default = 1),
+
+    ptah.form.IntegerField(
+        'pwd_workers',
+        title = 'Password hashing workers',
+        description = 'Number of password hashing workers, '\
+                      '0 - passwords are hashed in request thread.',
+        default = 0),
+
+    ptah.form.ChoiceField(
+        'pwd_pool',
+        title = 'Password hashing pool',
+        description = 'Password hashing workers pool type '\
+                      '("thread", "process")',
+        vocabulary = ptah.form.Vocabulary("thread", "process"),
+        default = 'thread'),
+
     ptah.form.IntegerField(
         'pwd_min_length',
         title = 'Length',
@@ -125,6 +202,92 @@ ptah.register_settings(
         description = 'List of default assigned roles for all principals.',
         default = ()),
 
+    ptah.form.BoolField(
+        'permission_cache',
+        title = 'Permission cache',
+        description = 'Cache permission checks results during request.',
+        default = False),
+
+    ptah.form.BoolField(
+        'local_roles_cache',
+        title = 'Local roles cache',
+        description = 'Cache principals and local roles during request.',
+        default = False),
+
+    ptah.form.IntegerField(
+        'resolver_cache_size',
+        title = 'Resolver cache size',
+        description = 'Maximum number of objects in process wide '\
+                      'uri resolver cache.',
+        default = 1000),
+
+    ptah.form.IntegerField(
+        'resolver_cache_ttl',
+        title = 'Resolver cache ttl',
+        description = 'Time to live of objects in process wide '\
+                      'uri resolver cache, in seconds. 0 - no limit.',
+        default = 0),
+
+    ptah.form.IntegerField(
+        'token_sweep_interval',
+        title = 'Token sweep interval',
+        description = 'Remove batch of expired tokens after token '\
+                      'generation at most once per interval, in seconds. '\
+                      '0 - disabled, use ptah-tokens script.',
+        default = 0),
+
+    ptah.form.IntegerField(
+        'token_sweep_batch',
+        title = 'Token sweep batch size',
+        description = 'Maximum number of expired tokens removed '\
+                      'by periodic sweep.',
+        default = 1000),
+
+    ptah.form.TextField(
+        'json_codec',
+        title = 'JSON codec',
+        description = 'JSON codec ("auto", "orjson", "ujson", '\
+                      '"simplejson", "json"), "auto" selects simplejson '\
+                      'or json, orjson and ujson write non-ASCII '\
+                      'characters as is.',
+        default = 'auto'),
+
+    ptah.form.IntegerField(
+        'settings_poll_interval',
+        title = 'Settings poll interval',
+        description = 'Check settings versions in database at most once '\
+                      'per interval and reload changed groups, '\
+                      'in seconds. 0 - disabled.',
+        default = 0),
+
+    ptah.form.IntegerField(
+        'event_workers',
+        title = 'Deferred events workers',
+        description = 'Dispatch deferred events in threads pool of given '\
+                      'size, 0 - new thread for each transaction.',
+        default = 0),
+
+    ptah.form.IntegerField(
+        'rst_cache_size',
+        title = 'ReST cache size',
+        description = 'Maximum number of rendered ReST texts in process '\
+                      'wide cache, 0 - disabled.',
+        default = 1000),
+
+    ptah.form.IntegerField(
+        'rst_workers',
+        title = 'ReST rendering workers',
+        description = 'Render ReST texts in processes pool of given size, '\
+                      '0 - in request thread.',
+        default = 0),
+
+    ptah.form.BoolField(
+        'rst_warmup',
+        title = 'ReST cache warmup',
+        description = 'Render introspectables docstrings in background '\
+                      'thread after application start.',
+        default = False),
+
     title = _('Ptah settings'),
 )
 
@@ -150,6 +313,13 @@ class DummyMailer(object):
 def initialized(ev):
     PTAH = ptah.get_settings(ptah.CFG_ID_PTAH, ev.registry)
 
+    # json codec
+    try:
+        util.set_json_codec(PTAH['json_codec'] or 'auto')
+    except KeyError:
+        log.warning('JSON codec "%s" is not available.', PTAH['json_codec'])
+        util.set_json_codec()
+
     # mail
     if PTAH.get('mailer') is None:
         PTAH['mailer'] = DummyMailer()
@@ -204,3 +374,25 @@ def initialize_sql(cfg, prefix='sqlalchemy.'):
 @ptah.subscriber(ApplicationCreated)
 def starting(ev):
     settings.load_dbsettings()
+
+
+@ptah.subscriber(ApplicationCreated)
+def save_config_snapshot(ev):
+    ptah.config.save_snapshot(ev.app.registry)
+
+
+@ptah.subscriber(ApplicationCreated)
+def freeze_config(ev):
+    ptah.config.freeze(ev.app.registry)
+
+
+@ptah.subscriber(ApplicationCreated)
+def rst_warmup(ev):
+    registry = ev.app.registry
+    if ptah.get_settings(ptah.CFG_ID_PTAH, registry).snapshot.rst_warmup:
+        from ptah import rst
+        thread = threading.Thread(
+            target=rst.warmup, args=(registry,), name='ptah-rst-warmup')
+        thread.daemon = True
+        thread.start()
+        return thread
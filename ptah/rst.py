@@ -1,32 +1,79 @@
 import os.path
+import inspect
+import hashlib
 import logging
 import tempfile
 import threading
+from concurrent.futures import ProcessPoolExecutor
 from pyramid.compat import text_type, bytes_
 
-try:
-    from docutils import io
-    from docutils.core import Publisher
+from ptah.uri import ResolverCache
 
-    from sphinx.application import Sphinx
-    from sphinx.writers.html import HTMLWriter, HTMLTranslator
+log = logging.getLogger('ptah.rst')
+local_data = threading.local()
 
-    has_sphinx = True
-    tempdir = tempfile.mkdtemp()
-    tmp = open(os.path.join(tempdir, 'conf.py'), 'wb')
-    tmp.write(bytes_('# -*- coding: utf-8 -*-'))
-    tmp.close()
-except ImportError: # pragma: no cover
-    has_sphinx = False
+#: rendered html cache, key is hash of rst source
+cache = ResolverCache(1000)
 
+#: rendering workers pool, created on first use
+executor = None
+executor_workers = 0
 
-log = logging.getLogger('ptah.rst')
-local_data = threading.local()
+#: sphinx availability, ``None`` until first :py:func:`rst_to_html` call
+has_sphinx = None
+
+#: sphinx configuration directory
+tempdir = None
+
+CustomHTMLTranslator = None
+
+_init_lock = threading.Lock()
+
+
+def init_sphinx():
+    """ Import sphinx and create sphinx configuration directory,
+    it is called on first use. Return ``False`` if sphinx
+    is not available. """
+    global has_sphinx, tempdir, CustomHTMLTranslator
+
+    if has_sphinx is not None:
+        return has_sphinx
+
+    with _init_lock:
+        if has_sphinx is None:
+            try:
+                from sphinx.writers.html import HTMLTranslator
+            except ImportError: # pragma: no cover
+                has_sphinx = False
+                return has_sphinx
+
+            class Translator(HTMLTranslator):
+
+                def visit_pending_xref(self, node):
+                    pass
+
+                def depart_pending_xref(self, node):
+                    pass
+
+            CustomHTMLTranslator = Translator
+
+            tempdir = tempfile.mkdtemp()
+            with open(os.path.join(tempdir, 'conf.py'), 'wb') as tmp:
+                tmp.write(bytes_('# -*- coding: utf-8 -*-'))
+
+            has_sphinx = True
+
+    return has_sphinx
 
 
 def get_sphinx():
     sphinx = getattr(local_data, 'sphinx', None)
     if sphinx is None:
+        from docutils import io
+        from docutils.core import Publisher
+        from sphinx.application import Sphinx
+        from sphinx.writers.html import HTMLWriter
+
         sphinx = Sphinx(tempdir, tempdir, tempdir,
                         tempdir, 'json', status=None, warning=None)
         sphinx.builder.translator_class = CustomHTMLTranslator
@@ -51,13 +98,74 @@ def get_sphinx():
     return sphinx, sphinx.publisher
 
 
+def _config(registry=None):
+    import ptah
+    try:
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH, registry).snapshot
+        return cfg.rst_cache_size, cfg.rst_workers
+    except (KeyError, AttributeError):
+        return cache.maxsize, 0
+
+
+def _key(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def get_executor(workers):
+    """ Return rendering processes pool of `workers` size,
+    ``None`` if `workers` is 0 """
+    global executor, executor_workers
+
+    if executor_workers != workers:
+        with _init_lock:
+            if executor_workers != workers:
+                if executor is not None:
+                    executor.shutdown(False)
+
+                executor = ProcessPoolExecutor(workers) if workers else None
+                executor_workers = workers
+
+    return executor
+
+
 def rst_to_html(text):
+    """ Convert ReST text to html. Results are cached by hash of
+    text in LRU cache of ``ptah.rst_cache_size`` size, with
+    ``ptah.rst_workers`` setting text is converted in processes pool. """
     if not isinstance(text, text_type):
         text = text_type(text)
 
-    if not has_sphinx: # pragma: no cover
+    size, workers = _config()
+    if not size:
+        return _render_pool(text, workers)
+
+    cache.maxsize = size
+    key = _key(text)
+    html = cache.get(key)
+    if html is None:
+        html = _render_pool(text, workers)
+        cache.set(key, html)
+    return html
+
+
+def _render_pool(text, workers):
+    pool = get_executor(workers)
+    if pool is not None:
+        try:
+            return pool.submit(render, text).result()
+        except Exception:
+            log.exception('ReST rendering process failed')
+
+    return render(text)
+
+
+def render(text):
+    """ Convert ReST text to html without cache """
+    if not init_sphinx(): # pragma: no cover
         return '<pre>%s</pre>' % text if text else ''
 
+    from docutils import io
+
     sphinx, pub = get_sphinx()
 
     pub.set_source(text, None)
@@ -81,11 +189,51 @@ def rst_to_html(text):
                     parts['docinfo'], parts['body']))
 
 
-if has_sphinx:
-    class CustomHTMLTranslator(HTMLTranslator):
-
-        def visit_pending_xref(self, node):
-            pass
 
-        def depart_pending_xref(self, node):
-            pass
+def intr_docstrings(registry):
+    """ Return docstrings of registered introspectables, classes and
+    functions of introspectables and their ``description`` """
+    texts = []
+    for category in registry.introspector.categorized():
+        for info in category[1]:
+            for name, value in info['introspectable'].items():
+                if name == 'description' and isinstance(value, text_type):
+                    texts.append(value)
+                    continue
+
+                value = getattr(value, 'cls', value)
+                if inspect.isclass(value) or inspect.isroutine(value):
+                    doc = getattr(value, '__doc__', None)
+                    if isinstance(doc, text_type):
+                        texts.append(doc)
+
+    return [text for text in set(texts) if text.strip()]
+
+
+def warmup(registry, texts=None):
+    """ Render introspectables docstrings into cache, with
+    ``ptah.rst_workers`` setting texts are rendered in processes pool.
+    Return number of rendered texts. """
+    size, workers = _config(registry)
+    if not size:
+        return 0
+
+    if texts is None:
+        texts = intr_docstrings(registry)
+
+    cache.maxsize = size
+    pending = {}
+    for text in texts:
+        key = _key(text)
+        if key not in cache.data:
+            pending[key] = text
+
+    pool = get_executor(workers)
+    if pool is not None:
+        results = pool.map(render, pending.values())
+    else:
+        results = map(render, pending.values())
+
+    for key, html in zip(pending, results):
+        cache.set(key, html)
+    return len(pending)
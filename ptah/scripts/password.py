@@ -0,0 +1,49 @@
+""" ptah-password command """
+from __future__ import print_function
+import argparse
+
+from ptah import password
+
+
+def main():
+    args = PasswordCommand.parser.parse_args()
+
+    cmd = PasswordCommand(args)
+    cmd.run()
+
+
+class PasswordCommand(object):
+    """ 'password' command"""
+
+    parser = argparse.ArgumentParser(description="ptah password hashing")
+    parser.add_argument('--calibrate', action="store_true",
+                        dest='calibrate',
+                        help='Calibrate password manager cost '
+                        'for current machine')
+    parser.add_argument('-m', '--manager', dest='manager',
+                        choices=('pbkdf2', 'scrypt'), default='pbkdf2',
+                        help='Password manager')
+    parser.add_argument('-t', '--target', type=int,
+                        dest='target', default=250,
+                        help='Target hashing time in milliseconds')
+
+    def __init__(self, args):
+        self.options = args
+
+    def run(self):
+        if not self.options.calibrate:
+            self.parser.print_help()
+            return
+
+        pm = password.calibrate(
+            self.options.manager, self.options.target / 1000.0)
+
+        print('# {0} settings for {1} ms'.format(
+            self.options.manager, self.options.target))
+        print('ptah.pwd_manager = "{0}"'.format(self.options.manager))
+        if self.options.manager == 'pbkdf2':
+            print('ptah.pwd_pbkdf2_iterations = {0}'.format(pm.iterations))
+        else:
+            print('ptah.pwd_scrypt_n = {0}'.format(pm.n))
+            print('ptah.pwd_scrypt_r = {0}'.format(pm.r))
+            print('ptah.pwd_scrypt_p = {0}'.format(pm.p))
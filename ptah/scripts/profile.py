@@ -0,0 +1,60 @@
+""" ptah-profile command """
+from __future__ import print_function
+import argparse
+
+import ptah
+from ptah import config, scripts
+
+
+def main(init=True):
+    args = ProfileCommand.parser.parse_args()
+
+    # bootstrap pyramid with enabled startup profiler
+    config.enable_profiler()
+    if init: # pragma: no cover
+        scripts.bootstrap(args.config)
+
+    cmd = ProfileCommand(args)
+    cmd.run()
+
+    ptah.shutdown()
+
+
+class ProfileCommand(object):
+    """ 'profile' command"""
+
+    parser = argparse.ArgumentParser(description="ptah startup profiler")
+    parser.add_argument('config', metavar='config',
+                        help='ini config file')
+    parser.add_argument('-k', '--kind', dest='kind', default=None,
+                        help='Show records of given kind only (scan, '
+                        'directive, action, step, populate)')
+    parser.add_argument('-l', '--limit', type=int,
+                        dest='limit', default=20,
+                        help='Number of records for each kind')
+
+    def __init__(self, args):
+        self.options = args
+
+    def run(self):
+        profiler = config.get_profiler()
+        summary = profiler.summary()
+
+        kinds = [self.options.kind] if self.options.kind else list(summary)
+        for kind in kinds:
+            total = summary.get(kind, {'calls': 0, 'total': 0.0})
+            print('* {0}: {1:.4f}s, {2} calls'.format(
+                kind, total['total'], total['calls']))
+
+            for rec in profiler.report(kind)[:self.options.limit]:
+                print('    {total:9.4f}s {max:9.4f}s {calls:6d}  '
+                      '{name}'.format(**rec))
+            print('')
+
+        if self.options.kind in (None, 'action'):
+            print('* slowest actions')
+            for elapsed, category, source in \
+                    profiler.slowest_actions()[:self.options.limit]:
+                print('    {0:9.4f}s  {1} {2}'.format(
+                    elapsed, category, source))
+            print('')
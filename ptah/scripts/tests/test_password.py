@@ -0,0 +1,36 @@
+import sys
+from ptah.scripts import password
+from ptah.testing import TestCase
+from pyramid.compat import NativeIO
+
+
+class TestPasswordCommand(TestCase):
+
+    def _run(self, *args):
+        sys.argv[:] = ['ptah-password'] + list(args)
+
+        stdout = sys.stdout
+        out = NativeIO()
+        sys.stdout = out
+        try:
+            password.main()
+        finally:
+            sys.stdout = stdout
+
+        return out.getvalue()
+
+    def test_calibrate_pbkdf2(self):
+        val = self._run('--calibrate', '-t', '1')
+        self.assertIn('ptah.pwd_manager = "pbkdf2"', val)
+        self.assertIn('ptah.pwd_pbkdf2_iterations = ', val)
+
+    def test_calibrate_scrypt(self):
+        val = self._run('--calibrate', '-m', 'scrypt', '-t', '1')
+        self.assertIn('ptah.pwd_manager = "scrypt"', val)
+        self.assertIn('ptah.pwd_scrypt_n = ', val)
+        self.assertIn('ptah.pwd_scrypt_r = 8', val)
+        self.assertIn('ptah.pwd_scrypt_p = 1', val)
+
+    def test_help(self):
+        val = self._run()
+        self.assertIn('--calibrate', val)
@@ -0,0 +1,44 @@
+import sys
+from ptah import config
+from ptah.scripts import profile
+from ptah.testing import PtahTestCase
+from pyramid.compat import NativeIO
+
+
+class TestProfileCommand(PtahTestCase):
+
+    def tearDown(self):
+        config.enable_profiler(False)
+        super(TestProfileCommand, self).tearDown()
+
+    def _run(self, *args):
+        sys.argv[:] = ['ptah-profile', 'ptah.ini'] + list(args)
+
+        stdout = sys.stdout
+        out = NativeIO()
+        sys.stdout = out
+        try:
+            profile.main(False)
+        finally:
+            sys.stdout = stdout
+
+        return out.getvalue()
+
+    def test_profile(self):
+        profiler = config.enable_profiler()
+        profiler.add('scan', 'test.package', 0.5)
+        profiler.add('step', 'init_settings', 0.25)
+        profiler.add_action(
+            config.Action(None, discriminator=('test:action',)), 0.125)
+
+        val = self._run()
+        self.assertIn('* scan: 0.5000s, 1 calls', val)
+        self.assertIn('test.package', val)
+        self.assertIn('* step: 0.2500s, 1 calls', val)
+        self.assertIn('* slowest actions', val)
+        self.assertIn('0.1250s  test:action', val)
+
+        val = self._run('-k', 'scan')
+        self.assertIn('test.package', val)
+        self.assertNotIn('init_settings', val)
+        self.assertNotIn('slowest actions', val)
@@ -0,0 +1,38 @@
+import sys
+from ptah.scripts import tokens
+from ptah.testing import PtahTestCase
+from pyramid.compat import NativeIO
+
+
+class TestTokensCommand(PtahTestCase):
+
+    def test_sweep(self):
+        from ptah import token
+
+        removed = []
+        orig_sweep = token.service.sweep
+        token.service.sweep = lambda size: removed.append(size) or 3
+
+        sys.argv[:] = ['ptah-tokens', 'ptah.ini', '--sweep', '-b', '100']
+
+        stdout = sys.stdout
+        out = NativeIO()
+        sys.stdout = out
+        try:
+            tokens.main(False)
+        finally:
+            sys.stdout = stdout
+            token.service.sweep = orig_sweep
+
+        self.assertEqual(removed, [100])
+        self.assertIn('Removed 3 expired tokens', out.getvalue())
+
+        sys.argv[:] = ['ptah-tokens', 'ptah.ini']
+        out = NativeIO()
+        sys.stdout = out
+        try:
+            tokens.main(False)
+        finally:
+            sys.stdout = stdout
+
+        self.assertIn('--sweep', out.getvalue())
@@ -0,0 +1,43 @@
+""" ptah-tokens command """
+from __future__ import print_function
+import argparse
+
+import ptah
+from ptah import scripts, token
+
+
+def main(init=True):
+    args = TokensCommand.parser.parse_args()
+
+    # bootstrap pyramid
+    if init: # pragma: no cover
+        scripts.bootstrap(args.config)
+
+    cmd = TokensCommand(args)
+    cmd.run()
+
+    ptah.shutdown()
+
+
+class TokensCommand(object):
+    """ 'tokens' command"""
+
+    parser = argparse.ArgumentParser(description="ptah tokens management")
+    parser.add_argument('config', metavar='config',
+                        help='ini config file')
+    parser.add_argument('--sweep', action="store_true",
+                        dest='sweep',
+                        help='Remove expired tokens')
+    parser.add_argument('-b', '--batch-size', type=int,
+                        dest='batch_size', default=1000,
+                        help='Number of tokens removed in one transaction')
+
+    def __init__(self, args):
+        self.options = args
+
+    def run(self):
+        if self.options.sweep:
+            removed = token.service.sweep(self.options.batch_size)
+            print ('Removed {0} expired tokens'.format(removed))
+        else:
+            self.parser.print_help()
@@ -1,5 +1,4 @@
-from collections import OrderedDict
-from pyramid.compat import string_types
+from pyramid.compat import string_types, is_nonstr_iter
 from pyramid.location import lineage
 from pyramid.security import ACLDenied, ACLAllowed, Allow, Deny
 from pyramid.security import ALL_PERMISSIONS, NO_PERMISSION_REQUIRED
@@ -12,16 +11,24 @@ import ptah
 from ptah import config
 from ptah import auth_service
 from ptah import SUPERUSER_URI
+from ptah.authentication import resolve_principal
+from ptah.util import tldata, CacheStats
+from ptah.events import UriInvalidateEvent
 from ptah.settings import get_settings
 from ptah.interfaces import IOwnersAware
 from ptah.interfaces import ILocalRolesAware
 
 
 ID_ACL = 'ptah:aclmap'
+ID_ACL_MERGED = 'ptah:aclmap-merged'
 ID_ROLE = 'ptah:role'
 ID_ROLES_PROVIDER = 'ptah:roles-provider'
 ID_PERMISSION = 'ptah:permission'
 
+PERMISSION_CACHE_KEY = '__ptah_permission_cache__'
+LOCAL_ROLES_CACHE_KEY = '__ptah_local_roles_cache__'
+PRINCIPALS_CACHE_KEY = '__ptah_principals_cache__'
+
 
 def get_acls():
     """ return list of registered ACLS """
@@ -63,7 +70,8 @@ def Permission(name, title, description=''):
         config.Action(
             lambda config, p: \
                 config.get_cfg_storage(ID_PERMISSION).update({str(p): p}),
-            (permission,), discriminator=discr, introspectables=(intr,))
+            (permission,), discriminator=discr, introspectables=(intr,),
+            storage=ID_PERMISSION)
         )
 
     return permission
@@ -86,6 +94,11 @@ class ACL(list):
 
     # do we need somthing like Unset, to unset permission from parent
 
+    version = 0
+
+    _index = None
+    _compiled = None
+
     def __init__(self, id, title, description=''):
         self.id = id
         self.title = title
@@ -105,23 +118,41 @@ class ACL(list):
             )
         self.directiveInfo = info
 
-    def get(self, typ, role):
-        for r in self:
-            if r[0] == typ and r[1] == role:
-                return r
+    def invalidate(self, index=True):
+        """ Drop compiled representation """
+        self.version += 1
+        self._compiled = None
+        if index:
+            self._index = None
 
-        return None
+    def compile(self):
+        """ Return :py:class:`ptah.security.CompiledACL` for this map """
+        compiled = self._compiled
+        if compiled is None:
+            compiled = self._compiled = CompiledACL(self)
+        return compiled
 
-    def allow(self, role, *permissions):
-        """ Give permissions to role """
+    def get(self, typ, role):
+        index = self._index
+        if index is None:
+            index = {}
+            for r in self:
+                index.setdefault((r[0], r[1]), r)
+            self._index = index
 
+        return index.get((typ, role))
+
+    def _add(self, typ, role, permissions):
         if not isinstance(role, string_types):
             role = role.id
 
-        rec = self.get(Allow, role)
+        rec = self.get(typ, role)
         if rec is None:
-            rec = [Allow, role, set()]
-            self.append(rec)
+            rec = [typ, role, set()]
+            list.append(self, rec)
+            self._index[(typ, role)] = rec
+
+        self.invalidate(False)
 
         if rec[2] is ALL_PERMISSIONS:
             return
@@ -131,43 +162,92 @@ class ACL(list):
         else:
             rec[2].update(permissions)
 
+    def allow(self, role, *permissions):
+        """ Give permissions to role """
+        self._add(Allow, role, permissions)
+
     def deny(self, role, *permissions):
         """ Deny permissions for role """
+        self._add(Deny, role, permissions)
 
-        if not isinstance(role, string_types):
-            role = role.id
-
-        rec = self.get(Deny, role)
-        if rec is None:
-            rec = [Deny, role, set()]
-            self.append(rec)
-
-        if rec[2] is ALL_PERMISSIONS:
+    def unset(self, role, *permissions):
+        """ Unset any previously defined permissions """
+        if not permissions:
             return
 
-        if ALL_PERMISSIONS in permissions:
-            rec[2] = ALL_PERMISSIONS
+        if role is None:
+            records = list(self)
         else:
-            rec[2].update(permissions)
+            records = [rec for rec in (self.get(Allow, role),
+                                       self.get(Deny, role))
+                       if rec is not None]
 
-    def unset(self, role, *permissions):
-        """ Unset any previously defined permissions """
-        for perm in permissions:
-            for rec in self:
-                if role is not None and rec[1] != role:
-                    continue
+        unset_all = ALL_PERMISSIONS in permissions
+        for rec in records:
+            if unset_all or rec[2] is ALL_PERMISSIONS:
+                rec[2] = set()
+            else:
+                rec[2].difference_update(permissions)
 
-                if rec[2] is ALL_PERMISSIONS or perm is ALL_PERMISSIONS:
-                    rec[2] = set()
-                else:
-                    if perm in rec[2]:
-                        rec[2].remove(perm)
+        self[:] = [rec for rec in self if rec[2]]
+
+
+def _invalidating(name):
+    method = getattr(list, name)
 
-        records = []
-        for rec in self:
-            if rec[2]:
-                records.append(rec)
-        self[:] = records
+    def wrapper(self, *args, **kw):
+        res = method(self, *args, **kw)
+        self.invalidate()
+        return res
+
+    wrapper.__name__ = name
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+for _name in ('__setitem__', '__delitem__', '__iadd__', 'append', 'extend',
+              'insert', 'remove', 'pop', 'clear', 'sort', 'reverse'):
+    setattr(ACL, _name, _invalidating(_name))
+
+
+_all_permissions = object()
+
+
+class CompiledACL(object):
+    """ Compiled ACL. Maps principal to permissions, each permission
+    (or ``ALL_PERMISSIONS``) points to first ACE that mentions it. ACE
+    positions preserve ACL order semantics, so lookup result is the
+    same as linear ACL scan. """
+
+    def __init__(self, acl):
+        self.principals = principals = {}
+
+        for pos, ace in enumerate(acl):
+            action, principal, permissions = ace
+
+            if permissions is ALL_PERMISSIONS:
+                permissions = (_all_permissions,)
+            elif not is_nonstr_iter(permissions):
+                permissions = (permissions,)
+
+            perms = principals.setdefault(principal, {})
+            for perm in permissions:
+                if perm not in perms:
+                    perms[perm] = (pos, ace)
+
+    def lookup(self, principals, permission):
+        """ Return first ACE matching any of principals and permission """
+        found = None
+        for principal in principals:
+            perms = self.principals.get(principal)
+            if perms:
+                for key in (permission, _all_permissions):
+                    rec = perms.get(key)
+                    if rec is not None and (found is None or
+                                            rec[0] < found[0]):
+                        found = rec
+
+        if found is not None:
+            return found[1]
 
 
 class ACLsMerge(object):
@@ -184,6 +264,27 @@ class ACLsMerge(object):
                 for rec in acl:
                     yield rec
 
+    def compile(self):
+        """ Return :py:class:`ptah.security.CompiledACL` of merged ACLs.
+        Result is shared between all merges of same ACLs maps and
+        rebuilt only if one of the maps has been changed. """
+        key = tuple(self.acls)
+        acls = config.get_cfg_storage(ID_ACL)
+        maps = [acls.get(aname) for aname in key]
+        versions = [getattr(acl, 'version', None) for acl in maps]
+
+        cache = config.get_cfg_storage(ID_ACL_MERGED)
+        cached = cache.get(key)
+        if cached is not None:
+            c_maps, c_versions, compiled = cached
+            if c_versions == versions and \
+                    all(a is b for a, b in zip(c_maps, maps)):
+                return compiled
+
+        compiled = CompiledACL(self)
+        cache[key] = (maps, versions, compiled)
+        return compiled
+
 
 class ACLsProperty(object):
     """ This property merges `__acls__` list of ACLs and
@@ -238,7 +339,8 @@ class Role(object):
             config.Action(
                 lambda config, r: \
                     config.get_cfg_storage(ID_ROLE).update({r.name: r}),
-                (self, ), discriminator=discr, introspectables=(intr,))
+                (self, ), discriminator=discr, introspectables=(intr,),
+                storage=ID_ROLE)
             )
 
     def __str__(self):
@@ -296,15 +398,127 @@ class roles_provider(object):
                 lambda cfg, name, f:
                     cfg.get_cfg_storage(ID_ROLES_PROVIDER).update({name: f}),
                 (intr['name'], factory),
-                discriminator=self.discr, introspectables=(intr,)),
+                discriminator=self.discr, introspectables=(intr,),
+                storage=ID_ROLES_PROVIDER),
             cfg)
         return factory
 
 
 @roles_provider('ptah_default_roles')
 def ptah_default_roles(context, uid, registry):
-    cfg = get_settings(ptah.CFG_ID_PTAH, registry)
-    return cfg['default_roles']
+    return get_settings(ptah.CFG_ID_PTAH, registry).snapshot.default_roles
+
+
+_cache_disabled = object()
+
+def get_request_cache(key, setting):
+    """ Return request scoped cache, or None if `setting` ptah
+    setting is disabled.
+
+    Cache is stored in thread local data, so it is cleared on each new
+    request and by :py:class:`ptah.events.UriInvalidateEvent`.
+    """
+    cache = tldata.get(key)
+    if cache is None:
+        try:
+            enabled = get_settings(ptah.CFG_ID_PTAH).snapshot[setting]
+        except KeyError:
+            enabled = False
+
+        cache = {} if enabled else _cache_disabled
+        tldata.set(key, cache)
+
+    if cache is _cache_disabled:
+        return None
+    return cache
+
+
+@ptah.subscriber(UriInvalidateEvent)
+def invalidate_request_caches(ev):
+    for key in (PERMISSION_CACHE_KEY,
+                LOCAL_ROLES_CACHE_KEY, PRINCIPALS_CACHE_KEY):
+        cache = tldata.get(key)
+        if cache is not None and cache is not _cache_disabled:
+            cache.clear()
+
+
+_not_resolved = object()
+
+class _PrincipalGetter(object):
+    """ resolves principal once per get_local_roles call, and once
+    per request if local roles cache is enabled """
+
+    principal = _not_resolved
+
+    def __init__(self, userid, cache):
+        self.userid = userid
+        self.cache = cache
+
+    def __call__(self):
+        if self.principal is _not_resolved:
+            cache = self.cache
+            if cache is None:
+                self.principal = resolve_principal(self.userid)
+            else:
+                try:
+                    self.principal = cache[self.userid]
+                except KeyError:
+                    self.principal = cache[self.userid] = \
+                        resolve_principal(self.userid)
+        return self.principal
+
+
+def _location_roles(userid, location, get_principal):
+    roles = []
+    if ILocalRolesAware.providedBy(location):
+        local_roles = location.__local_roles__
+        if local_roles:
+            for r in local_roles.get(userid, ()):
+                if r not in roles:
+                    roles.append(r)
+
+            user_props = getattr(get_principal(), 'properties', dict())
+            for grp in user_props.get('groups', ()):
+                for r in local_roles.get(grp, ()):
+                    if r not in roles:
+                        roles.append(r)
+    return roles
+
+
+def get_lineage_roles(userid, context):
+    """ calculates local roles for userid defined on context and
+    its parents.
+
+    If `ptah.local_roles_cache` setting is enabled, accumulated roles
+    are cached per (userid, location) for the duration of current
+    request, so objects with same parent reuse parent's roles. """
+    cache = get_request_cache(LOCAL_ROLES_CACHE_KEY, 'local_roles_cache')
+    get_principal = _PrincipalGetter(
+        userid,
+        None if cache is None else
+        get_request_cache(PRINCIPALS_CACHE_KEY, 'local_roles_cache'))
+
+    chain = []
+    inherited = ()
+    for location in lineage(context):
+        if cache is not None:
+            cached = cache.get((userid, id(location)))
+            if cached is not None and cached[0] is location:
+                inherited = cached[1]
+                break
+        chain.append(location)
+
+    for location in reversed(chain):
+        roles = _location_roles(userid, location, get_principal)
+        roles.extend(r for r in inherited if r not in roles)
+
+        inherited = tuple(roles)
+        if cache is not None:
+            # cached value keeps reference to location,
+            # so its id can't be reused
+            cache[(userid, id(location))] = (location, inherited)
+
+    return inherited
 
 
 def get_local_roles(userid, request=None,
@@ -315,34 +529,14 @@ def get_local_roles(userid, request=None,
         if context is None:
             context = getattr(request, 'root', None)
 
-    roles = OrderedDict()
+    data = []
 
     if IOwnersAware.providedBy(context):
         if userid == context.__owner__:
-            roles[Owner.id] = Allow
-
-    for location in lineage(context):
-        if ILocalRolesAware.providedBy(location):
-            local_roles = location.__local_roles__
-            if local_roles:
-                user_props = getattr(ptah.resolve(userid), 'properties', dict())
-                user_roles = []
-
-                for r in local_roles.get(userid, ()):
-                    if r not in user_roles:
-                        user_roles.append(r)
-                for grp in user_props.get('groups', ()):
-                    for r in local_roles.get(grp, ()):
-                        if r not in roles:
-                            user_roles.append(r)
-
-                for r in user_roles:
-                    if r not in roles:
-                        roles[r] = Allow
+            data.append(Owner.id)
 
-    data = []
-    for r, val in roles.items():
-        if val is Allow:
+    for r in get_lineage_roles(userid, context):
+        if r not in data:
             data.append(r)
 
     registry = get_current_registry()
@@ -366,9 +560,23 @@ Owner = Role(
 NOT_ALLOWED = Permission('__not_allowed__', 'Special permission')
 
 
+permission_cache_stats = CacheStats()
+
+
+def get_permission_cache():
+    """ Return request scoped permission decisions cache,
+    or None if `ptah.permission_cache` setting is disabled. """
+    return get_request_cache(PERMISSION_CACHE_KEY, 'permission_cache')
+
+
 def check_permission(permission, context, request=None, throw=False):
     """ Check `permission` withing `context`.
 
+    If `ptah.permission_cache` setting is enabled, decisions are cached
+    for the duration of current request by (effective userid, context,
+    permission). Cache hits and misses are counted in
+    :py:data:`ptah.security.permission_cache_stats`.
+
     :param permission: Permission
     :type permission: (Permission or sting)
     :param context: Context object
@@ -386,18 +594,8 @@ def check_permission(permission, context, request=None, throw=False):
     if userid == SUPERUSER_URI:
         return True
 
-    AUTHZ = get_current_registry().getUtility(IAuthorizationPolicy)
-
-    principals = [Everyone.id]
-
-    if userid is not None:
-        principals.extend((Authenticated.id, userid))
-
-        roles = get_local_roles(userid, context=context)
-        if roles:
-            principals.extend(roles)
-
-    res = AUTHZ.permits(context, principals, permission)
+    res = _permits(get_current_registry().getUtility(IAuthorizationPolicy),
+                   userid, context, permission, [], get_permission_cache())
 
     if isinstance(res, ACLDenied):
         if throw:
@@ -407,6 +605,94 @@ def check_permission(permission, context, request=None, throw=False):
     return True
 
 
+def check_permissions(permissions, context):
+    """ Check each of `permissions` within `context`. Principals and
+    local roles are calculated only once.
+
+    :param permissions: Sequence of permissions
+    :param context: Context object
+    :rtype: List of booleans, in `permissions` order
+
+    .. code-block:: python
+
+      allowed = ptah.check_permissions(('View', 'Edit'), content)
+    """
+    return _check_many(
+        get_current_registry().getUtility(IAuthorizationPolicy),
+        auth_service.get_effective_userid(),
+        context, permissions, get_permission_cache())
+
+
+def check_permissions_many(permission, contexts):
+    """ Check `permission` for each of `contexts`. Effective user,
+    authorization policy and permission cache are looked up only once.
+
+    :param permission: Permission
+    :param contexts: Iterable of context objects
+    :rtype: List of booleans, in `contexts` order
+
+    .. code-block:: python
+
+      allowed = [item for item, ok in
+                 zip(items, ptah.check_permissions_many('View', items)) if ok]
+    """
+    authz = get_current_registry().getUtility(IAuthorizationPolicy)
+    userid = auth_service.get_effective_userid()
+    cache = get_permission_cache()
+    permissions = (permission,)
+
+    return [_check_many(authz, userid, context, permissions, cache)[0]
+            for context in contexts]
+
+
+def _check_many(authz, userid, context, permissions, cache):
+    principals = []
+
+    result = []
+    for permission in permissions:
+        if not permission or permission == NO_PERMISSION_REQUIRED:
+            result.append(True)
+        elif permission == NOT_ALLOWED:
+            result.append(False)
+        elif userid == SUPERUSER_URI:
+            result.append(True)
+        else:
+            res = _permits(
+                authz, userid, context, permission, principals, cache)
+            result.append(not isinstance(res, ACLDenied))
+
+    return result
+
+
+def _permits(authz, userid, context, permission, principals, cache):
+    # `principals` is filled on first use, so it can be shared
+    # between checks within same context
+    if cache is not None:
+        # cached value keeps reference to context, so its id can't be reused
+        key = (userid, id(context), permission)
+        cached = cache.get(key)
+        if cached is not None and cached[0] is context:
+            permission_cache_stats.hits += 1
+            return cached[1]
+        permission_cache_stats.misses += 1
+
+    if not principals:
+        principals.append(Everyone.id)
+
+        if userid is not None:
+            principals.extend((Authenticated.id, userid))
+
+            roles = get_local_roles(userid, context=context)
+            if roles:
+                principals.extend(roles)
+
+    res = authz.permits(context, principals, permission)
+
+    if cache is not None:
+        cache[key] = (context, res)
+    return res
+
+
 class PtahAuthorizationPolicy(ACLAuthorizationPolicy):
 
     def permits(self, context, principals, permission):
@@ -422,5 +708,40 @@ class PtahAuthorizationPolicy(ACLAuthorizationPolicy):
             return ACLAllowed(
                 'Superuser', None, permission, principals, context)
 
-        return super(PtahAuthorizationPolicy, self).permits(
-            context, principals, permission)
+        acl = '<No ACL found on any object in resource lineage>'
+
+        for location in lineage(context):
+            try:
+                acl = location.__acl__
+            except AttributeError:
+                continue
+
+            if acl and callable(acl):
+                acl = acl()
+
+            compile = getattr(acl, 'compile', None)
+            if compile is not None:
+                ace = compile().lookup(principals, permission)
+            else:
+                ace = _lookup_ace(acl, principals, permission)
+
+            if ace is not None:
+                if ace[0] == Allow:
+                    return ACLAllowed(
+                        ace, acl, permission, principals, location)
+                else:
+                    return ACLDenied(
+                        ace, acl, permission, principals, location)
+
+        return ACLDenied(
+            '<default deny>', acl, permission, principals, context)
+
+
+def _lookup_ace(acl, principals, permission):
+    for ace in acl:
+        ace_action, ace_principal, ace_permissions = ace
+        if ace_principal in principals:
+            if not is_nonstr_iter(ace_permissions):
+                ace_permissions = [ace_permissions]
+            if permission in ace_permissions:
+                return ace
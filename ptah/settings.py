@@ -1,12 +1,22 @@
 """ settings """
+import os
+import re
+import glob
+import time
+import errno
+import socket
 import logging
 import os.path
+import keyword
+import threading
+import transaction
 import sqlalchemy as sqla
 from collections import OrderedDict
 
 from zope import interface
 from zope.interface.interface import InterfaceClass
 from pyramid.compat import configparser
+from pyramid.interfaces import INewRequest
 
 import ptah.form as form
 
@@ -14,6 +24,7 @@ import ptah
 from ptah import uri, config
 from ptah.sqlautils import JsonType
 from ptah.config import StopException
+from ptah.migrate import register_migration
 
 log = logging.getLogger('ptah')
 
@@ -23,6 +34,9 @@ ID_SETTINGS_GROUP = 'ptah:settings-group'
 
 _marker = object()
 
+register_migration(
+    'ptah.settings', 'ptah:migrations/settings', 'Ptah settings migration')
+
 
 def get_settings(grp, registry=None):
     """Get settings group by group id. Also there is `ptah_get_settins`
@@ -61,6 +75,7 @@ def pyramid_get_settings(config, grp):
     return config.get_cfg_storage(ID_SETTINGS_GROUP)[grp]
 
 
+@config.profiled('step', 'load_dbsettings')
 def load_dbsettings(registry=None):
     session = ptah.get_session()
     if not (session.bind and SettingRecord.__table__.exists()):
@@ -72,6 +87,26 @@ def load_dbsettings(registry=None):
     s_ob.load_fromdb()
 
 
+def set_settings_notifier(notifier, registry=None):
+    """ Set settings change notifier. Notifier is used for notifying other
+    processes about modified settings groups, see
+    :py:class:`LocalNotifier` and :py:class:`UnixSocketNotifier`.
+    Without notifier settings changes are detected by
+    ``ptah.settings_poll_interval`` poll only. """
+    config.get_cfg_storage(
+        SETTINGS_OB_ID, registry, default_factory=Settings).notifier = notifier
+
+
+@config.subscriber(INewRequest)
+def check_settings(ev):
+    """ Reload changed settings groups """
+    s_ob = config.get_cfg_storage(
+        SETTINGS_OB_ID, ev.request.registry, default_factory=Settings)
+    if s_ob.versions is not None:
+        s_ob.check(ev.request.registry)
+
+
+@config.profiled('step', 'init_settings')
 def init_settings(pconfig, cfg=None, section=configparser.DEFAULTSECT):
     """Initialize settings management system. This function available
     as pyramid configurator directive. You should call it during
@@ -170,6 +205,19 @@ class Settings(object):
 
     initialized = False
 
+    #: group versions, loaded by :py:meth:`load_fromdb`
+    versions = None
+
+    #: settings change notifier
+    notifier = None
+
+    #: time of last versions check
+    checked = 0
+
+    def __init__(self):
+        self.pending = set()
+        self.listening = None
+
     def init(self, config, defaults=None):
         groups = config.get_cfg_storage(ID_SETTINGS_GROUP).items()
 
@@ -186,8 +234,14 @@ class Settings(object):
 
         self.load(defaults, True)
 
-    def load(self, rawdata, setdefaults=False):
-        groups = config.get_cfg_storage(ID_SETTINGS_GROUP).items()
+    def load(self, rawdata, setdefaults=False, groups=None):
+        """ Load settings from `rawdata`, with `groups` only listed
+        groups are loaded """
+        storage = config.get_cfg_storage(ID_SETTINGS_GROUP)
+        if groups is None:
+            groups = storage.items()
+        else:
+            groups = [(name, storage[name]) for name in groups]
 
         try:
             rawdata = dict((k.lower(), v) for k, v in rawdata.items())
@@ -208,24 +262,147 @@ class Settings(object):
 
             group.update(data)
 
-    def load_fromdb(self):
-        records = dict(ptah.get_session().
-                       query(SettingRecord.name, SettingRecord.value))
-        self.load(records)
+    def load_fromdb(self, groups=None):
+        """ Load settings from database, with `groups` only records
+        of listed groups are loaded """
+        Session = ptah.get_session()
+        if groups is None:
+            self.versions = dict(
+                Session.query(SettingsVersion.name, SettingsVersion.version))
+
+        records = self.query_records(groups)
+        self.load(records, groups=groups)
 
         # load non defined fields
-        groups = config.get_cfg_storage(ID_SETTINGS_GROUP).items()
+        storage = config.get_cfg_storage(ID_SETTINGS_GROUP)
+        for name in (storage.keys() if groups is None else groups):
+            self._load_undefined(storage[name], records)
+
+    def query_records(self, groups=None):
+        """ Return settings records, with `groups` only records
+        of listed groups """
+        if groups is not None and not groups:
+            return {}
+
+        query = ptah.get_session().query(
+            SettingRecord.name, SettingRecord.value)
+        if groups is not None:
+            query = query.filter(
+                sqla.or_(*[SettingRecord.name.like('%s.%%' % name)
+                           for name in groups]))
+        return dict(query)
+
+    def _load_undefined(self, group, records):
+        name = '%s.'%group.__name__
+        for attr, val in records.items():
+            if attr.startswith(name):
+                fname = attr[len(name):]
+                if fname not in group.__fields__:
+                    try:
+                        group[fname] = JsonType.serializer.loads(val)
+                    except ValueError:
+                        group[fname] = val
+
+    def load_group(self, group, records):
+        """ Load group values from settings `records`, fields without
+        record are set to default value """
+        name = group.__name__
+        data, errors = group.extract(records)
+        if errors:
+            log.error(errors.msg)
+            return
 
-        for name, group in groups:
-            name = '%s.'%name
-            for attr, val in records.items():
-                if attr.startswith(name):
-                    fname = attr[len(name):]
-                    if fname not in group.__fields__:
-                        try:
-                            group[fname] = JsonType.serializer.loads(val)
-                        except ValueError:
-                            group[fname] = val
+        for field in group.__fields__.values():
+            if '{0}.{1}'.format(name, field.name) not in records:
+                data[field.name] = field.default
+
+        group.update(data)
+        self._load_undefined(group, records)
+
+    def refresh(self, registry=None):
+        """ Reload groups with changed version, return names of
+        reloaded groups """
+        Session = ptah.get_session()
+        versions = dict(
+            Session.query(SettingsVersion.name, SettingsVersion.version))
+
+        groups = config.get_cfg_storage(ID_SETTINGS_GROUP, registry)
+        changed = [name for name, version in versions.items()
+                   if name in groups and
+                   (self.versions or {}).get(name) != version]
+
+        if changed:
+            records = self.query_records(changed)
+
+            for name in changed:
+                group = groups[name]
+                self.load_group(group, records)
+                log.info('Settings group "%s" has been reloaded', name)
+
+                group.__registry__.notify(
+                    ptah.events.SettingsGroupModified(group))
+                group.__registry__.notify(
+                    ptah.events.UriInvalidateEvent(group.__uri__))
+
+        self.versions = versions
+        return changed
+
+    def invalidate(self, name):
+        """ Mark settings group `name` as modified by other process """
+        self.pending.add(name)
+
+    def check(self, registry=None):
+        """ Reload changed groups if notifier reported modified groups or
+        ``ptah.settings_poll_interval`` is elapsed since last check """
+        if self.notifier is not None and self.listening != os.getpid():
+            self.listening = os.getpid()
+            self.notifier.listen(self.invalidate)
+
+        interval = get_settings(ptah.CFG_ID_PTAH, registry)\
+            .snapshot.settings_poll_interval
+
+        now = time.time()
+        if self.pending or (interval > 0 and now - self.checked > interval):
+            self.checked = now
+            self.pending = set()
+            return self.refresh(registry)
+
+        return []
+
+    def bump_version(self, name):
+        """ Increment version of settings group `name` and notify
+        other processes after transaction commit """
+        Session = ptah.get_session()
+
+        def update():
+            return Session.query(SettingsVersion)\
+                .filter(SettingsVersion.name == name)\
+                .update({SettingsVersion.version: SettingsVersion.version+1},
+                        synchronize_session=False)
+
+        if not update():
+            try:
+                with Session.begin_nested():
+                    Session.add(SettingsVersion(name=name, version=1))
+            except sqla.exc.IntegrityError:
+                # row has been created by other process
+                update()
+
+        version = Session.query(SettingsVersion.version)\
+            .filter(SettingsVersion.name == name).scalar()
+
+        # skip reload of own changes, unless group has been changed
+        # by other process as well
+        if self.versions is not None and \
+                self.versions.get(name, 0) + 1 == version:
+            self.versions[name] = version
+
+        notifier = self.notifier
+        if notifier is not None:
+            transaction.get().addAfterCommitHook(
+                lambda success: success and notifier.notify(name))
+
+        return version
 
     def export(self, default=False):
         groups = config.get_cfg_storage(ID_SETTINGS_GROUP).items()
@@ -243,9 +420,145 @@ class Settings(object):
         return result
 
 
+class SettingsSnapshot(object):
+    """ Immutable snapshot of settings group values, values are
+    available as attributes. Snapshot classes are generated per set
+    of settings names, see :py:meth:`Group.snapshot` """
+
+    __slots__ = ()
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except (AttributeError, TypeError):
+            raise KeyError(name)
+
+    def __contains__(self, name):
+        return name in self.__slots__
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Settings snapshot is read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError('Settings snapshot is read-only')
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, ', '.join(
+            '%s=%r' % (name, getattr(self, name)) for name in self.__slots__))
+
+
+_snapshot_classes = {}
+
+
+def _snapshot_class(names):
+    cls = _snapshot_classes.get(names)
+    if cls is None:
+        cls = _snapshot_classes[names] = type(
+            'SettingsSnapshot', (SettingsSnapshot,), {'__slots__': names})
+    return cls
+
+
+_json_start = frozenset('{["-0123456789 \t\r\n')
+_json_consts = {'true': True, 'false': False, 'null': None}
+_int_re = re.compile(r'-?(0|[1-9][0-9]*)$')
+
+
+def parse_value(value):
+    """ Parse raw setting value, value is json or plain string """
+    if value[:1] not in _json_start and value not in _json_consts:
+        # not a json value
+        if '\\' not in value and '"' not in value:
+            return value
+    else:
+        try:
+            return ptah.json.loads(value)
+        except ValueError:
+            pass
+
+    if not value.startswith('"'):
+        value = '"{0}"'.format(value)
+    return ptah.json.loads(value.replace('\n', '\\n'))
+
+
+def parse_int(value):
+    if _int_re.match(value) is not None:
+        return int(value)
+    return parse_value(value)
+
+
+def parse_bool(value):
+    if value == 'true':
+        return True
+    elif value == 'false':
+        return False
+    return parse_value(value)
+
+
+class GroupLoader(object):
+    """ Compiled settings group loader. For each field loader knows
+    raw data key, value parser and whether field requires validation. """
+
+    def __init__(self, fieldset):
+        self.fieldset = fieldset
+        self.fields = []
+
+        for field in fieldset.fields():
+            if isinstance(field, form.BoolField):
+                parser = parse_bool
+            elif getattr(field, 'typ', None) is int:
+                parser = parse_int
+            else:
+                parser = parse_value
+
+            validate = field.validate
+            if (field.__class__.validate is form.Field.validate and
+                    field.validator is None and field.typ is None and
+                    not field.required):
+                validate = None
+
+            self.fields.append(
+                ('{0}.{1}'.format(fieldset.name, field.name),
+                 field, parser, validate, field.preparer))
+
+    def __call__(self, rawdata, current):
+        data = {}
+        errors = form.FieldsetErrors(self.fieldset)
+
+        for key, field, parser, validate, preparer in self.fields:
+            value = rawdata.get(key, _marker)
+
+            if value is _marker:
+                value = current(field.name)
+            else:
+                try:
+                    value = parser(value)
+
+                    if validate is not None:
+                        validate(value)
+
+                    if preparer is not None:
+                        value = preparer(value)
+                except form.Invalid as e:
+                    errors.append(e)
+                    value = field.default
+
+            data[field.name] = value
+
+        if not errors:
+            try:
+                self.fieldset.validate(data)
+            except form.Invalid as e:
+                errors.append(e)
+
+        return data, errors
+
+
 class Group(OrderedDict):
     """ Settings group """
 
+    __snapshot__ = None
+    __loader__ = None
+
     def __init__(self, *args, **kwargs):
         super(Group, self).__init__()
 
@@ -262,48 +575,78 @@ class Group(OrderedDict):
         clone = self.__class__.__new__(self.__class__)
         clone.__dict__.update(self.__dict__)
         clone.__registry__ = registry
+        clone.__snapshot__ = None
+        clone.__loader__ = None
         return clone
 
-    def extract(self, rawdata):
-        fieldset = self.__fields__
-        name = fieldset.name
+    @property
+    def snapshot(self):
+        """ Immutable snapshot of group values (:py:class:`SettingsSnapshot`),
+        values are available as attributes. Snapshot is rebuilt after
+        group modification.
 
-        data = {}
-        errors = form.FieldsetErrors(fieldset)
+        .. code-block:: python
 
-        for field in fieldset.fields():
-            value = rawdata.get('{0}.{1}'.format(name, field.name), _marker)
+          PTAH = ptah.get_settings(ptah.CFG_ID_PTAH).snapshot
+          PTAH.pwd_manager
 
-            if value is _marker:
-                value = self.get(field.name)
-            else:
-                try:
+        """
+        snapshot = self.__snapshot__
+        if snapshot is None:
+            snapshot = self.rebuild_snapshot()
+        return snapshot
 
-                    try:
-                        value = ptah.json.loads(value)
-                    except:
-                        if not value.startswith('"'):
-                            value = '"{0}"'.format(value)
-                        value = value.replace('\n', '\\n')
-                        value = ptah.json.loads(value)
+    def rebuild_snapshot(self):
+        """ Build new snapshot of group values """
+        values = OrderedDict(
+            (name, self.get(name)) for name in self.__fields__.keys())
+        for name in super(Group, self).keys():
+            if name not in values and isinstance(name, str) and \
+                    name.isidentifier() and not keyword.iskeyword(name):
+                values[name] = self.get(name)
 
-                    field.validate(value)
+        cls = _snapshot_class(tuple(values))
+        snapshot = cls.__new__(cls)
+        for name, value in values.items():
+            object.__setattr__(snapshot, name, value)
 
-                    if field.preparer is not None:
-                        value = field.preparer(value)
-                except form.Invalid as e:
-                    errors.append(e)
-                    value = field.default
+        self.__snapshot__ = snapshot
+        return snapshot
 
-            data[field.name] = value
+    def __setitem__(self, name, value):
+        super(Group, self).__setitem__(name, value)
+        self.__snapshot__ = None
 
-        if not errors:
-            try:
-                fieldset.validate(data)
-            except form.Invalid as e:
-                errors.append(e)
+    def __delitem__(self, name):
+        super(Group, self).__delitem__(name)
+        self.__snapshot__ = None
 
-        return data, errors
+    def update(self, *args, **kw):
+        super(Group, self).update(*args, **kw)
+        self.__snapshot__ = None
+
+    def pop(self, *args):
+        self.__snapshot__ = None
+        return super(Group, self).pop(*args)
+
+    def popitem(self, *args):
+        self.__snapshot__ = None
+        return super(Group, self).popitem(*args)
+
+    def setdefault(self, name, default=None):
+        self.__snapshot__ = None
+        return super(Group, self).setdefault(name, default)
+
+    def clear(self):
+        super(Group, self).clear()
+        self.__snapshot__ = None
+
+    def extract(self, rawdata):
+        loader = self.__loader__
+        if loader is None:
+            loader = self.__loader__ = GroupLoader(self.__fields__)
+
+        return loader(rawdata, self.get)
 
     def get(self, name, default=None):
         try:
@@ -361,13 +704,91 @@ class Group(OrderedDict):
 
         Session.flush()
 
+        config.get_cfg_storage(
+            SETTINGS_OB_ID, self.__registry__, default_factory=Settings)\
+            .bump_version(name)
+
         self.__registry__.notify(ptah.events.SettingsGroupModified(self))
         self.__registry__.notify(ptah.events.UriInvalidateEvent(self.__uri__))
 
 
+@config.subscriber(ptah.events.SettingsGroupModified)
+def rebuild_snapshot(ev):
+    """ Rebuild settings group snapshot """
+    ev.object.rebuild_snapshot()
+
+
 class SettingRecord(ptah.get_base()):
 
     __tablename__ = 'ptah_settings'
 
     name = sqla.Column(sqla.String(128), primary_key=True)
     value = sqla.Column(sqla.UnicodeText)
+
+
+class SettingsVersion(ptah.get_base()):
+
+    __tablename__ = 'ptah_settings_versions'
+
+    name = sqla.Column(sqla.String(128), primary_key=True)
+    version = sqla.Column(sqla.Integer, default=1)
+
+
+class LocalNotifier(object):
+    """ In-process settings notifier, all listeners of
+    same notifier are notified """
+
+    def __init__(self):
+        self.listeners = []
+
+    def listen(self, callback):
+        self.listeners.append(callback)
+
+    def notify(self, name):
+        for callback in self.listeners:
+            callback(name)
+
+
+class UnixSocketNotifier(object):
+    """ Settings notifier for processes on same host. Each process
+    listens on datagram unix socket in `path` directory, notification
+    is sent to all sockets in directory. """
+
+    def __init__(self, path):
+        self.path = path
+        self.address = None
+
+    def listen(self, callback):
+        self.address = os.path.join(self.path, 'ptah-%s.sock' % os.getpid())
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(self.address)
+
+        def receive():
+            while True:
+                callback(sock.recv(1024).decode('utf-8'))
+
+        thread = threading.Thread(target=receive, name=self.address)
+        thread.daemon = True
+        thread.start()
+
+    def notify(self, name):
+        data = name.encode('utf-8')
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            for address in glob.glob(os.path.join(self.path, 'ptah-*.sock')):
+                try:
+                    sock.sendto(data, address)
+                except socket.error as e:
+                    # process is gone
+                    if e.errno in (errno.ECONNREFUSED, errno.ENOENT):
+                        try:
+                            os.unlink(address)
+                        except OSError: # pragma: no cover
+                            pass
+                    else: # pragma: no cover
+                        log.warning('Settings notification failed: %s', e)
+        finally:
+            sock.close()
@@ -2,12 +2,19 @@
 from __future__ import (absolute_import, division, print_function,
     unicode_literals)  # Avoid breaking Python 3
 
-import uuid
+import weakref
 
-from sqlalchemy import orm
+from sqlalchemy import orm, event, inspect, func, cast, literal, and_
+from sqlalchemy.orm import attributes
 from sqlalchemy.ext.mutable import Mutable
-from sqlalchemy.types import TypeDecorator, TEXT
+from sqlalchemy.types import TypeDecorator, TEXT, Text
 
+try:
+    from sqlalchemy.ext import baked
+except ImportError: # pragma: no cover
+    baked = None
+
+from pyramid.compat import string_types
 from pyramid_sqlalchemy import (
     BaseObject,
     metadata,
@@ -43,7 +50,8 @@ def get_session():
 
 
 class QueryFreezer(object):
-    """ A facade for sqla.Session.query which caches internal query structure.
+    """ A facade for sqla.Session.query which caches internal query structure
+    and compiled sql statement (per dialect).
 
     :param builder: anonymous function containing SQLAlchemy query
 
@@ -52,32 +60,58 @@ class QueryFreezer(object):
         _sql_parent = ptah.QueryFreezer(
             lambda: Session.query(Content)
                 .filter(Content.__uri__ == sqla.sql.bindparam('parent')))
+
+    :py:meth:`first` and :py:meth:`one` limit number of rows in sql.
+    Use :py:meth:`reset` to drop cached query, for example after
+    metadata change.
     """
 
+    #: Maximum number of cached statements (query, first, one for each dialect)
+    cache_size = 30
+
     def __init__(self, builder):
-        self.id = uuid.uuid4().int
         self.builder = builder
+        self.reset()
 
     def reset(self):
-        pass
+        """ Drop cached query and compiled statements """
+        self._query = None
+        self._baked = {}
+
+        if baked is not None:
+            builder = self.builder
+            bq = baked.bakery(size=self.cache_size)(
+                lambda session: builder().with_session(session))
+            self._baked = {
+                None: bq,
+                1: bq.with_criteria(lambda q: q.slice(0, 1)),
+                2: bq.with_criteria(lambda q: q.slice(0, 2))}
+
+    def _get_query(self):
+        query = self._query
+        if query is None:
+            query = self._query = self.builder()
+        return query
 
-    def iter(self, **params):
-        sa = get_session()
-        try:
-            data = sa.__ptah_cache__
-        except AttributeError:
-            sa.__ptah_cache__ = data = {}
+    def _execute(self, params, limit=None):
+        session = get_session()()
 
-        query = data.get(self.id, None)
+        if baked is None: # pragma: no cover
+            query = self._get_query().params(**params).with_session(session)
+            if limit is not None:
+                query = query.slice(0, limit)
+            return query
 
-        if query is None:
-            query = self.builder()
-            data[self.id] = query
+        return self._baked[limit].for_session(session).params(**params)
 
-        return query.params(**params).with_session(sa())
+    def iter(self, **params):
+        """ Return :py:class:`sqlalchemy.orm.Query` with bound `params`,
+        query structure is built once. Use :py:meth:`all`, :py:meth:`first`
+        or :py:meth:`one` to use cached compiled statement. """
+        return self._get_query().params(**params).with_session(get_session()())
 
     def one(self, **params):
-        ret = list(self.iter(**params))
+        ret = list(self._execute(params, 2))
 
         l = len(ret)
         if l == 1:
@@ -89,14 +123,61 @@ class QueryFreezer(object):
                 "Multiple rows were found for one()")
 
     def first(self, **params):
-        ret = list(self.iter(**params))[0:1]
+        ret = list(self._execute(params, 1))
         if len(ret) > 0:
             return ret[0]
         else:
             return None
 
     def all(self, **params):
-        return list(self.iter(**params))
+        return list(self._execute(params))
+
+    def stream(self, batch_size=1000, **params):
+        """ Iterate over query results, rows are fetched from server-side
+        cursor (if dialect supports it) in batches of `batch_size` rows.
+
+        Not suitable for queries with eager loaded collections.
+        """
+        def yield_per(q):
+            return q.yield_per(batch_size)
+
+        if baked is None: # pragma: no cover
+            return iter(yield_per(self._execute(params)))
+
+        return iter(self._execute(params).with_post_criteria(yield_per))
+
+
+def iter_keyset(query, key, batch_size=1000, start=None):
+    """ Iterate over all rows of `query` ordered by unique `key` column
+    in batches of `batch_size` rows. Each batch is loaded with separate
+    `WHERE key > last_key LIMIT batch_size` query, so long iteration
+    does not use `OFFSET` and can be resumed from last seen key.
+
+    :param query: sqlalchemy query
+    :param key: unique column (usually primary key)
+    :param batch_size: number of rows in each query
+    :param start: resume iteration after this key value
+
+    .. code-block:: python
+
+        for user in ptah.iter_keyset(
+                Session.query(User), User.id, batch_size=500):
+            ...
+    """
+    name = key.key
+    query = query.order_by(key)
+
+    while True:
+        q = query if start is None else query.filter(key > start)
+        rows = q.limit(batch_size).all()
+
+        for row in rows:
+            yield row
+
+        if len(rows) < batch_size:
+            break
+
+        start = getattr(rows[-1], name)
 
 
 def set_jsontype_serializer(serializer):
@@ -104,14 +185,24 @@ def set_jsontype_serializer(serializer):
 
 
 class JsonType(TypeDecorator):
-    """Represents an immutable structure as a json-encoded string."""
+    """Represents an immutable structure as a json-encoded string.
+
+    With `partial_updates` flag changes of mutable json columns
+    (see :py:func:`JsonDictType`) are written with dialect specific
+    json functions (SQLite json1, PostgreSQL 9.5+ jsonb) instead of
+    rewriting whole document.
+    """
 
     impl = TEXT
     serializer = json
+    container = None
 
     def __init__(self, serializer=None, *args, **kw):
         if serializer is not None:
             self.serializer = serializer
+        self.partial_updates = kw.pop('partial_updates', False)
+        if self.partial_updates:
+            _install_partial_updates()
         super(JsonType, self).__init__(*args, **kw)
 
     def process_bind_param(self, value, dialect):
@@ -122,66 +213,436 @@ class JsonType(TypeDecorator):
     def process_result_value(self, value, dialect):
         if value is not None:
             value = self.serializer.loads(value)
+            if self.container is not None and \
+                    isinstance(value, self.container.json_type):
+                value = self.container(value)
+                value._synced = True
         return value
 
 
-class MutationList(Mutable, list):
+def _track(value, parent, key):
+    cls = type(value)
+    if cls is TrackedDict or cls is TrackedList:
+        if value._tparent is not None and \
+                (value._tparent is not parent or value._tkey != key):
+            # already attached to other place, json has no references
+            value = cls(value)
+    elif isinstance(value, dict):
+        value = TrackedDict(value)
+    elif isinstance(value, list):
+        value = TrackedList(value)
+    else:
+        return value
 
-    @classmethod
-    def coerce(cls, key, value):
-        if not isinstance(value, MutationList):
-            if isinstance(value, list):
-                return MutationList(value)
-            return Mutable.coerce(key, value) # pragma: no cover
-        else:
-            return value # pragma: no cover
+    value._tparent = parent
+    value._tkey = key
+    return value
 
-    def append(self, value):
-        list.append(self, value)
-        self.changed()
+
+def _detach(value, parent):
+    if getattr(value, '_tparent', None) is parent:
+        value._tparent = None
+
+
+class TrackedDict(dict):
+    """ Dict which reports changes of nested values to its parent """
+
+    _tparent = None
+    _tkey = None
+
+    def __init__(self, *args, **kw):
+        dict.__init__(self, *args, **kw)
+        for key, value in list(dict.items(self)):
+            dict.__setitem__(self, key, _track(value, self, key))
+
+    def _changed(self, path):
+        if self._tparent is not None:
+            self._tparent._changed((self._tkey,) + path)
 
     def __setitem__(self, key, value):
-        list.__setitem__(self, key, value)
-        self.changed()
+        _detach(dict.get(self, key), self)
+        dict.__setitem__(self, key, _track(value, self, key))
+        self._changed((key,))
 
     def __delitem__(self, key):
-        list.__delitem__(self, key)
-        self.changed()
+        _detach(dict.get(self, key), self)
+        dict.__delitem__(self, key)
+        self._changed((key,))
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def update(self, *args, **kw):
+        for key, value in dict(*args, **kw).items():
+            self[key] = value
+
+    def pop(self, key, *default):
+        if key in self:
+            value = dict.pop(self, key)
+            _detach(value, self)
+            self._changed((key,))
+            return value
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        _detach(value, self)
+        self._changed((key,))
+        return key, value
+
+    def clear(self):
+        for value in dict.values(self):
+            _detach(value, self)
+        dict.clear(self)
+        self._changed(())
+
+
+class TrackedList(list):
+    """ List which reports changes of nested values to its parent,
+    structural changes (insert, remove, sort, etc) are reported
+    as change of whole list """
+
+    _tparent = None
+    _tkey = None
+
+    def __init__(self, *args):
+        list.__init__(self, *args)
+        self._reindex()
+
+    def _reindex(self, start=0):
+        seen = set()
+        for idx in range(start, len(self)):
+            value = list.__getitem__(self, idx)
+            if getattr(value, '_tparent', None) is self and \
+                    id(value) not in seen:
+                value._tkey = idx
+            else:
+                value = _track(value, self, idx)
+                list.__setitem__(self, idx, value)
+            seen.add(id(value))
+
+    def _changed(self, path):
+        if self._tparent is not None:
+            self._tparent._changed((self._tkey,) + path)
+
+    def _structure_changed(self, start=0):
+        self._reindex(start)
+        self._changed(())
+
+    def __setitem__(self, idx, value):
+        if isinstance(idx, slice):
+            list.__setitem__(self, idx, value)
+            self._structure_changed()
+        else:
+            idx = range(len(self))[idx]
+            _detach(list.__getitem__(self, idx), self)
+            list.__setitem__(self, idx, _track(value, self, idx))
+            self._changed((idx,))
+
+    def __delitem__(self, idx):
+        if not isinstance(idx, slice):
+            _detach(list.__getitem__(self, idx), self)
+        list.__delitem__(self, idx)
+        self._structure_changed()
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def __imul__(self, n):
+        list.__imul__(self, n)
+        self._structure_changed()
+        return self
+
+    def append(self, value):
+        list.append(self, _track(value, self, len(self)))
+        self._changed(())
+
+    def extend(self, values):
+        start = len(self)
+        list.extend(self, values)
+        self._structure_changed(start)
+
+    def insert(self, idx, value):
+        list.insert(self, idx, value)
+        self._structure_changed()
+
+    def pop(self, idx=-1):
+        value = list.pop(self, idx)
+        _detach(value, self)
+        self._structure_changed(len(self) if idx == -1 else 0)
+        return value
+
+    def remove(self, value):
+        idx = self.index(value)
+        _detach(list.__getitem__(self, idx), self)
+        list.__delitem__(self, idx)
+        self._structure_changed(idx)
+
+    def clear(self):
+        for value in self:
+            _detach(value, self)
+        list.__delitem__(self, slice(None))
+        self._changed(())
+
+    def sort(self, *args, **kw):
+        list.sort(self, *args, **kw)
+        self._structure_changed()
+
+    def reverse(self):
+        list.reverse(self)
+        self._structure_changed()
+
 
+class _MutationRoot(Mutable):
+    """ Root of tracked json document, records changed paths """
 
-class MutationDict(Mutable, dict):
+    json_type = None
+    _changes = None
+    #: value is same as in database
+    _synced = False
 
     @classmethod
     def coerce(cls, key, value):
-        if not isinstance(value, MutationDict):
-            if isinstance(value, dict):
-                return MutationDict(value)
-            return Mutable.coerce(key, value)  # pragma: no cover
+        if not isinstance(value, cls):
+            if isinstance(value, cls.json_type):
+                return cls(value)
+            return Mutable.coerce(key, value) # pragma: no cover
+        elif value._parents:
+            # value belongs to other object
+            return cls(value)
         else:
-            return value # pragma: no cover
+            return value
 
-    def __setitem__(self, key, value):
-        dict.__setitem__(self, key, value)
+    def _changed(self, path):
+        if self._changes is None:
+            self._changes = set()
+        self._changes.add(path)
         self.changed()
 
-    def __delitem__(self, key):
-        dict.__delitem__(self, key)
-        self.changed()
+    def changed_paths(self):
+        """ Return changed paths, nested paths of changed values
+        are omitted. Empty path means whole document. """
+        result = []
+        for path in sorted(self._changes or (), key=len):
+            if not any(path[:len(p)] == p for p in result):
+                result.append(path)
+        return result
+
+    def reset_changes(self):
+        self._changes = None
+
+    def __getstate__(self):
+        # values are pickled as dict or list items, parent objects
+        # are restored by sqlalchemy unpickle event
+        return {}
+
+    def __setstate__(self, state):
+        self._changes = None
+
+
+class MutationList(_MutationRoot, TrackedList):
+    """ Json list, tracks changes of nested dicts and lists """
 
+    json_type = list
 
-def JsonDictType(serializer=None):
+
+class MutationDict(_MutationRoot, TrackedDict):
+    """ Json dict, tracks changes of nested dicts and lists """
+
+    json_type = dict
+
+
+def JsonDictType(serializer=None, partial_updates=False):
     """
     function which returns a SQLA Column Type suitable to store a Json dict.
 
+    :param partial_updates: Write only changed values, if dialect
+       supports json functions
     :returns: ptah.sqla.MutationDict
     """
-    return MutationDict.as_mutable(JsonType(serializer=serializer))
+    tp = JsonType(serializer=serializer, partial_updates=partial_updates)
+    if partial_updates:
+        tp.container = MutationDict
+    return MutationDict.as_mutable(tp)
 
 
-def JsonListType(serializer=None):
+def JsonListType(serializer=None, partial_updates=False):
     """
     function which returns a SQLA Column Type suitable to store a Json array.
 
+    :param partial_updates: Write only changed values, if dialect
+       supports json functions
     :returns: ptah.sqla.MutationList
     """
-    return MutationList.as_mutable(JsonType(serializer=serializer))
+    tp = JsonType(serializer=serializer, partial_updates=partial_updates)
+    if partial_updates:
+        tp.container = MutationList
+    return MutationList.as_mutable(tp)
+
+
+_missing = object()
+
+
+def json_patch_ops(root):
+    """ Return list of (path, value) changes of tracked document,
+    value is `_missing` for removed keys. Return None if document
+    has to be written completely. """
+    ops = []
+    for path in root.changed_paths():
+        if not path:
+            return None
+
+        container = root
+        try:
+            for key in path[:-1]:
+                container = container[key]
+        except (KeyError, IndexError, TypeError):
+            # parent is removed or replaced
+            continue
+
+        key = path[-1]
+        if isinstance(container, dict):
+            if not isinstance(key, string_types):
+                return None
+            ops.append((path, container.get(key, _missing)))
+        elif isinstance(container, list) and 0 <= key < len(container):
+            ops.append((path, container[key]))
+
+    return ops
+
+
+def _sqlite_patch(column, ops, dumps):
+    expr = column
+    for path, value in ops:
+        jpath = ['$']
+        for key in path:
+            if isinstance(key, int):
+                jpath.append('[%d]' % key)
+            elif '"' in key:
+                return None
+            else:
+                jpath.append('."%s"' % key)
+        jpath = ''.join(jpath)
+
+        if value is _missing:
+            expr = func.json_remove(expr, jpath)
+        else:
+            expr = func.json_set(expr, jpath, func.json(dumps(value)))
+    return expr
+
+
+def _postgresql_patch(column, ops, dumps): # pragma: no cover
+    from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+
+    expr = cast(column, JSONB)
+    for path, value in ops:
+        jpath = literal([str(key) for key in path], ARRAY(Text))
+        if value is _missing:
+            expr = expr.op('#-')(jpath)
+        else:
+            expr = func.jsonb_set(
+                expr, jpath, cast(literal(dumps(value)), JSONB))
+    return cast(expr, Text)
+
+
+def _sqlite_supported(dialect):
+    try:
+        conn = dialect.dbapi.connect(':memory:')
+        try:
+            conn.execute("SELECT json_set('{}', '$.a', json('1'))")
+        finally:
+            conn.close()
+    except Exception: # pragma: no cover
+        return False
+    return True
+
+
+def _postgresql_supported(dialect): # pragma: no cover
+    return (dialect.server_version_info or ()) >= (9, 5)
+
+
+#: dialect name -> (supported check, patch expression builder)
+json_patchers = {
+    'sqlite': (_sqlite_supported, _sqlite_patch),
+    'postgresql': (_postgresql_supported, _postgresql_patch),
+}
+
+_dialects = weakref.WeakKeyDictionary()
+_mappers = weakref.WeakKeyDictionary()
+
+
+def _get_patcher(dialect):
+    try:
+        return _dialects[dialect]
+    except KeyError:
+        supported, patcher = json_patchers.get(dialect.name, (None, None))
+        if supported is None or not supported(dialect):
+            patcher = None
+        _dialects[dialect] = patcher
+        return patcher
+
+
+def _partial_attrs(mapper):
+    try:
+        return _mappers[mapper]
+    except KeyError:
+        attrs = []
+        if mapper.version_id_col is None:
+            for prop in mapper.column_attrs:
+                column = prop.columns[0]
+                if isinstance(column.type, JsonType) and \
+                        column.type.partial_updates and \
+                        all(c.table is column.table
+                            for c in mapper.primary_key):
+                    attrs.append((prop.key, column))
+        _mappers[mapper] = attrs
+        return attrs
+
+
+def _partial_updates(session, flush_context, instances):
+    for ob in session.dirty:
+        state = inspect(ob)
+        mapper = state.mapper
+        attrs = _partial_attrs(mapper)
+        if not attrs:
+            continue
+
+        patcher = _get_patcher(session.get_bind(mapper).dialect)
+
+        for key, column in attrs:
+            value = state.dict.get(key)
+            if not isinstance(value, _MutationRoot) or not value._changes:
+                continue
+
+            expr = ops = None
+            if patcher is not None and value._synced:
+                ops = json_patch_ops(value)
+                if ops:
+                    expr = patcher(column, ops, column.type.serializer.dumps)
+
+            value.reset_changes()
+            value._synced = True
+
+            if expr is not None:
+                pk = mapper.primary_key_from_instance(ob)
+                session.execute(
+                    column.table.update()
+                    .where(and_(*[c == v for c, v in
+                                  zip(mapper.primary_key, pk)]))
+                    .values({column.name: expr}), mapper=mapper)
+
+            if ops is not None and (expr is not None or not ops):
+                # column is up to date, exclude it from orm update
+                attributes.set_committed_value(ob, key, value)
+
+
+def _install_partial_updates():
+    if not event.contains(orm.Session, 'before_flush', _partial_updates):
+        event.listen(orm.Session, 'before_flush', _partial_updates)
@@ -1,3 +1,9 @@
+import os
+import time
+import shutil
+import tempfile
+import sqlalchemy as sqla
+import ptah
 from ptah.testing import PtahTestCase
 from pyramid import testing
 
@@ -10,6 +16,16 @@ class Principal(object):
         self.login = login
 
 
+class SqlPrincipal(ptah.get_base()):
+    __tablename__ = 'test_auth_principals'
+
+    id = sqla.Column(sqla.Integer, primary_key=True)
+    __uri__ = sqla.Column('uri', sqla.String(128), unique=True)
+    name = sqla.Column(sqla.Unicode(255))
+    login = sqla.Column(sqla.Unicode(255))
+    properties = sqla.Column(ptah.JsonDictType(), default={})
+
+
 class TestAuthentication(PtahTestCase):
 
     _init_ptah = False
@@ -229,6 +245,267 @@ class TestAuthentication(PtahTestCase):
         self.assertEqual(
             ptah.auth_service.get_principal_bylogin('user'), principal)
 
+    def test_auth_rehash_password(self):
+        import ptah
+
+        principal = Principal('test-schema:1', 'user', 'user')
+        principal.password = '{plain}12345'
+        changed = []
+
+        class Provider(object):
+            def authenticate(self, creds):
+                if ptah.pwd_tool.check(principal.password, creds['password']):
+                    return principal
+
+        @ptah.password_changer('test-schema')
+        def changer(principal, password):
+            changed.append(password)
+            principal.password = password
+
+        ptah.auth_provider.register('test-provider', Provider)
+        self.init_ptah()
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH, self.registry)
+        cfg['pwd_manager'] = 'pbkdf2'
+        cfg['pwd_pbkdf2_iterations'] = 1000
+
+        # wrong password
+        info = ptah.auth_service.authenticate(
+            {'login': 'user', 'password': '1'})
+        self.assertFalse(info.status)
+        self.assertEqual(principal.password, '{plain}12345')
+
+        # outdated password manager
+        info = ptah.auth_service.authenticate(
+            {'login': 'user', 'password': '12345'})
+        self.assertTrue(info.status)
+        self.assertTrue(principal.password.startswith('{pbkdf2}sha256$1000$'))
+        self.assertTrue(ptah.pwd_tool.check(principal.password, '12345'))
+
+        # up to date
+        info = ptah.auth_service.authenticate(
+            {'login': 'user', 'password': '12345'})
+        self.assertTrue(info.status)
+        self.assertEqual(len(changed), 1)
+
+    def test_auth_rehash_password_error(self):
+        import ptah
+
+        principal = Principal('test-schema:1', 'user', 'user')
+        principal.password = '{plain}12345'
+
+        class Provider(object):
+            def authenticate(self, creds):
+                return principal
+
+        @ptah.password_changer('test-schema')
+        def changer(principal, password):
+            raise ValueError()
+
+        ptah.auth_provider.register('test-provider', Provider)
+        self.init_ptah()
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH, self.registry)
+        cfg['pwd_manager'] = 'ssha'
+
+        info = ptah.auth_service.authenticate(
+            {'login': 'user', 'password': '12345'})
+        self.assertTrue(info.status)
+        self.assertEqual(principal.password, '{plain}12345')
+
+
+class TestAuthRouter(PtahTestCase):
+
+    _init_ptah = False
+
+    def _register(self):
+        import ptah
+        from ptah.authentication import UNKNOWN_LOGIN
+
+        calls = []
+
+        def provider(pname, logins):
+            class Provider(object):
+                def authenticate(self, creds):
+                    calls.append((pname, creds['login']))
+                    if creds['login'] not in logins:
+                        return UNKNOWN_LOGIN
+                    if creds.get('password') != 'invalid':
+                        return Principal(creds['login'], 'user', 'user')
+
+                def get_principal_bylogin(self, login):
+                    calls.append((pname, login))
+                    if login in logins:
+                        return Principal(login, 'user', login)
+            return Provider
+
+        ptah.auth_provider.register(
+            'ldap', provider('ldap', ['user@corp.com']),
+            route='*@CORP.com')
+        ptah.auth_provider.register(
+            'admin', provider('admin', ['admin-1']),
+            route=('admin-*', '*@admin.*'))
+        ptah.auth_provider.register(
+            'sql', provider('sql', ['user', 'user@other.com']))
+        self.init_ptah()
+
+        return calls
+
+    def test_auth_router(self):
+        import ptah
+
+        calls = self._register()
+
+        info = ptah.auth_service.authenticate({'login': 'user@corp.com'})
+        self.assertTrue(info.status)
+        self.assertEqual(calls, [('ldap', 'user@corp.com')])
+
+        del calls[:]
+        info = ptah.auth_service.authenticate({'login': 'admin-1'})
+        self.assertTrue(info.status)
+        self.assertEqual(calls, [('admin', 'admin-1')])
+
+        del calls[:]
+        info = ptah.auth_service.authenticate({'login': 'user@other.com'})
+        self.assertTrue(info.status)
+        self.assertEqual(calls, [('sql', 'user@other.com')])
+
+        del calls[:]
+        info = ptah.auth_service.authenticate({'login': 'user@admin.org'})
+        self.assertFalse(info.status)
+        self.assertEqual(calls, [('admin', 'user@admin.org')])
+
+        # no login, all providers
+        del calls[:]
+        info = ptah.auth_service.authenticate({'login': ''})
+        self.assertFalse(info.status)
+        self.assertEqual(len(calls), 3)
+
+        del calls[:]
+        p = ptah.auth_service.get_principal_bylogin('user@corp.com')
+        self.assertEqual(p.login, 'user@corp.com')
+        self.assertEqual(calls, [('ldap', 'user@corp.com')])
+
+    def test_auth_router_stats(self):
+        import ptah
+        from ptah.authentication import get_auth_router
+
+        self._register()
+
+        ptah.auth_service.authenticate({'login': 'user@corp.com'})
+        ptah.auth_service.get_principal_bylogin('user@corp.com')
+        ptah.auth_service.authenticate({'login': 'user'})
+
+        info = get_auth_router().info()
+        self.assertEqual(sorted(info), ['ldap', 'sql'])
+        self.assertEqual(info['ldap']['calls'], 2)
+        self.assertEqual(info['sql']['calls'], 1)
+        self.assertGreaterEqual(info['ldap']['max'], info['ldap']['avg'])
+
+        get_auth_router().stats['ldap'].reset()
+        self.assertEqual(
+            get_auth_router().info()['ldap'],
+            {'calls': 0, 'total': 0.0, 'avg': 0.0, 'max': 0.0})
+
+    def test_auth_negative_cache(self):
+        import ptah
+        from ptah.authentication import get_auth_router
+
+        calls = self._register()
+        router = get_auth_router()
+
+        # disabled
+        self.assertIsNone(ptah.auth_service.get_principal_bylogin('unknown'))
+        self.assertEqual(len(router.negative), 0)
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH, self.registry)
+        cfg['auth_negative_cache_ttl'] = 60
+
+        self.assertIsNone(ptah.auth_service.get_principal_bylogin('unknown'))
+        self.assertTrue(router.is_unknown('unknown'))
+        self.assertEqual(router.negative.ttl, 60)
+
+        del calls[:]
+        self.assertIsNone(ptah.auth_service.get_principal_bylogin('unknown'))
+        info = ptah.auth_service.authenticate({'login': 'unknown'})
+        self.assertFalse(info.status)
+        self.assertEqual(calls, [])
+
+        # expired
+        router.negative.data['unknown'] = (True, 0)
+        self.assertFalse(router.is_unknown('unknown'))
+        self.assertEqual(len(router.negative), 0)
+
+        # new principal
+        router.set_unknown('unknown', 60)
+        self.registry.notify(ptah.events.PrincipalAddedEvent(
+            Principal('1', 'user', 'unknown')))
+        self.assertFalse(router.is_unknown('unknown'))
+
+        router.set_unknown('unknown', 60)
+        self.registry.notify(ptah.events.PrincipalRegisteredEvent(
+            Principal('1', 'user', 'unknown')))
+        self.assertFalse(router.is_unknown('unknown'))
+
+        router.set_unknown('unknown', 60)
+        self.registry.notify(ptah.events.PrincipalModifiedEvent(
+            Principal('1', 'user', 'unknown')))
+        self.assertFalse(router.is_unknown('unknown'))
+
+        # least recently used logins are evicted
+        router.negative_size = 2
+        router.set_unknown('l1', 60)
+        router.set_unknown('l2', 60)
+        router.set_unknown('l3', 60)
+        self.assertEqual(list(router.negative.data), ['l2', 'l3'])
+
+
+    def test_auth_negative_cache_authenticate(self):
+        import ptah
+        from ptah.authentication import get_auth_router
+
+        calls = self._register()
+        router = get_auth_router()
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH, self.registry)
+        cfg['auth_negative_cache_ttl'] = 60
+
+        info = ptah.auth_service.authenticate(
+            {'login': 'unknown', 'password': '12345'})
+        self.assertFalse(info.status)
+        self.assertTrue(router.is_unknown('unknown'))
+
+        # login is remembered without additional lookups
+        self.assertEqual(calls, [('sql', 'unknown')])
+
+        # failed logins do not reach providers
+        del calls[:]
+        info = ptah.auth_service.authenticate(
+            {'login': 'unknown', 'password': '12345'})
+        self.assertFalse(info.status)
+        self.assertEqual(calls, [])
+
+        # invalid password of known login
+        info = ptah.auth_service.authenticate(
+            {'login': 'user', 'password': 'invalid'})
+        self.assertFalse(info.status)
+        self.assertFalse(router.is_unknown('user'))
+
+        # provider without unknown login result
+        router.forget('unknown')
+        del calls[:]
+        from ptah.authentication import AUTH_PROVIDER_ID
+        providers = ptah.get_cfg_storage(AUTH_PROVIDER_ID)
+        providers['sql'].authenticate = lambda creds: None
+        info = ptah.auth_service.authenticate(
+            {'login': 'unknown', 'password': '12345'})
+        self.assertFalse(router.is_unknown('unknown'))
+        del providers['sql'].authenticate
+
+        info = ptah.auth_service.authenticate(
+            {'login': 'user', 'password': '12345'})
+        self.assertTrue(info.status)
+
 
 class TestPrincipalSearcher(PtahTestCase):
 
@@ -262,6 +539,391 @@ class TestPrincipalSearcher(PtahTestCase):
         self.assertEqual(list(ptah.search_principals('user')), [principal])
 
 
+class TestSearchPrincipals(PtahTestCase):
+
+    _init_ptah = False
+
+    def _register(self, slow=0):
+        import time
+        import ptah
+        from pyramid.threadlocal import get_current_registry
+
+        p1 = Principal('1', 'user1', 'user1')
+        p2 = Principal('2', 'user2', 'user2')
+        p3 = Principal('3', 'user3', 'user3')
+        registries = []
+
+        def search1(term):
+            registries.append(get_current_registry())
+            yield p1
+            yield p2
+
+        def search2(term):
+            time.sleep(slow)
+            yield p2
+            yield p3
+
+        def search3(term):
+            raise ValueError()
+            yield p1 # pragma: no cover
+
+        ptah.principal_searcher.register('search1', search1)
+        ptah.principal_searcher.register('search2', search2)
+        self.init_ptah()
+
+        return (p1, p2, p3), registries, search3
+
+    def test_search_principals_limit(self):
+        import ptah
+        from ptah.authentication import get_search_stats
+
+        (p1, p2, p3), registries, s = self._register()
+
+        self.assertEqual(list(ptah.search_principals('user')), [p1, p2, p3])
+        self.assertEqual(
+            list(ptah.search_principals('user', limit=2)), [p1, p2])
+        self.assertEqual(
+            list(ptah.search_principals('user', offset=1)), [p2, p3])
+        self.assertEqual(
+            list(ptah.search_principals('user', limit=1, offset=2)), [p3])
+        self.assertEqual(list(ptah.search_principals('user', limit=0)), [])
+
+        stats = get_search_stats('search1').info()
+        self.assertEqual(stats['calls'], 4)
+        self.assertEqual(stats['timeouts'], 0)
+
+        get_search_stats('search1').reset()
+        self.assertEqual(get_search_stats('search1').info()['calls'], 0)
+
+    def test_search_principals_concurrent(self):
+        import ptah
+
+        (p1, p2, p3), registries, s = self._register()
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH, self.registry)
+        cfg['search_workers'] = 2
+
+        result = list(ptah.search_principals('user'))
+        self.assertEqual(len(result), 3)
+        self.assertEqual(set(result), set([p1, p2, p3]))
+        self.assertEqual(registries, [self.registry])
+
+        self.assertEqual(len(list(ptah.search_principals('user', limit=2))), 2)
+
+    def test_search_principals_timeout(self):
+        import ptah
+        from ptah.authentication import get_search_stats
+
+        (p1, p2, p3), registries, s = self._register(slow=0.5)
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH, self.registry)
+        cfg['search_workers'] = 2
+        cfg['search_timeout'] = 100
+
+        self.assertEqual(list(ptah.search_principals('user')), [p1, p2])
+        self.assertEqual(get_search_stats('search2').timeouts, 1)
+        self.assertEqual(get_search_stats('search1').timeouts, 0)
+        self.assertEqual(get_search_stats('search2').info()['hung'], 1)
+
+        # searcher is skipped while timed out call is running
+        self.assertEqual(list(ptah.search_principals('user')), [p1, p2])
+        self.assertEqual(get_search_stats('search2').timeouts, 2)
+        self.assertEqual(get_search_stats('search2').info()['calls'], 0)
+
+        time.sleep(0.6)
+        self.assertEqual(get_search_stats('search2').hung, 0)
+        self.assertEqual(get_search_stats('search2').info()['calls'], 1)
+
+    def test_search_principals_timeout_per_searcher(self):
+        import ptah
+        from ptah.authentication import get_search_stats
+
+        p1 = Principal('1', 'user1', 'user1')
+        p2 = Principal('2', 'user2', 'user2')
+
+        def search1(term):
+            time.sleep(0.15)
+            yield p1
+
+        def search2(term):
+            time.sleep(0.15)
+            yield p2
+
+        ptah.principal_searcher.register('search1', search1)
+        ptah.principal_searcher.register('search2', search2)
+        self.init_ptah()
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH, self.registry)
+        cfg['search_workers'] = 1
+        cfg['search_timeout'] = 250
+
+        # timeout is counted from searcher start, not from search start
+        self.assertEqual(list(ptah.search_principals('user')), [p1, p2])
+        self.assertEqual(get_search_stats('search2').timeouts, 0)
+
+    def test_search_principals_error(self):
+        import ptah
+        from ptah.authentication import AUTH_SEARCHER_ID
+
+        (p1, p2, p3), registries, search3 = self._register()
+        ptah.get_cfg_storage(AUTH_SEARCHER_ID)['search3'] = search3
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH, self.registry)
+        cfg['search_workers'] = 3
+
+        self.assertEqual(
+            set(ptah.search_principals('user')), set([p1, p2, p3]))
+
+
+class TestSearchPrincipalsSession(PtahTestCase):
+
+    _init_ptah = False
+
+    def setUp(self):
+        # searchers run in other threads, in-memory database is per thread
+        self.dir = tempfile.mkdtemp()
+        self._settings = {'sqlalchemy.url': 'sqlite:///%s' % os.path.join(
+            self.dir, 'test.db')}
+        super(TestSearchPrincipalsSession, self).setUp()
+
+    def tearDown(self):
+        import transaction
+        transaction.abort()
+        super(TestSearchPrincipalsSession, self).tearDown()
+        engine = ptah.get_base().metadata.bind
+        if engine is not None:
+            engine.dispose()
+        shutil.rmtree(self.dir)
+
+    def test_search_principals_attached(self):
+        import transaction
+
+        def search1(term):
+            return ptah.get_session().query(SqlPrincipal)\
+                .filter(SqlPrincipal.login.startswith(term))
+
+        def search2(term):
+            return []
+
+        ptah.principal_searcher.register('search1', search1)
+        ptah.principal_searcher.register('search2', search2)
+        self.init_ptah()
+
+        Session = ptah.get_session()
+        Session.add(SqlPrincipal(
+            __uri__='test-principal:1', name='User', login='user'))
+        transaction.commit()
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH, self.registry)
+        for workers in (0, 2):
+            cfg['search_workers'] = workers
+
+            principal, = ptah.search_principals('user')
+            self.assertIn(principal, Session)
+            self.assertIs(principal, Session.query(SqlPrincipal).one())
+            self.assertEqual(principal.name, 'User')
+            transaction.abort()
+
+
+class TestPrincipalCache(PtahTestCase):
+
+    _init_ptah = False
+
+    def _register(self):
+        resolved = []
+
+        @ptah.resolver('test-principal')
+        def resolver(uri):
+            resolved.append(uri)
+            return ptah.get_session().query(SqlPrincipal)\
+                .filter(SqlPrincipal.__uri__ == uri).first()
+
+        self.init_ptah()
+
+        Session = ptah.get_session()
+        Session.add(SqlPrincipal(
+            __uri__='test-principal:1', name='User', login='user'))
+        Session.flush()
+        Session.expunge_all()
+
+        ptah.get_settings(ptah.CFG_ID_PTAH)['principal_cache_ttl'] = 60
+        return resolved
+
+    def test_principal_cache_disabled(self):
+        from ptah.authentication import get_principal_cache
+
+        resolved = self._register()
+        ptah.get_settings(ptah.CFG_ID_PTAH)['principal_cache_ttl'] = 0
+
+        self.assertIsNone(get_principal_cache())
+        ptah.resolve_principal('test-principal:1')
+        ptah.resolve_principal('test-principal:1')
+        self.assertEqual(len(resolved), 2)
+
+    def test_principal_cache(self):
+        from ptah.authentication import get_principal_cache
+
+        resolved = self._register()
+        Session = ptah.get_session()
+
+        p1 = ptah.resolve_principal('test-principal:1')
+        self.assertIs(ptah.resolve_principal('test-principal:1'), p1)
+        self.assertEqual(resolved, ['test-principal:1'])
+
+        # new session gets its own instance without resolver call
+        Session.expunge_all()
+        p2 = ptah.resolve_principal('test-principal:1')
+        self.assertIsNot(p2, p1)
+        self.assertIn(p2, Session)
+        self.assertEqual((p2.name, p2.login), ('User', 'user'))
+        self.assertEqual(resolved, ['test-principal:1'])
+
+        # changes are tracked by session
+        p2.name = 'Other'
+        Session.flush()
+        Session.expunge_all()
+        self.assertEqual(
+            Session.query(SqlPrincipal.name).scalar(), 'Other')
+
+        self.assertIsNone(ptah.resolve_principal('test-principal:2'))
+        self.assertIsNone(ptah.resolve_principal(None))
+
+        info = get_principal_cache().info()
+        self.assertEqual(info['size'], 1)
+        self.assertEqual(info['ttl'], 60)
+
+    def test_principal_cache_json_column(self):
+        from ptah.authentication import get_principal_cache
+
+        resolved = self._register()
+        Session = ptah.get_session()
+
+        p1 = ptah.resolve_principal('test-principal:1')
+        p1.properties['roles'] = {'site': ['Manager']}
+        Session.flush()
+        Session.expunge_all()
+        get_principal_cache().invalidate()
+
+        ptah.resolve_principal('test-principal:1')
+        Session.expunge_all()
+        p2 = ptah.resolve_principal('test-principal:1')
+        self.assertEqual(len(resolved), 2)
+        self.assertEqual(p2.properties, {'roles': {'site': ['Manager']}})
+
+        # json changes are tracked
+        p2.properties['roles']['site'].append('Editor')
+        Session.flush()
+        Session.expunge_all()
+        self.assertEqual(
+            Session.query(SqlPrincipal.properties).scalar(),
+            {'roles': {'site': ['Manager', 'Editor']}})
+
+    def test_principal_cache_fresh(self):
+        resolved = self._register()
+        Session = ptah.get_session()
+
+        ptah.resolve_principal('test-principal:1')
+        Session.expunge_all()
+
+        # changes made outside of session are visible
+        Session.execute(
+            SqlPrincipal.__table__.update().values(name='Other'))
+        self.assertEqual(
+            ptah.resolve_principal('test-principal:1').name, 'Other')
+        self.assertEqual(len(resolved), 1)
+
+        # deleted principal
+        Session.expunge_all()
+        Session.execute(SqlPrincipal.__table__.delete())
+        self.assertIsNone(ptah.resolve_principal('test-principal:1'))
+        self.assertIsNone(ptah.resolve_principal('test-principal:1'))
+        self.assertEqual(len(resolved), 2)
+
+    def test_principal_cache_settings(self):
+        from ptah.authentication import get_principal_cache
+
+        self._register()
+        cache = get_principal_cache()
+        self.assertEqual(cache.info()['ttl'], 60)
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH, self.registry)
+        cfg['principal_cache_ttl'] = 120
+        cfg['principal_cache_size'] = 5
+        self.assertEqual(get_principal_cache().info()['ttl'], 60)
+
+        self.registry.notify(ptah.events.SettingsGroupModified(cfg))
+        self.assertIs(get_principal_cache(), cache)
+        self.assertEqual(cache.info()['ttl'], 120)
+        self.assertEqual(cache.info()['maxsize'], 5)
+
+    def test_principal_cache_invalidate(self):
+        from ptah import events
+
+        resolved = self._register()
+
+        p1 = ptah.resolve_principal('test-principal:1')
+        for event in (events.PrincipalModifiedEvent,
+                      events.PrincipalPasswordChangedEvent,
+                      events.PrincipalDeletingEvent):
+            self.registry.notify(event(p1))
+            ptah.resolve_principal('test-principal:1')
+
+        self.registry.notify(events.UriInvalidateEvent('test-principal:1'))
+        ptah.resolve_principal('test-principal:1')
+        ptah.resolve_principal('test-principal:1')
+        self.assertEqual(len(resolved), 5)
+
+    def test_principal_cache_modified(self):
+        resolved = self._register()
+
+        Session = ptah.get_session()
+        ptah.resolve_principal('test-principal:1').name = 'Other'
+
+        # principal is loaded through session identity map
+        self.assertEqual(
+            ptah.resolve_principal('test-principal:1').name, 'Other')
+        Session.expunge_all()
+        self.assertEqual(
+            ptah.resolve_principal('test-principal:1').name, 'User')
+        self.assertEqual(len(resolved), 1)
+
+    def test_principal_cache_pending(self):
+        principal = SqlPrincipal(
+            __uri__='test-principal:2', name='User', login='user')
+        resolved = []
+
+        @ptah.resolver('test-principal')
+        def resolver(uri):
+            resolved.append(uri)
+            return principal
+
+        self.init_ptah()
+        ptah.get_settings(ptah.CFG_ID_PTAH)['principal_cache_ttl'] = 60
+
+        # pending principal is not cached
+        self.assertIs(ptah.resolve_principal('test-principal:2'), principal)
+        self.assertIs(ptah.resolve_principal('test-principal:2'), principal)
+        self.assertEqual(len(resolved), 2)
+
+    def test_principal_cache_not_mapped(self):
+        principal = Principal('test:1', 'user', 'user')
+        resolved = []
+
+        @ptah.resolver('test')
+        def resolver(uri):
+            resolved.append(uri)
+            return principal
+
+        self.init_ptah()
+        ptah.get_settings(ptah.CFG_ID_PTAH)['principal_cache_ttl'] = 60
+
+        ptah.auth_service.set_userid('test:1')
+        self.assertIs(ptah.auth_service.get_current_principal(), principal)
+        self.assertIs(ptah.auth_service.get_current_principal(), principal)
+        self.assertIs(ptah.resolve_principal('test:1'), principal)
+        self.assertEqual(resolved, ['test:1'])
+
+
 class TestSuperUser(PtahTestCase):
 
     _init_ptah = False
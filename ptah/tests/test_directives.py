@@ -1,12 +1,20 @@
 """ directives tests """
+import os
 import sys
+import shutil
+import json
+import pickle
+import tempfile
 from pyramid import testing
 
 from zope import interface
 from zope.interface.interfaces import IObjectEvent
 
+import sqlalchemy as sqla
+
+import ptah
 from ptah import config
-from ptah.testing import TestCase
+from ptah.testing import TestCase, PtahTestCase
 
 
 class BaseTesting(TestCase):
@@ -113,3 +121,684 @@ class TestExtraDirective(BaseTesting):
         self.assertRaises(TypeError, info.attach, action)
         self.assertEqual('<Action "test">', repr(action))
         self.assertIn('test_action\n', repr(info), '')
+
+
+class TestProfiler(PtahTestCase):
+
+    _init_ptah = False
+    _init_static = False
+    _settings = {'sqlalchemy.url': 'sqlite://',
+                 'ptah.profile_startup': 'true'}
+
+    def tearDown(self):
+        config.enable_profiler(False)
+        super(TestProfiler, self).tearDown()
+
+    def test_profiler_disabled(self):
+        self.assertIsNone(config.get_profiler())
+
+        with config.profile('step', 'test'):
+            pass
+
+        @config.profiled('step', 'test')
+        def func(arg):
+            return arg
+
+        self.assertEqual(func(1), 1)
+        self.assertIsNone(config.get_profiler())
+
+    def test_profiler(self):
+        import ptah
+
+        # directives are attached during import
+        config.enable_profiler()
+
+        @ptah.resolver('test-profiler')
+        def resolver(uri): # pragma: no cover
+            pass
+
+        self.init_ptah()
+
+        profiler = config.get_profiler()
+        self.assertIsNotNone(profiler)
+
+        summary = profiler.summary()
+        for kind in ('scan', 'directive', 'action', 'step'):
+            self.assertIn(kind, summary)
+            self.assertIn(kind, profiler.kinds())
+
+        scans = [rec['name'] for rec in profiler.report('scan')]
+        self.assertIn('ptah.authentication', scans)
+        self.assertIn('ptah.settings', scans)
+
+        directives = dict(
+            (rec['name'], rec) for rec in profiler.report('directive'))
+        self.assertEqual(directives['ptah:resolver']['calls'], 1)
+        self.assertIn('init_settings',
+                      [rec['name'] for rec in profiler.report('step')])
+
+        actions = dict(
+            (rec['name'], rec) for rec in profiler.report('action'))
+        self.assertGreaterEqual(actions['ptah:resolver']['calls'], 2)
+        self.assertGreaterEqual(
+            actions['ptah:resolver']['total'],
+            actions['ptah:resolver']['max'])
+
+        report = profiler.report()
+        self.assertEqual(
+            report, sorted(report, key=lambda r: r['total'], reverse=True))
+
+        slowest = profiler.slowest_actions()
+        self.assertEqual(len(slowest), profiler.slowest_size)
+        elapsed = [item[0] for item in slowest]
+        self.assertEqual(elapsed, sorted(elapsed, reverse=True))
+
+        profiler.clear()
+        self.assertEqual(profiler.report(), [])
+        self.assertEqual(profiler.slowest_actions(), [])
+
+    def test_profiled(self):
+        profiler = config.enable_profiler()
+
+        @config.profiled('step', 'test')
+        def func(arg):
+            return arg
+
+        self.assertEqual(func(1), 1)
+        with config.profile('populate', 'step'):
+            pass
+
+        self.assertEqual(
+            [(rec['kind'], rec['name'], rec['calls'])
+             for rec in profiler.report()
+             if rec['name'] in ('test', 'step')],
+            [('step', 'test', 1), ('populate', 'step', 1)])
+
+
+def snapshot_resolver(uri):
+    return uri
+
+
+class TestConfigSnapshot(PtahTestCase):
+
+    _init_ptah = False
+    _init_static = False
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'snapshot')
+        self._settings = {'sqlalchemy.url': 'sqlite://',
+                          'ptah.config_snapshot': self.path}
+        super(TestConfigSnapshot, self).setUp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        super(TestConfigSnapshot, self).tearDown()
+
+    def _read(self):
+        with open(self.path) as f:
+            return json.load(f)
+
+    def _write(self, data):
+        with open(self.path, 'w') as f:
+            json.dump(data, f)
+
+    def _restart(self):
+        from pyramid import testing
+
+        testing.tearDown()
+        self.init_pyramid()
+        self.init_ptah()
+        return self.registry.__ptah_snapshot__
+
+    def test_snapshot(self):
+        import ptah
+        from ptah.uri import ID_RESOLVER
+
+        ptah.resolver.register('test-snapshot', snapshot_resolver)
+        self.init_ptah()
+
+        snapshot = self.registry.__ptah_snapshot__
+        self.assertEqual(snapshot.restored, {})
+        self.assertIn(ID_RESOLVER, snapshot.executed)
+
+        from pyramid.events import ApplicationCreated
+        from ptah.ptahsettings import save_config_snapshot
+
+        save_config_snapshot(
+            ApplicationCreated(testing.DummyResource(registry=self.registry)))
+        self.assertTrue(os.path.exists(self.path))
+        self.assertIsNone(self.registry.__ptah_snapshot__)
+
+        # restored storages, actions are not executed
+        snapshot = self._restart()
+        self.assertIn('test-snapshot', snapshot.restored[ID_RESOLVER])
+        self.assertIn('ptah-auth', snapshot.claimed[ID_RESOLVER])
+        self.assertNotIn(ID_RESOLVER, snapshot.executed)
+        self.assertEqual(ptah.resolve('test-snapshot:1'), 'test-snapshot:1')
+        self.assertIsNotNone(ptah.resolve(ptah.SUPERUSER_URI))
+
+        # snapshot is up to date
+        mtime = os.stat(self.path).st_mtime
+        os.utime(self.path, (mtime - 10, mtime - 10))
+        ptah.config.save_snapshot(self.registry)
+        self.assertEqual(os.stat(self.path).st_mtime, mtime - 10)
+
+    def test_snapshot_stale_entries(self):
+        import ptah
+        from ptah.uri import ID_RESOLVER
+
+        self.init_ptah()
+        ptah.config.save_snapshot(self.registry)
+
+        data = self._read()
+        data['storages'][ID_RESOLVER]['removed'] = [
+            __name__, 'snapshot_resolver']
+        self._write(data)
+
+        snapshot = self._restart()
+        self.assertIn('removed', snapshot.restored[ID_RESOLVER])
+        ptah.config.save_snapshot(self.registry)
+        self.assertNotIn('removed', ptah.get_cfg_storage(ID_RESOLVER))
+
+        self.assertNotIn('removed', self._read()['storages'][ID_RESOLVER])
+
+    def test_snapshot_module_objects(self):
+        import ptah
+        from ptah import password, security, token
+
+        self.init_ptah()
+        ptah.config.save_snapshot(self.registry)
+
+        data = self._read()
+        self.assertEqual(
+            data['storages'][security.ID_ROLE]['Everyone'],
+            ['ptah.security', 'Everyone'])
+
+        snapshot = self._restart()
+        self.assertIn(security.ID_ROLE, snapshot.restored)
+        self.assertIn(security.ID_PERMISSION, snapshot.restored)
+        self.assertIn(token.ID_TOKEN_TYPE, snapshot.restored)
+
+        roles = ptah.get_cfg_storage(security.ID_ROLE)
+        self.assertIs(roles['Everyone'], ptah.Everyone)
+        self.assertIs(roles['Authenticated'], ptah.Authenticated)
+        self.assertIs(roles['Owner'], ptah.Owner)
+        self.assertIs(
+            ptah.get_cfg_storage(security.ID_PERMISSION)['__not_allowed__'],
+            ptah.NOT_ALLOWED)
+        self.assertIs(
+            ptah.get_cfg_storage(token.ID_TOKEN_TYPE)[password.TOKEN_TYPE.id],
+            password.TOKEN_TYPE)
+
+    def test_snapshot_not_module_object(self):
+        from ptah.uri import ID_RESOLVER
+
+        self.init_ptah()
+        storage = ptah.get_cfg_storage(ID_RESOLVER)
+        storage['ptah-auth'] = lambda uri: uri
+        ptah.config.save_snapshot(self.registry)
+
+        self.assertNotIn(ID_RESOLVER, self._read()['storages'])
+
+    def test_snapshot_unpicklable(self):
+        import ptah
+        from ptah.uri import ID_RESOLVER
+        from ptah.security import ID_PERMISSION
+
+        @ptah.resolver('test-local')
+        def resolver(uri):
+            return uri
+
+        self.init_ptah()
+        ptah.config.save_snapshot(self.registry)
+
+        snapshot = self._restart()
+        self.assertNotIn(ID_RESOLVER, snapshot.restored)
+        self.assertIn(ID_PERMISSION, snapshot.restored)
+        self.assertIn(ID_RESOLVER, snapshot.executed)
+        self.assertEqual(ptah.resolve('test-local:1'), 'test-local:1')
+
+    def test_snapshot_not_populated_by_action(self):
+        import ptah
+        from ptah.uri import ID_RESOLVER
+
+        self.init_ptah()
+        ptah.get_cfg_storage(ID_RESOLVER)['not-action'] = lambda uri: uri
+        ptah.config.save_snapshot(self.registry)
+
+        snapshot = self._restart()
+        self.assertIn(ID_RESOLVER, snapshot.restored)
+        self.assertNotIn('not-action', snapshot.restored[ID_RESOLVER])
+
+    def test_snapshot_sqla_type(self):
+        import ptah
+        from ptah.uri import ID_RESOLVER
+
+        @ptah.tinfo('snapshot-sqla', 'Snapshot')
+        class SnapshotContent(ptah.get_base()):
+            __tablename__ = 'test_snapshot_content'
+            id = sqla.Column(sqla.Integer, primary_key=True)
+
+        self.init_ptah()
+        self.assertIn('snapshot-sqla', ptah.get_cfg_storage(ID_RESOLVER))
+        ptah.config.save_snapshot(self.registry)
+
+        # resolver of sqla type is not saved, storage is restored
+        snapshot = self._restart()
+        self.assertIn(ID_RESOLVER, snapshot.restored)
+        self.assertNotIn(ID_RESOLVER, snapshot.executed)
+        self.assertNotIn('snapshot-sqla', snapshot.restored[ID_RESOLVER])
+        self.assertIn('snapshot-sqla', ptah.get_cfg_storage(ID_RESOLVER))
+
+    def test_snapshot_sources(self):
+        import ptah
+
+        @ptah.resolver('test-sources')
+        def resolver(uri): # pragma: no cover
+            return uri
+
+        self.init_ptah()
+        ptah.config.save_snapshot(self.registry)
+
+        data = self._read()
+        self.assertIn(sys.modules[__name__].__file__, data['sources'])
+        self.assertIn(ptah.security.__file__, data['sources'])
+
+        # changed module
+        filename = sys.modules[__name__].__file__
+        data['sources'][filename] = [0, 0]
+        self._write(data)
+
+        snapshot = self._restart()
+        self.assertEqual(snapshot.restored, {})
+
+        # removed module
+        ptah.config.save_snapshot(self.registry)
+        data = self._read()
+        data['sources'][os.path.join(self.dir, 'removed.py')] = [0, 0]
+        self._write(data)
+
+        snapshot = self._restart()
+        self.assertEqual(snapshot.restored, {})
+
+    def test_snapshot_outdated(self):
+        import ptah
+
+        self.init_ptah()
+        ptah.config.save_snapshot(self.registry)
+
+        self._settings = dict(self._settings, **{'ptah.managers': '*'})
+        snapshot = self._restart()
+        self.assertEqual(snapshot.restored, {})
+
+        with open(self.path, 'wb') as f:
+            f.write(b'invalid')
+        snapshot = self._restart()
+        self.assertEqual(snapshot.restored, {})
+
+
+
+class TestFreeze(PtahTestCase):
+
+    def test_freeze(self):
+        import ptah
+        from ptah.uri import ID_RESOLVER, ID_RESOLVER_TABLE
+
+        self.config.ptah_uri_resolver('test-freeze', lambda uri: uri)
+        self.config.commit()
+
+        frozen = config.freeze(self.registry)
+        self.assertIs(self.registry.__ptah_frozen__, frozen)
+
+        storage = config.get_cfg_storage(ID_RESOLVER)
+        self.assertIsInstance(storage, config.FrozenStorage)
+        self.assertIn('test-freeze', storage)
+
+        table = config.get_cfg_storage(ID_RESOLVER_TABLE)
+        self.assertEqual(table['test-freeze'], (storage['test-freeze'], None))
+        self.assertEqual(ptah.resolve('test-freeze:1'), 'test-freeze:1')
+
+        # new storages are frozen
+        self.assertIsInstance(
+            config.get_cfg_storage('test-freeze'), config.FrozenStorage)
+
+        # freeze is idempotent
+        self.assertIs(config.freeze(self.registry), frozen)
+        self.assertIs(config.get_cfg_storage(ID_RESOLVER), storage)
+
+    def test_freeze_runtime_registration(self):
+        import ptah
+        from ptah.uri import ID_RESOLVER_TABLE
+
+        config.freeze(self.registry)
+        table = config.get_cfg_storage(ID_RESOLVER_TABLE)
+
+        self.config.ptah_uri_resolver(
+            'test-runtime', lambda uri: uri, cache='request')
+        self.config.commit()
+
+        # prebound table is replaced, old table is not changed
+        self.assertNotIn('test-runtime', table)
+        self.assertEqual(
+            config.get_cfg_storage(ID_RESOLVER_TABLE)['test-runtime'][1],
+            'request')
+        self.assertEqual(ptah.resolve('test-runtime:1'), 'test-runtime:1')
+
+    def test_frozen_storage(self):
+        from ptah.uri import ID_RESOLVER, ID_RESOLVER_TABLE
+
+        config.freeze(self.registry)
+        storage = config.get_cfg_storage(ID_RESOLVER)
+
+        def table():
+            return config.get_cfg_storage(ID_RESOLVER_TABLE)
+
+        storage['test1'] = snapshot_resolver
+        self.assertIn('test1', table())
+
+        self.assertIs(storage.setdefault('test1', None), snapshot_resolver)
+        self.assertIsNone(storage.setdefault('test2', None))
+        self.assertIn('test2', table())
+
+        storage.update({'test3': snapshot_resolver})
+        self.assertIn('test3', table())
+
+        del storage['test1']
+        self.assertNotIn('test1', table())
+
+        self.assertIsNone(storage.pop('test2'))
+        self.assertNotIn('test2', table())
+        self.assertIsNone(storage.pop('unknown', None))
+
+        self.assertEqual(storage.popitem(), ('test3', snapshot_resolver))
+        self.assertNotIn('test3', table())
+
+        storage.clear()
+        self.assertEqual(table(), {})
+
+        # storage is not changed in place
+        self.assertNotIn('test1', storage)
+        self.assertIn('ptah-auth', storage)
+
+        # pickled as plain dict
+        storage['test1'] = snapshot_resolver
+        data = pickle.loads(pickle.dumps(config.get_cfg_storage(ID_RESOLVER)))
+        self.assertEqual(type(data), config.OrderedDict)
+        self.assertEqual(data, {'test1': snapshot_resolver})
+
+    def test_frozen_storage_iteration(self):
+        from ptah.uri import ID_RESOLVER
+
+        config.freeze(self.registry)
+        storage = config.get_cfg_storage(ID_RESOLVER)
+        size = len(storage)
+
+        for idx, name in enumerate(storage):
+            config.get_cfg_storage(ID_RESOLVER)['test%s' % idx] = None
+
+        self.assertEqual(len(storage), size)
+        self.assertEqual(len(config.get_cfg_storage(ID_RESOLVER)), size * 2)
+
+    def test_freeze_app_created(self):
+        from pyramid.events import ApplicationCreated
+        from ptah.ptahsettings import freeze_config
+
+        app = testing.DummyResource(registry=self.registry)
+        freeze_config(ApplicationCreated(app))
+        self.assertIsNotNone(getattr(self.registry, '__ptah_frozen__', None))
+
+
+class DeferredRecord(ptah.get_base()):
+    __tablename__ = 'test_deferred_records'
+
+    id = sqla.Column(sqla.Integer, primary_key=True)
+    __uri__ = sqla.Column('uri', sqla.String(128))
+    title = sqla.Column(sqla.Unicode(255))
+
+
+class TestDeferredSubscriber(PtahTestCase):
+
+    _init_ptah = False
+
+    def setUp(self):
+        # handlers run in other threads, in-memory database is per thread
+        self.dir = tempfile.mkdtemp()
+        self._settings = {'sqlalchemy.url': 'sqlite:///%s' % os.path.join(
+            self.dir, 'test.db')}
+        super(TestDeferredSubscriber, self).setUp()
+
+    def tearDown(self):
+        import transaction
+        transaction.abort()
+        config.get_event_executor(0)
+        super(TestDeferredSubscriber, self).tearDown()
+        engine = ptah.get_base().metadata.bind
+        if engine is not None:
+            engine.dispose()
+        shutil.rmtree(self.dir)
+
+    def test_deferred(self):
+        import transaction
+        from ptah.events import UriInvalidateEvent
+
+        events = []
+
+        @config.subscriber(UriInvalidateEvent, deferred=True)
+        def handler(ev):
+            events.append(ev.uri)
+
+        self.init_ptah()
+
+        transaction.begin()
+        self.registry.notify(UriInvalidateEvent('test:1'))
+        self.assertEqual(events, [])
+        queue = config.get_deferred_queue()
+        self.assertEqual(len(queue), 1)
+
+        transaction.commit()
+        self.assertTrue(queue.wait(5))
+        self.assertEqual(events, ['test:1'])
+        self.assertIsNone(config.get_deferred_queue())
+
+        # aborted transaction
+        transaction.begin()
+        self.registry.notify(UriInvalidateEvent('test:2'))
+        queue = config.get_deferred_queue()
+        transaction.abort()
+        transaction.commit()
+        self.assertFalse(queue.wait(0.1))
+        self.assertEqual(events, ['test:1'])
+
+    def test_deferred_async(self):
+        import threading
+        import transaction
+        from ptah.events import UriInvalidateEvent
+
+        started = threading.Event()
+        release = threading.Event()
+
+        @config.subscriber(UriInvalidateEvent, deferred=True)
+        def handler(ev):
+            started.set()
+            release.wait(5)
+
+        self.init_ptah()
+
+        transaction.begin()
+        self.registry.notify(UriInvalidateEvent('test:1'))
+        queue = config.get_deferred_queue()
+
+        # commit does not wait for handler
+        transaction.commit()
+        self.assertTrue(started.wait(5))
+        self.assertFalse(queue.done.is_set())
+
+        release.set()
+        self.assertTrue(queue.wait(5))
+
+    def test_deferred_no_transaction(self):
+        import transaction
+        from ptah.events import UriInvalidateEvent
+
+        events = []
+
+        @config.subscriber(UriInvalidateEvent, deferred=True)
+        def handler(ev):
+            events.append(ev.uri)
+
+        self.init_ptah()
+        transaction.abort()
+
+        self.registry.notify(UriInvalidateEvent('test:1'))
+        self.assertEqual(events, ['test:1'])
+        self.assertIsNone(config.get_deferred_queue(True))
+
+    def test_deferred_coalesce(self):
+        import transaction
+        from ptah.events import UriInvalidateEvent
+
+        events = []
+
+        @config.subscriber(UriInvalidateEvent, deferred=True)
+        def handler(ev):
+            events.append(ev.uri)
+
+        @config.subscriber(IContext, IObjectEvent, deferred=True)
+        def obj_handler(ob, ev):
+            events.append(ob)
+
+        self.init_ptah()
+
+        transaction.begin()
+        self.registry.notify(UriInvalidateEvent('test:1'))
+        self.registry.notify(UriInvalidateEvent('test:2'))
+        self.registry.notify(UriInvalidateEvent('test:1'))
+
+        from zope.interface.interfaces import ObjectEvent
+        ob1 = Context(IContext)
+        ob1.__uri__ = 'ob:1'
+        ob2 = Context(IContext)
+        self.registry.notify(ObjectEvent(ob1))
+        self.registry.notify(ObjectEvent(ob1))
+        self.registry.notify(ObjectEvent(ob2))
+        self.registry.notify(ObjectEvent(ob2))
+
+        queue = config.get_deferred_queue()
+        transaction.commit()
+        queue.wait(5)
+        self.assertEqual(events, ['test:1', 'test:2', ob1, ob2, ob2])
+
+    def test_deferred_workers(self):
+        import ptah
+        import threading
+        import transaction
+        from pyramid.threadlocal import get_current_registry
+        from ptah.events import UriInvalidateEvent
+
+        events = []
+
+        @config.subscriber(UriInvalidateEvent, deferred=True)
+        def handler(ev):
+            events.append((ev.uri, threading.current_thread(),
+                           get_current_registry()))
+
+        @config.subscriber(UriInvalidateEvent, deferred=True)
+        def failed(ev):
+            raise ValueError(ev.uri)
+
+        self.init_ptah()
+        ptah.get_settings(ptah.CFG_ID_PTAH)['event_workers'] = 1
+
+        transaction.begin()
+        self.registry.notify(UriInvalidateEvent('test:1'))
+        queue = config.get_deferred_queue()
+        transaction.commit()
+        queue.future.result()
+
+        self.assertEqual(len(events), 1)
+        uri, thread, registry = events[0]
+        self.assertEqual(uri, 'test:1')
+        self.assertIsNot(thread, threading.current_thread())
+        self.assertIs(registry, self.registry)
+
+    def test_deferred_introspectable(self):
+        from ptah.events import UriInvalidateEvent
+
+        @config.subscriber(UriInvalidateEvent, deferred=True)
+        def handler(ev):
+            """ Deferred handler """
+
+        self.init_ptah()
+
+        intr = [i for i in self.registry.introspector.get_category(
+            config.ID_SUBSCRIBER) if i['introspectable']['handler'] is handler]
+        self.assertTrue(intr[0]['introspectable']['deferred'])
+
+    def _sqla_handlers(self):
+        import threading
+        import transaction
+        from zope.interface.interfaces import ObjectEvent
+
+        events = []
+
+        @config.subscriber(DeferredRecord, IObjectEvent, deferred=True)
+        def obj_handler(ob, ev):
+            events.append((ob.title, threading.current_thread()))
+            self.assertIs(ev.object, ob)
+            ob.title = 'Changed'
+
+        self.init_ptah()
+
+        transaction.begin()
+        Session = ptah.get_session()
+        rec = DeferredRecord(__uri__='deferred:1', title='Title')
+        Session.add(rec)
+        Session.flush()
+
+        return events, rec, ObjectEvent
+
+    def test_deferred_sqla(self):
+        import transaction
+
+        events, rec, ObjectEvent = self._sqla_handlers()
+        self.registry.notify(ObjectEvent(rec))
+        self.registry.notify(ObjectEvent(rec))
+        queue = config.get_deferred_queue()
+        transaction.commit()
+        queue.wait(5)
+
+        # handler gets instance of its own session, changes are committed
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0][0], 'Title')
+        self.assertEqual(
+            ptah.get_session().query(DeferredRecord.title).scalar(),
+            'Changed')
+
+    def test_deferred_sqla_workers(self):
+        import transaction
+
+        events, rec, ObjectEvent = self._sqla_handlers()
+        ptah.get_settings(ptah.CFG_ID_PTAH)['event_workers'] = 1
+
+        self.registry.notify(ObjectEvent(rec))
+        queue = config.get_deferred_queue()
+        transaction.commit()
+        queue.future.result()
+
+        self.assertEqual(events[0][0], 'Title')
+        self.assertEqual(
+            ptah.get_session().query(DeferredRecord.title).scalar(),
+            'Changed')
+
+    def test_deferred_sqla_removed(self):
+        import transaction
+
+        events, rec, ObjectEvent = self._sqla_handlers()
+        self.registry.notify(ObjectEvent(rec))
+        ptah.get_session().delete(rec)
+        queue = config.get_deferred_queue()
+        transaction.commit()
+        queue.wait(5)
+
+        self.assertEqual(events, [])
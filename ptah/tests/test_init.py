@@ -108,3 +108,74 @@ class TestMailer(ptah.PtahTestCase):
         PTAH = ptah.get_settings(ptah.CFG_ID_PTAH, config.registry)
 
         self.assertTrue(IMailDelivery.providedBy(PTAH['mailer']))
+
+
+class TestJsonCodecSetting(ptah.PtahTestCase):
+
+    _settings = {'sqlalchemy.url': 'sqlite://',
+                 'ptah.json_codec': 'json'}
+
+    def tearDown(self):
+        ptah.util.set_json_codec()
+        super(TestJsonCodecSetting, self).tearDown()
+
+    def test_json_codec(self):
+        self.assertEqual(ptah.util.get_json_codec().name, 'json')
+
+
+class TestJsonCodecSettingUnknown(ptah.PtahTestCase):
+
+    _settings = {'sqlalchemy.url': 'sqlite://',
+                 'ptah.json_codec': 'unknown'}
+
+    def test_json_codec_unknown(self):
+        self.assertIs(ptah.util.get_json_codec(),
+                      ptah.util.set_json_codec('auto'))
+
+
+class TestLazyApi(TestCase):
+
+    def test_api(self):
+        import importlib
+
+        for name, (module, attr) in ptah._API.items():
+            value = importlib.import_module(module)
+            if attr is not None:
+                value = getattr(value, attr)
+            self.assertIs(getattr(ptah, name), value)
+
+        self.assertIn('rst_to_html', dir(ptah))
+
+    def test_populate(self):
+        from ptah.populate import populate
+        self.assertIs(ptah.populate, populate)
+
+    def test_submodule(self):
+        import sys
+
+        self.assertIs(ptah.token, sys.modules['ptah.token'])
+        self.assertRaises(AttributeError, getattr, ptah, 'unknown')
+
+    def test_import_time(self):
+        import os
+        import sys
+        import subprocess
+
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.path.dirname(os.path.dirname(ptah.__file__))
+        proc = subprocess.Popen(
+            [sys.executable, '-X', 'importtime', '-c', 'import ptah'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        _, err = proc.communicate()
+
+        modules = set()
+        for line in err.decode('utf-8').splitlines():
+            if line.startswith('import time:') and '|' in line:
+                modules.add(line.rsplit('|', 1)[1].strip())
+
+        self.assertIn('ptah', modules)
+        for name in ('alembic', 'webtest', 'sphinx', 'docutils',
+                     'sqlalchemy', 'ptah.form', 'ptah.renderer',
+                     'ptah.testing', 'ptah.migrate', 'ptah.mail',
+                     'ptah.rst', 'ptah.settings', 'ptah.manage'):
+            self.assertNotIn(name, modules)
@@ -70,7 +70,7 @@ class TestPyramidDirective(ptah.PtahTestCase):
         config.ptah_migrate()
         config.commit()
 
-        self.assertEqual(self._pkgs, ['ptah'])
+        self.assertEqual(self._pkgs, ['ptah.settings', 'ptah.token', 'ptah'])
 
 
 class TestScriptDirectory(ptah.PtahTestCase):
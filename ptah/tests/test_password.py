@@ -104,6 +104,64 @@ class TestPlainPasswordManager(TestCase):
         self.assertTrue(manager.check(encoded, password))
 
 
+class TestPBKDF2PasswordManager(TestCase):
+
+    def test_password_pbkdf2(self):
+        from ptah.password import PBKDF2PasswordManager
+
+        manager = PBKDF2PasswordManager(1000)
+
+        password = text_("right А", 'utf-8')
+        encoded = manager.encode(password, salt=bytes_('salt', 'utf-8'))
+
+        self.assertEqual(
+            encoded, '{pbkdf2}sha256$1000$c2FsdA==$'
+            'dzCAxrkGWR4129r0BMQY5TKaS0DNMIdLXUpyHb7CKTY=')
+        self.assertTrue(manager.check(encoded, password))
+        self.assertFalse(manager.check(encoded, password + "wrong"))
+        self.assertFalse(manager.check('{pbkdf2}invalid', password))
+
+        encoded = manager.encode(password)
+        self.assertTrue(manager.check(encoded, password))
+        self.assertFalse(manager.needs_rehash(encoded))
+        self.assertTrue(PBKDF2PasswordManager(2000).needs_rehash(encoded))
+        self.assertTrue(manager.needs_rehash('{pbkdf2}invalid'))
+
+
+class TestScryptPasswordManager(TestCase):
+
+    def test_password_scrypt(self):
+        from ptah.password import ScryptPasswordManager
+
+        manager = ScryptPasswordManager(16)
+
+        password = text_("right А", 'utf-8')
+        encoded = manager.encode(password)
+
+        self.assertTrue(encoded.startswith('{scrypt}16$8$1$'))
+        self.assertTrue(manager.check(encoded, password))
+        self.assertFalse(manager.check(encoded, password + "wrong"))
+        self.assertFalse(manager.check('{scrypt}invalid', password))
+
+        self.assertFalse(manager.needs_rehash(encoded))
+        self.assertTrue(ScryptPasswordManager(32).needs_rehash(encoded))
+        self.assertTrue(manager.needs_rehash('{scrypt}invalid'))
+
+
+class TestPasswordCalibrate(TestCase):
+
+    def test_calibrate(self):
+        from ptah.password import calibrate
+
+        pm = calibrate('pbkdf2', 0.001)
+        self.assertGreaterEqual(pm.iterations, 1000)
+
+        pm = calibrate('scrypt', 0.001)
+        self.assertGreaterEqual(pm.n, 1024)
+
+        self.assertRaises(ValueError, calibrate, 'unknown')
+
+
 class TestPasswordSettings(PtahTestCase):
 
     def test_password_settings(self):
@@ -119,6 +177,25 @@ class TestPasswordSettings(PtahTestCase):
         self.assertIsInstance(ptah.pwd_tool.manager, SSHAPasswordManager)
 
 
+    def test_password_settings_cost(self):
+        from ptah.password import PBKDF2PasswordManager
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH, self.registry)
+        cfg['pwd_manager'] = 'pbkdf2'
+        cfg['pwd_pbkdf2_iterations'] = 1000
+
+        manager = ptah.pwd_tool.manager
+        self.assertIsInstance(manager, PBKDF2PasswordManager)
+        self.assertEqual(manager.iterations, 1000)
+
+        cfg['pwd_pbkdf2_iterations'] = 260000
+        self.assertIs(ptah.pwd_tool.manager, ptah.pwd_tool.pm['{pbkdf2}'])
+
+        cfg['pwd_manager'] = 'scrypt'
+        cfg['pwd_scrypt_n'] = 16
+        self.assertEqual(ptah.pwd_tool.manager.n, 16)
+
+
 class TestPasswordChanger(PtahTestCase):
 
     _init_ptah = False
@@ -206,6 +283,77 @@ class TestPasswordTool(PtahTestCase):
         self.assertFalse(ptah.pwd_tool.check('{plain}12345', '123455'))
         self.assertFalse(ptah.pwd_tool.check('{unknown}12345', '123455'))
 
+    def test_password_workers(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from concurrent.futures import ProcessPoolExecutor
+        from ptah.password import PasswordTool
+
+        self.init_ptah()
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH, self.registry)
+        cfg['pwd_manager'] = 'pbkdf2'
+        cfg['pwd_pbkdf2_iterations'] = 1000
+
+        tool = PasswordTool()
+        self.assertIsNone(tool.get_executor())
+
+        cfg['pwd_workers'] = 2
+        encoded = tool.encode('12345')
+        self.assertIsInstance(tool.executor, ThreadPoolExecutor)
+        self.assertTrue(tool.check(encoded, '12345'))
+        self.assertFalse(tool.check(encoded, '123456'))
+
+        executor = tool.executor
+        self.assertIs(tool.get_executor(), executor)
+
+        cfg['pwd_pool'] = 'process'
+        self.assertTrue(tool.check(encoded, '12345'))
+        self.assertIsInstance(tool.executor, ProcessPoolExecutor)
+        tool.executor.shutdown()
+
+    def test_password_rehash(self):
+        p = Principal('test-schema:test', 'name', 'login')
+
+        @ptah.password_changer('test-schema')
+        def changer(principal, password):
+            principal.password = password
+
+        self.init_ptah()
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH, self.registry)
+        cfg['pwd_manager'] = 'pbkdf2'
+        cfg['pwd_pbkdf2_iterations'] = 1000
+
+        # wrong password
+        self.assertFalse(ptah.pwd_tool.check('{plain}12345', '1', p))
+        self.assertFalse(hasattr(p, 'password'))
+
+        # outdated password manager
+        self.assertTrue(ptah.pwd_tool.check('{plain}12345', '12345', p))
+        self.assertTrue(p.password.startswith('{pbkdf2}sha256$1000$'))
+
+        # up to date
+        encoded = p.password
+        self.assertTrue(ptah.pwd_tool.check(encoded, '12345', p))
+        self.assertEqual(p.password, encoded)
+
+        # outdated parameters
+        cfg['pwd_pbkdf2_iterations'] = 1001
+        self.assertTrue(ptah.pwd_tool.check(encoded, '12345', p))
+        self.assertTrue(p.password.startswith('{pbkdf2}sha256$1001$'))
+
+        # password is never reencoded with plain manager
+        cfg['pwd_manager'] = 'plain'
+        encoded = p.password
+        self.assertTrue(ptah.pwd_tool.check(encoded, '12345', p))
+        self.assertEqual(p.password, encoded)
+
+        # no changer
+        cfg['pwd_manager'] = 'ssha'
+        p = Principal('unknown-schema:test', 'name', 'login')
+        self.assertTrue(ptah.pwd_tool.check('{plain}12345', '12345', p))
+        self.assertFalse(hasattr(p, 'password'))
+
     def test_password_passcode(self):
         p = Principal('test-schema:test', 'name', 'login')
         principals = {'test-schema:test': p}
@@ -1,5 +1,6 @@
 from ptah import rst
-from ptah.testing import TestCase
+import ptah
+from ptah.testing import TestCase, PtahTestCase
 
 
 class TestRST(TestCase):
@@ -20,3 +21,113 @@ class TestRST(TestCase):
 
         self.assertEqual(
             '<pre> Test text `ptahcms.Node` </pre>', rst.rst_to_html(text))
+
+    def test_init_sphinx(self):
+        import os
+
+        self.assertTrue(rst.init_sphinx())
+        self.assertTrue(rst.has_sphinx)
+        self.assertTrue(os.path.exists(os.path.join(rst.tempdir, 'conf.py')))
+
+        tempdir = rst.tempdir
+        self.assertTrue(rst.init_sphinx())
+        self.assertEqual(rst.tempdir, tempdir)
+
+
+def dummy_render(text):
+    return '<p>%s</p>' % text
+
+
+class TestRSTCache(PtahTestCase):
+
+    def setUp(self):
+        super(TestRSTCache, self).setUp()
+        self.rendered = []
+        self.render = rst.render
+
+        def render(text):
+            self.rendered.append(text)
+            return dummy_render(text)
+
+        rst.render = render
+        rst.cache.invalidate()
+
+    def tearDown(self):
+        rst.render = self.render
+        rst.cache.invalidate()
+        rst.get_executor(0)
+        super(TestRSTCache, self).tearDown()
+
+    def test_rst_cache(self):
+        self.assertEqual(rst.rst_to_html('Text'), '<p>Text</p>')
+        self.assertEqual(rst.rst_to_html('Text'), '<p>Text</p>')
+        self.assertEqual(rst.rst_to_html(b'Text'.decode()), '<p>Text</p>')
+        self.assertEqual(self.rendered, ['Text'])
+        self.assertEqual(len(rst.cache), 1)
+
+    def test_rst_cache_size(self):
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH)
+        cfg['rst_cache_size'] = 2
+
+        for text in ('t1', 't2', 't3', 't1'):
+            rst.rst_to_html(text)
+
+        self.assertEqual(self.rendered, ['t1', 't2', 't3', 't1'])
+        self.assertEqual(len(rst.cache), 2)
+
+    def test_rst_cache_disabled(self):
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH)
+        cfg['rst_cache_size'] = 0
+
+        rst.rst_to_html('Text')
+        rst.rst_to_html('Text')
+        self.assertEqual(self.rendered, ['Text', 'Text'])
+        self.assertEqual(len(rst.cache), 0)
+
+    def test_rst_workers(self):
+        rst.render = dummy_render
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH)
+        cfg['rst_workers'] = 1
+
+        self.assertEqual(rst.rst_to_html('Text'), '<p>Text</p>')
+        self.assertIsNotNone(rst.executor)
+        self.assertEqual(rst.executor_workers, 1)
+
+        cfg['rst_workers'] = 0
+        rst.rst_to_html('Text 2')
+        self.assertIsNone(rst.executor)
+
+    def test_intr_docstrings(self):
+        from ptah.uri import ID_RESOLVER
+
+        texts = rst.intr_docstrings(self.registry)
+        resolver = ptah.get_cfg_storage(ID_RESOLVER)['ptah-auth']
+        self.assertIn(resolver.__doc__, texts)
+        self.assertEqual(len(texts), len(set(texts)))
+
+    def test_warmup(self):
+        self.assertEqual(rst.warmup(self.registry, ['t1', 't2']), 2)
+        self.assertEqual(rst.warmup(self.registry, ['t1', 't2']), 0)
+
+        rst.rst_to_html('t1')
+        self.assertEqual(self.rendered, ['t1', 't2'])
+
+        self.assertGreater(rst.warmup(self.registry), 0)
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH)
+        cfg['rst_cache_size'] = 0
+        self.assertEqual(rst.warmup(self.registry), 0)
+
+    def test_warmup_app_created(self):
+        from pyramid import testing
+        from pyramid.events import ApplicationCreated
+        from ptah.ptahsettings import rst_warmup
+
+        app = testing.DummyResource(registry=self.registry)
+        self.assertIsNone(rst_warmup(ApplicationCreated(app)))
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH)
+        cfg['rst_warmup'] = True
+        thread = rst_warmup(ApplicationCreated(app))
+        thread.join()
+        self.assertGreater(len(rst.cache), 0)
@@ -241,6 +241,121 @@ class TestACLsProps(PtahTestCase):
                           ['Allow', 'role1', set(['perm2', 'perm1'])]])
 
 
+class TestCompiledACL(PtahTestCase):
+
+    _init_ptah = False
+    _auto_commit = False
+
+    def test_compiled_lookup_order(self):
+        pmap = ptah.ACL('map', 'acl map')
+        pmap.deny('role:test', 'perm1')
+        pmap.allow('role:test2', 'perm1', 'perm2')
+        pmap.allow('role:test', ALL_PERMISSIONS)
+
+        compiled = pmap.compile()
+
+        self.assertIs(
+            compiled.lookup(('role:test', 'role:test2'), 'perm1'), pmap[0])
+        self.assertIs(
+            compiled.lookup(('role:test2', 'role:test'), 'perm2'), pmap[1])
+        self.assertIs(compiled.lookup(('role:test',), 'perm3'), pmap[2])
+        self.assertIsNone(compiled.lookup(('role:test2',), 'perm3'))
+        self.assertIsNone(compiled.lookup(('role:test3',), 'perm1'))
+
+    def test_compiled_plain_aces(self):
+        from ptah.security import CompiledACL
+
+        acl = [(Allow, 'role:test', 'perm1'), DENY_ALL]
+        compiled = CompiledACL(acl)
+
+        self.assertIs(compiled.lookup(('role:test',), 'perm1'), acl[0])
+        self.assertIsNone(compiled.lookup(('role:test',), 'perm2'))
+        self.assertIs(
+            compiled.lookup(('role:test', ptah.Everyone.id), 'perm2'), acl[1])
+        self.assertIs(
+            compiled.lookup((ptah.Everyone.id,), 'perm1'), acl[1])
+
+    def test_compiled_invalidation(self):
+        pmap = ptah.ACL('map', 'acl map')
+        pmap.allow('role:test', 'perm1')
+
+        compiled = pmap.compile()
+        self.assertIs(pmap.compile(), compiled)
+        self.assertIsNone(compiled.lookup(('role:test',), 'perm2'))
+
+        pmap.allow('role:test', 'perm2')
+        self.assertIsNot(pmap.compile(), compiled)
+        self.assertIs(pmap.compile().lookup(('role:test',), 'perm2'), pmap[0])
+
+        pmap.deny('role:test2', 'perm1')
+        self.assertIs(pmap.compile().lookup(('role:test2',), 'perm1'), pmap[1])
+
+        pmap.unset('role:test2', 'perm1')
+        self.assertIsNone(pmap.compile().lookup(('role:test2',), 'perm1'))
+
+        pmap[:] = []
+        self.assertIsNone(pmap.get(Allow, 'role:test'))
+        self.assertIsNone(pmap.compile().lookup(('role:test',), 'perm1'))
+
+    def test_merged_compiled(self):
+        acl1 = ptah.ACL('acl1', 'acl1')
+        acl1.allow('role1', 'perm1')
+
+        acl2 = ptah.ACL('acl2', 'acl2')
+        acl2.deny('role1', 'perm1', 'perm2')
+
+        self.init_ptah()
+
+        class Content(object):
+            __acl__ = ptah.ACLsProperty()
+            __acls__ = ('acl1', 'acl2', 'unknown')
+
+        content = Content()
+
+        compiled = content.__acl__.compile()
+        self.assertIs(content.__acl__.compile(), compiled)
+        self.assertEqual(compiled.lookup(('role1',), 'perm1')[0], Allow)
+        self.assertEqual(compiled.lookup(('role1',), 'perm2')[0], Deny)
+
+        acl1.allow('role1', 'perm2')
+        compiled = content.__acl__.compile()
+        self.assertEqual(compiled.lookup(('role1',), 'perm2')[0], Allow)
+
+        content.__acls__ = ('acl2', 'acl1')
+        compiled = content.__acl__.compile()
+        self.assertEqual(compiled.lookup(('role1',), 'perm1')[0], Deny)
+
+    def test_authz_merged(self):
+        from ptah.security import PtahAuthorizationPolicy
+
+        acl1 = ptah.ACL('acl1', 'acl1')
+        acl1.deny('role1', 'perm2')
+
+        acl2 = ptah.ACL('acl2', 'acl2')
+        acl2.allow('role1', 'perm1', 'perm2')
+
+        self.init_ptah()
+
+        class Content(object):
+            __parent__ = None
+            __acl__ = ptah.ACLsProperty()
+
+        parent = Content()
+        parent.__acls__ = ('acl2',)
+
+        content = Content()
+        content.__parent__ = parent
+        content.__acls__ = ('acl1',)
+
+        authz = PtahAuthorizationPolicy()
+
+        res = authz.permits(content, ('role1',), 'perm1')
+        self.assertTrue(res)
+        self.assertIs(res.context, parent)
+        self.assertFalse(authz.permits(content, ('role1',), 'perm2'))
+        self.assertFalse(authz.permits(content, ('role2',), 'perm1'))
+
+
 class TestRole(PtahTestCase):
 
     _init_ptah = False
@@ -447,6 +562,97 @@ class TestLocalRoles(PtahTestCase):
             security.get_local_roles('userid', request), ['role:test2'])
 
 
+class TestLocalRolesCache(PtahTestCase):
+
+    def setUp(self):
+        super(TestLocalRolesCache, self).setUp()
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH)
+        cfg['local_roles_cache'] = True
+
+        self.resolved = []
+
+        class Principal(object):
+            properties = {'groups': ('group:1',)}
+
+        def resolver(uri):
+            self.resolved.append(uri)
+            return Principal()
+
+        self.config.ptah_uri_resolver('test-user', resolver)
+
+    def test_local_roles_cache_siblings(self):
+        from ptah import security
+
+        root = Content(iface=security.ILocalRolesAware)
+        root.__local_roles__['test-user:1'] = ('role:root',)
+
+        parent = Content(parent=root, iface=security.ILocalRolesAware)
+        parent.__local_roles__['group:1'] = ('role:group',)
+
+        content1 = Content(parent=parent, iface=security.ILocalRolesAware)
+        content1.__local_roles__['test-user:1'] = ('role:content',)
+        content2 = Content(parent=parent, iface=security.ILocalRolesAware)
+
+        self.assertEqual(
+            security.get_local_roles('test-user:1', context=content1),
+            ['role:content', 'role:group', 'role:root'])
+
+        # parents roles are cached
+        root.__local_roles__['test-user:1'] = ('role:root2',)
+
+        self.assertEqual(
+            security.get_local_roles('test-user:1', context=content2),
+            ['role:group', 'role:root'])
+        self.assertEqual(self.resolved, ['test-user:1'])
+
+    def test_local_roles_cache_invalidate(self):
+        from ptah import security
+
+        parent = Content(iface=security.ILocalRolesAware)
+        parent.__local_roles__['test-user:1'] = ('role:test',)
+        content = Content(parent=parent)
+
+        self.assertEqual(
+            security.get_local_roles('test-user:1', context=content),
+            ['role:test'])
+
+        parent.__local_roles__['test-user:1'] = ('role:test2',)
+        self.assertEqual(
+            security.get_local_roles('test-user:1', context=content),
+            ['role:test'])
+
+        self.registry.notify(ptah.events.UriInvalidateEvent('test-user:1'))
+
+        self.assertEqual(
+            security.get_local_roles('test-user:1', context=content),
+            ['role:test2'])
+        self.assertEqual(self.resolved, ['test-user:1', 'test-user:1'])
+
+    def test_local_roles_cache_disabled(self):
+        from ptah import security
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH)
+        cfg['local_roles_cache'] = False
+
+        parent = Content(iface=security.ILocalRolesAware)
+        parent.__local_roles__['test-user:1'] = ('role:test',)
+        content = Content(parent=parent, iface=security.ILocalRolesAware)
+        content.__local_roles__['test-user:1'] = ('role:test2',)
+
+        self.assertEqual(
+            security.get_local_roles('test-user:1', context=content),
+            ['role:test2', 'role:test'])
+
+        parent.__local_roles__['test-user:1'] = ('role:test3',)
+        self.assertEqual(
+            security.get_local_roles('test-user:1', context=content),
+            ['role:test2', 'role:test3'])
+
+        # principal is resolved once per call
+        self.assertEqual(self.resolved, ['test-user:1', 'test-user:1'])
+
+
 class Content2(object):
 
     def __init__(self, parent=None, iface=None):
@@ -603,6 +809,161 @@ class TestCheckPermission(PtahTestCase):
         self.assertTrue(ptah.check_permission('View', content, throw=False))
 
 
+class TestCheckPermissions(PtahTestCase):
+
+    def test_check_permissions(self):
+        content = Content(
+            iface=ptah.ILocalRolesAware,
+            acl=[(Allow, 'role:test', 'View'),
+                 (Allow, ptah.Everyone.id, 'Search')])
+        content.__local_roles__['test-user'] = ['role:test']
+
+        perms = ('View', 'Edit', 'Search', None,
+                 NO_PERMISSION_REQUIRED, ptah.NOT_ALLOWED)
+
+        self.assertEqual(ptah.check_permissions(perms, content),
+                         [False, False, True, True, True, False])
+
+        ptah.auth_service.set_userid('test-user')
+        self.assertEqual(ptah.check_permissions(perms, content),
+                         [True, False, True, True, True, False])
+
+        ptah.auth_service.set_userid(ptah.SUPERUSER_URI)
+        self.assertEqual(ptah.check_permissions(perms, content),
+                         [True, True, True, True, True, False])
+
+    def test_check_permissions_many(self):
+        content1 = Content(acl=[(Allow, 'test-user', 'View')])
+        content2 = Content(acl=[(Allow, ptah.Authenticated.id, 'Edit')])
+        content3 = Content(parent=content1)
+
+        contexts = (content1, content2, content3)
+
+        self.assertEqual(ptah.check_permissions_many('View', contexts),
+                         [False, False, False])
+
+        ptah.auth_service.set_userid('test-user')
+        self.assertEqual(ptah.check_permissions_many('View', contexts),
+                         [True, False, True])
+        self.assertEqual(ptah.check_permissions_many('Edit', iter(contexts)),
+                         [False, True, False])
+        self.assertEqual(
+            ptah.check_permissions_many(ptah.NOT_ALLOWED, contexts),
+            [False, False, False])
+
+    def test_check_permissions_cache(self):
+        from ptah import security
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH)
+        cfg['permission_cache'] = True
+        security.permission_cache_stats.reset()
+
+        content = Content(acl=[(Allow, 'test-user', 'View')])
+
+        ptah.auth_service.set_userid('test-user')
+        self.assertTrue(ptah.check_permission('View', content))
+        self.assertEqual(ptah.check_permissions(('View', 'Edit'), content),
+                         [True, False])
+        self.assertEqual(ptah.check_permissions_many('Edit', (content,)),
+                         [False])
+        self.assertEqual(
+            security.permission_cache_stats.info(), {'hits': 2, 'misses': 2})
+
+
+class TestPermissionCache(PtahTestCase):
+
+    _init_auth = True
+
+    def setUp(self):
+        super(TestPermissionCache, self).setUp()
+
+        from ptah import security
+        security.permission_cache_stats.reset()
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH)
+        cfg['permission_cache'] = True
+
+    def test_permission_cache_disabled(self):
+        from ptah import security
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH)
+        cfg['permission_cache'] = False
+
+        content = Content(acl=[(Allow, ptah.Everyone.id, 'View')])
+
+        self.assertTrue(ptah.check_permission('View', content))
+        self.assertTrue(ptah.check_permission('View', content))
+        self.assertIsNone(security.get_permission_cache())
+        self.assertEqual(
+            security.permission_cache_stats.info(), {'hits': 0, 'misses': 0})
+
+    def test_permission_cache(self):
+        from ptah import security
+
+        content = Content(
+            iface=ptah.ILocalRolesAware,
+            acl=[(Allow, 'role:test', 'View')])
+
+        ptah.auth_service.set_userid('test-user')
+        self.assertFalse(ptah.check_permission('View', content))
+
+        # decision is cached within request
+        content.__local_roles__['test-user'] = ['role:test']
+        self.assertFalse(ptah.check_permission('View', content))
+        self.assertEqual(
+            security.permission_cache_stats.info(), {'hits': 1, 'misses': 1})
+
+        self.assertRaises(
+            HTTPForbidden, ptah.check_permission, 'View', content, throw=True)
+
+    def test_permission_cache_key(self):
+        from ptah import security
+
+        content1 = Content(acl=[(Allow, 'test-user', 'View')])
+        content2 = Content(acl=[(Allow, 'test-user2', 'View')])
+
+        ptah.auth_service.set_userid('test-user')
+        self.assertTrue(ptah.check_permission('View', content1))
+        self.assertFalse(ptah.check_permission('View', content2))
+        self.assertFalse(ptah.check_permission('Edit', content1))
+
+        ptah.auth_service.set_effective_userid('test-user2')
+        self.assertFalse(ptah.check_permission('View', content1))
+        self.assertTrue(ptah.check_permission('View', content2))
+
+        self.assertEqual(
+            security.permission_cache_stats.info(), {'hits': 0, 'misses': 5})
+
+    def test_permission_cache_new_request(self):
+        from pyramid.events import NewRequest
+
+        content = Content(acl=[(Allow, 'test-user', 'View')])
+
+        ptah.auth_service.set_userid('test-user')
+        self.assertTrue(ptah.check_permission('View', content))
+
+        content.__acl__ = []
+        self.registry.notify(NewRequest(self.request))
+
+        ptah.auth_service.set_userid('test-user')
+        self.assertFalse(ptah.check_permission('View', content))
+
+    def test_permission_cache_uri_invalidate(self):
+        from ptah import security
+
+        content = Content(acl=[(Allow, 'test-user', 'View')])
+
+        ptah.auth_service.set_userid('test-user')
+        self.assertTrue(ptah.check_permission('View', content))
+
+        content.__acl__ = []
+        self.registry.notify(ptah.events.UriInvalidateEvent('test:uri'))
+
+        self.assertFalse(ptah.check_permission('View', content))
+        self.assertEqual(
+            security.permission_cache_stats.info(), {'hits': 0, 'misses': 2})
+
+
 class TestAauthorization(PtahTestCase):
 
     _init_auth = True
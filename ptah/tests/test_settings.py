@@ -81,6 +81,44 @@ class TestSettings(BaseTesting):
         group.update({'node': '12345'})
         self.assertEqual(group.get('node'), '12345')
 
+    def test_settings_group_snapshot(self):
+        node = ptah.form.TextField(
+            'node',
+            default = 'test')
+
+        ptah.register_settings('group1', node)
+        self.init_ptah()
+
+        group = ptah.get_settings('group1', self.registry)
+        snapshot = group.snapshot
+        self.assertIs(group.snapshot, snapshot)
+        self.assertEqual(snapshot.node, 'test')
+        self.assertEqual(snapshot['node'], 'test')
+        self.assertIn('node', snapshot)
+        self.assertNotIn('other', snapshot)
+        self.assertRaises(KeyError, snapshot.__getitem__, 'other')
+        self.assertRaises(AttributeError, setattr, snapshot, 'node', '1')
+        self.assertRaises(AttributeError, setattr, snapshot, 'other', '1')
+        self.assertRaises(AttributeError, delattr, snapshot, 'node')
+        self.assertEqual(repr(snapshot), "<SettingsSnapshot node='test'>")
+
+        # modification rebuilds snapshot
+        group['node'] = '12345'
+        self.assertIsNot(group.snapshot, snapshot)
+        self.assertEqual(snapshot.node, 'test')
+        self.assertEqual(group.snapshot.node, '12345')
+
+        group.update({'node': '1', 'extra': 2, 'not-identifier': 3})
+        self.assertEqual(group.snapshot.node, '1')
+        self.assertEqual(group.snapshot.extra, 2)
+        self.assertNotIn('not-identifier', group.snapshot)
+
+        group.pop('extra')
+        self.assertNotIn('extra', group.snapshot)
+
+        group.clear()
+        self.assertEqual(group.snapshot.node, 'test')
+
     def test_settings_group_uninitialized(self):
         node = ptah.form.TextField(
             'node',
@@ -117,6 +155,57 @@ class TestSettings(BaseTesting):
         data, errors = group.extract({'group.node1': 'test-extract'})
         self.assertEqual(data['node2'], 'value')
 
+    def test_settings_parse_value(self):
+        from ptah.settings import parse_value, parse_int, parse_bool
+
+        self.assertEqual(parse_value('text'), 'text')
+        self.assertEqual(parse_value('"text"'), 'text')
+        self.assertEqual(parse_value('text \\"quoted\\"'), 'text "quoted"')
+        self.assertRaises(ValueError, parse_value, 'text "quoted"')
+        self.assertEqual(parse_value('line1\nline2'), 'line1\nline2')
+        self.assertEqual(parse_value('c:\\\\temp'), 'c:\\temp')
+        self.assertEqual(parse_value(' text'), ' text')
+        self.assertEqual(parse_value('123'), 123)
+        self.assertEqual(parse_value('123abc'), '123abc')
+        self.assertEqual(parse_value('null'), None)
+        self.assertEqual(parse_value('["a", "b"]'), ['a', 'b'])
+
+        self.assertEqual(parse_int('123'), 123)
+        self.assertEqual(parse_int('-5'), -5)
+        self.assertEqual(parse_int('1.5'), 1.5)
+        self.assertEqual(parse_int('0012'), '0012')
+
+        self.assertIs(parse_bool('true'), True)
+        self.assertIs(parse_bool('false'), False)
+        self.assertEqual(parse_bool('"yes"'), 'yes')
+
+    def test_settings_group_loader(self):
+        node1 = ptah.form.IntegerField('node1', default = 1)
+        node2 = ptah.form.BoolField('node2', default = False)
+        node3 = ptah.form.TextField('node3', default = 'test')
+
+        ptah.register_settings('group', node1, node2, node3)
+        self.init_ptah()
+
+        group = ptah.get_settings('group', self.registry)
+        data, errors = group.extract(
+            {'group.node1': '10', 'group.node2': 'true', 'group.node3': '5'})
+        self.assertEqual(data, {'node1': 10, 'node2': True, 'node3': 5})
+        self.assertFalse(errors)
+
+        # loader is compiled once
+        loader = group.__loader__
+        group.extract({})
+        self.assertIs(group.__loader__, loader)
+
+        keys = [key for key, field, parser, validate, preparer
+                in loader.fields]
+        self.assertEqual(keys, ['group.node1', 'group.node2', 'group.node3'])
+
+        data, errors = group.extract({'group.node1': 'value'})
+        self.assertEqual(data['node1'], 1)
+        self.assertTrue(errors)
+
     def test_settings_get_settings_pyramid(self):
         node = ptah.form.TextField(
             'node',
@@ -578,6 +667,16 @@ class TestDBSettings(TestDBSettingsBase):
 
         self.assertIs(grp, event_grp[0])
 
+    def test_settings_updatedb_snapshot(self):
+        grp = self._make_grp()
+        snapshot = grp.snapshot
+
+        grp.updatedb(node1 = 'new text', node2 = 65)
+        self.assertIsNot(grp.__snapshot__, None)
+        self.assertIsNot(grp.snapshot, snapshot)
+        self.assertEqual(grp.snapshot.node1, 'new text')
+        self.assertEqual(grp.snapshot.node2, 65)
+
     def test_settings_updatedb_load_from_db(self):
         grp = self._make_grp()
         grp.updatedb(node1 = 'new text',
@@ -602,6 +701,27 @@ class TestDBSettings(TestDBSettingsBase):
 
         self.assertEqual(grp['node3'], 'value')
 
+    def test_settings_load_from_db_groups(self):
+        from ptah.settings import SettingRecord
+
+        grp = self._make_grp()
+        settings = self.registry.__ptah_storage__[SETTINGS_OB_ID]
+
+        Session = ptah.get_session()
+        Session.add(SettingRecord(name='group.node1', value='"new text"'))
+        Session.add(SettingRecord(name='group.node3', value='500'))
+        Session.add(SettingRecord(name='other.node1', value='"other"'))
+        Session.flush()
+
+        self.assertEqual(settings.query_records([]), {})
+        self.assertEqual(
+            settings.query_records(['group']),
+            {'group.node1': '"new text"', 'group.node3': '500'})
+
+        settings.load_fromdb(['group'])
+        self.assertEqual(grp['node1'], 'new text')
+        self.assertEqual(grp['node3'], 500)
+
     def test_settings_load_from_db_on_startup(self):
         grp = self._make_grp()
 
@@ -616,6 +736,184 @@ class TestDBSettings(TestDBSettingsBase):
         self.assertEqual(grp['node2'], 65)
 
 
+class TestSettingsVersions(TestDBSettingsBase):
+
+    _init_ptah = False
+
+    def _load(self):
+        grp = self._make_grp()
+        settings = self.registry.__ptah_storage__[SETTINGS_OB_ID]
+        settings.load_fromdb()
+        return grp, settings
+
+    def _change(self, **data):
+        # emulate other process
+        from ptah.settings import SettingRecord
+
+        Session = ptah.get_session()
+        for name, value in data.items():
+            name = 'group.%s' % name
+            Session.query(SettingRecord).filter(
+                SettingRecord.name == name).delete()
+            if value is not None:
+                Session.add(SettingRecord(name=name, value=value))
+        return Settings().bump_version('group')
+
+    def test_settings_version_bump(self):
+        from ptah.settings import SettingsVersion
+
+        grp, settings = self._load()
+        self.assertEqual(settings.versions, {})
+
+        grp.updatedb(node1 = 'new text')
+        grp.updatedb(node1 = 'new text 2')
+
+        rec = ptah.get_session().query(SettingsVersion).one()
+        self.assertEqual(rec.name, 'group')
+        self.assertEqual(rec.version, 2)
+        self.assertEqual(settings.versions, {'group': 2})
+
+        # own changes are not reloaded
+        self.assertEqual(settings.refresh(), [])
+
+    def test_settings_version_bump_race(self):
+        import sqlalchemy as sqla
+        from ptah.settings import SettingsVersion
+
+        grp, settings = self._load()
+
+        engine = ptah.get_session().get_bind()
+        inserted = []
+
+        def after_cursor_execute(conn, cursor, statement, *args):
+            # other process creates version row after our update
+            if statement.startswith('UPDATE ptah_settings_versions') \
+                    and not inserted:
+                inserted.append(True)
+                conn.connection.cursor().execute(
+                    "INSERT INTO ptah_settings_versions (name, version) "
+                    "VALUES ('group', 5)")
+
+        sqla.event.listen(engine, 'after_cursor_execute',
+                          after_cursor_execute)
+        try:
+            self.assertEqual(settings.bump_version('group'), 6)
+        finally:
+            sqla.event.remove(engine, 'after_cursor_execute',
+                              after_cursor_execute)
+
+        rec = ptah.get_session().query(SettingsVersion).one()
+        self.assertEqual(rec.version, 6)
+
+    def test_settings_refresh(self):
+        events = []
+
+        @ptah.config.subscriber(ptah.events.SettingsGroupModified)
+        def handler(ev):
+            events.append(ev.object)
+
+        grp, settings = self._load()
+        grp.updatedb(node1 = 'new text', node2 = 65)
+
+        self.assertEqual(self._change(node1='"other"', node3='500'), 2)
+        self.assertEqual(settings.refresh(), ['group'])
+        self.assertEqual(grp['node1'], 'other')
+        self.assertEqual(grp['node2'], 65)
+        self.assertEqual(grp['node3'], 500)
+        self.assertEqual(grp.snapshot.node1, 'other')
+        self.assertIs(events[-1], grp)
+
+        # removed record, value is reset to default
+        self._change(node2=None)
+        self.assertEqual(settings.refresh(), ['group'])
+        self.assertEqual(grp['node2'], 50)
+
+        self.assertEqual(settings.refresh(), [])
+
+    def test_settings_refresh_invalid(self):
+        grp, settings = self._load()
+
+        self._change(node2='"not a number"')
+        settings.refresh()
+        self.assertEqual(grp['node2'], 50)
+
+    def test_settings_check(self):
+        from ptah.settings import check_settings
+
+        grp, settings = self._load()
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH, self.registry)
+
+        self._change(node1='"other"')
+        self.assertEqual(settings.check(), [])
+
+        class Event(object):
+            request = self.request
+
+        # poll
+        cfg['settings_poll_interval'] = 60
+        check_settings(Event)
+        self.assertEqual(grp['node1'], 'other')
+
+        self._change(node1='"other 2"')
+        self.assertEqual(settings.check(), [])
+
+        # notification
+        settings.invalidate('group')
+        self.assertEqual(settings.check(), ['group'])
+        self.assertEqual(grp['node1'], 'other 2')
+
+    def test_settings_local_notifier(self):
+        import transaction
+        from ptah.settings import LocalNotifier, set_settings_notifier
+
+        grp, settings = self._load()
+
+        notifier = LocalNotifier()
+        set_settings_notifier(notifier, self.registry)
+        self.assertIs(settings.notifier, notifier)
+
+        settings.check()
+        self.assertEqual(notifier.listeners, [settings.invalidate])
+
+        grp.updatedb(node1 = 'new text')
+        self.assertEqual(settings.pending, set())
+
+        transaction.commit()
+        self.assertEqual(settings.pending, set(['group']))
+
+    def test_settings_unix_socket_notifier(self):
+        import socket
+        import threading
+        from ptah.settings import UnixSocketNotifier
+
+        path = tempfile.mkdtemp()
+        try:
+            # stale socket
+            stale = os.path.join(path, 'ptah-0.sock')
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(stale)
+            sock.close()
+
+            received = []
+            event = threading.Event()
+
+            def callback(name):
+                received.append(name)
+                event.set()
+
+            notifier = UnixSocketNotifier(path)
+            notifier.listen(callback)
+            self.assertTrue(os.path.exists(notifier.address))
+
+            UnixSocketNotifier(path).notify('group')
+            event.wait(5)
+
+            self.assertEqual(received, ['group'])
+            self.assertFalse(os.path.exists(stale))
+        finally:
+            shutil.rmtree(path)
+
+
 class TestDBSettings2(TestDBSettingsBase):
 
     _init_ptah = False
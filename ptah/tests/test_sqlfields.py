@@ -249,6 +249,132 @@ class TestQueryFreezer(PtahTestCase):
         rec = sql_get.all(name='test')
         self.assertEqual(rec[0].name, 'test')
 
+        query = sql_get.iter(name='test')
+        self.assertIsInstance(query, sqla.orm.Query)
+        self.assertEqual(
+            [r.name for r in query.order_by(Test.id)], ['test'])
+
+    def test_freezer_cache(self):
+        import ptah
+
+        class Test(ptah.get_base()):
+            __tablename__ = 'test16'
+
+            id = sqla.Column('id', sqla.Integer, primary_key=True)
+            name = sqla.Column(sqla.Unicode())
+
+        Session = ptah.get_session()
+        ptah.get_base().metadata.create_all()
+        transaction.commit()
+
+        calls = []
+
+        def builder():
+            calls.append(True)
+            return Session.query(Test)\
+                .filter(Test.name == sqla.sql.bindparam('name'))
+
+        sql_get = ptah.QueryFreezer(builder)
+
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = Session.get_bind()
+        sqla.event.listen(engine, 'before_cursor_execute',
+                          before_cursor_execute)
+        try:
+            for i in range(3):
+                sql_get.first(name='test')
+                sql_get.all(name='test')
+            self.assertRaises(
+                sqla.orm.exc.NoResultFound, sql_get.one, name='test')
+        finally:
+            sqla.event.remove(engine, 'before_cursor_execute',
+                              before_cursor_execute)
+
+        self.assertIn('LIMIT', statements[0])
+        self.assertNotIn('LIMIT', statements[1])
+        self.assertIn('LIMIT', statements[-1])
+
+        # query is built once for each of iter/first/one
+        self.assertEqual(len(calls), 3)
+
+        sql_get.reset()
+        sql_get.first(name='test')
+        self.assertEqual(len(calls), 4)
+
+    def test_freezer_stream(self):
+        import ptah
+
+        class Test(ptah.get_base()):
+            __tablename__ = 'test17'
+
+            id = sqla.Column('id', sqla.Integer, primary_key=True)
+            name = sqla.Column(sqla.Unicode())
+
+        Session = ptah.get_session()
+        ptah.get_base().metadata.create_all()
+        transaction.commit()
+
+        Session.add_all([Test(name='test') for i in range(5)])
+        Session.add(Test(name='other'))
+        Session.flush()
+
+        sql_get = ptah.QueryFreezer(
+            lambda: Session.query(Test)
+            .filter(Test.name == sqla.sql.bindparam('name')))
+
+        rows = sql_get.stream(batch_size=2, name='test')
+        self.assertEqual(next(rows).name, 'test')
+        self.assertEqual(len(list(rows)), 4)
+
+    def test_iter_keyset(self):
+        import ptah
+
+        class Test(ptah.get_base()):
+            __tablename__ = 'test18'
+
+            id = sqla.Column('id', sqla.Integer, primary_key=True)
+            name = sqla.Column(sqla.Unicode())
+
+        Session = ptah.get_session()
+        ptah.get_base().metadata.create_all()
+        transaction.commit()
+
+        Session.add_all([Test(id=i, name='test') for i in range(1, 8)])
+        Session.flush()
+
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = Session.get_bind()
+        sqla.event.listen(engine, 'before_cursor_execute',
+                          before_cursor_execute)
+        try:
+            ids = [r.id for r in ptah.iter_keyset(
+                Session.query(Test), Test.id, batch_size=3)]
+        finally:
+            sqla.event.remove(engine, 'before_cursor_execute',
+                              before_cursor_execute)
+
+        self.assertEqual(ids, [1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual(len(statements), 3)
+        self.assertIn('WHERE test18.id > ?', statements[2])
+
+        # resume
+        ids = [r.id for r in ptah.iter_keyset(
+            Session.query(Test), Test.id, batch_size=3, start=5)]
+        self.assertEqual(ids, [6, 7])
+
+        # core table
+        ids = [r.id for r in ptah.iter_keyset(
+            Session.query(Test.__table__), Test.__table__.c.id, 4)]
+        self.assertEqual(ids, [1, 2, 3, 4, 5, 6, 7])
+
 
 class TestJsonDict(PtahTestCase):
 
@@ -341,6 +467,233 @@ class TestJsonList(PtahTestCase):
         self.assertEqual(rec.data, ['test'])
 
 
+class TestMutationTracking(TestCase):
+
+    def _make(self, cls, value):
+        root = cls(value)
+        calls = []
+        root.changed = lambda: calls.append(True)
+        return root, calls
+
+    def test_dict(self):
+        from ptah.sqlautils import MutationDict, TrackedDict, TrackedList
+
+        root, calls = self._make(
+            MutationDict, {'a': {'b': [1, {'c': 1}]}, 'd': 1})
+        self.assertIsInstance(root['a'], TrackedDict)
+        self.assertIsInstance(root['a']['b'], TrackedList)
+        self.assertIsInstance(root['a']['b'][1], TrackedDict)
+
+        root['a']['b'][1]['c'] = 2
+        root['a']['b'][0] = 5
+        self.assertEqual(
+            root.changed_paths(), [('a', 'b', 0), ('a', 'b', 1, 'c')])
+
+        root.update(e=1)
+        root.setdefault('f', {})['g'] = 1
+        root.pop('d')
+        self.assertEqual(root.pop('unknown', None), None)
+        self.assertEqual(
+            sorted(root.changed_paths()),
+            [('a', 'b', 0), ('a', 'b', 1, 'c'), ('d',), ('e',), ('f',)])
+        self.assertEqual(len(calls), 6)
+
+        root['a'] = {}
+        self.assertEqual(
+            sorted(root.changed_paths()), [('a',), ('d',), ('e',), ('f',)])
+
+        root.reset_changes()
+        root.clear()
+        self.assertEqual(root.changed_paths(), [()])
+
+    def test_list(self):
+        from ptah.sqlautils import MutationList
+
+        root, calls = self._make(MutationList, [{'a': 1}, [1, 2]])
+        root[1].extend([3])
+        root[1].insert(0, 0)
+        root[1].pop()
+        root[1].remove(1)
+        root[1] += [5]
+        self.assertEqual(root, [{'a': 1}, [0, 2, 5]])
+        self.assertEqual(root.changed_paths(), [(1,)])
+        self.assertEqual(len(calls), 6)
+
+        # structural changes keep nested indexes
+        root.reset_changes()
+        root.insert(0, 'first')
+        root[1]['a'] = 2
+        root.reset_changes()
+        root[1]['a'] = 3
+        self.assertEqual(root.changed_paths(), [(1, 'a')])
+
+        root.reset_changes()
+        root.sort(key=lambda v: isinstance(v, dict))
+        root.reverse()
+        self.assertEqual(root.changed_paths(), [()])
+
+    def test_pickle(self):
+        import pickle
+        from ptah.sqlautils import MutationDict, MutationList
+
+        root = MutationDict({'a': {'b': [1, {'c': 1}]}})
+        root._parents  # weak parents mapping
+        root['d'] = 1
+
+        data = pickle.loads(pickle.dumps(root))
+        self.assertIsInstance(data, MutationDict)
+        self.assertEqual(data, {'a': {'b': [1, {'c': 1}]}, 'd': 1})
+        self.assertEqual(data.changed_paths(), [])
+
+        data['a']['b'][1]['c'] = 2
+        self.assertEqual(data.changed_paths(), [('a', 'b', 1, 'c')])
+
+        data = pickle.loads(pickle.dumps(MutationList([{'a': 1}])))
+        data[0]['a'] = 2
+        self.assertEqual(data.changed_paths(), [(0, 'a')])
+
+    def test_shared_value(self):
+        from ptah.sqlautils import MutationDict
+
+        root, calls = self._make(MutationDict, {'a': {'b': 1}})
+        root['c'] = root['a']
+        self.assertIsNot(root['c'], root['a'])
+
+        root.reset_changes()
+        root['c']['b'] = 2
+        self.assertEqual(root['a'], {'b': 1})
+        self.assertEqual(root.changed_paths(), [('c', 'b')])
+
+        # removed value is detached
+        value = root.pop('a')
+        root.reset_changes()
+        value['b'] = 3
+        self.assertEqual(root.changed_paths(), [])
+
+
+class TestJsonPartialUpdates(PtahTestCase):
+
+    _init_sqla = False
+
+    def _create(self, tablename, **kw):
+        Base = ptah.get_base()
+
+        class Test(Base):
+            __tablename__ = tablename
+
+            id = sqla.Column('id', sqla.Integer, primary_key=True)
+            data = sqla.Column(ptah.JsonDictType(partial_updates=True))
+            title = sqla.Column(sqla.Unicode())
+
+        Base.metadata.create_all()
+        transaction.commit()
+
+        Session = ptah.get_session()
+        rec = Test(data=kw)
+        Session.add(rec)
+        Session.flush()
+        id = rec.id
+        transaction.commit()
+        return Test, id
+
+    def _updates(self, func):
+        Session = ptah.get_session()
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            if statement.startswith('UPDATE'):
+                statements.append(statement)
+
+        engine = Session.get_bind()
+        sqla.event.listen(engine, 'before_cursor_execute',
+                          before_cursor_execute)
+        try:
+            func()
+            transaction.commit()
+        finally:
+            sqla.event.remove(engine, 'before_cursor_execute',
+                              before_cursor_execute)
+        return statements
+
+    def test_partial_update(self):
+        Test, id = self._create(
+            'test_partial1', a={'b': [1, {'c': 1}]}, d='d')
+        Session = ptah.get_session()
+
+        rec = Session.query(Test).filter_by(id=id).one()
+
+        def update():
+            rec.data['a']['b'][1]['c'] = 2
+            rec.data['e'] = {'f': 'value'}
+            del rec.data['d']
+
+        statements = self._updates(update)
+        self.assertEqual(len(statements), 1)
+        self.assertIn('json_set', statements[0])
+        self.assertIn('json_remove', statements[0])
+
+        rec = Session.query(Test).filter_by(id=id).one()
+        self.assertEqual(
+            rec.data, {'a': {'b': [1, {'c': 2}]}, 'e': {'f': 'value'}})
+
+        # nested list structure change, other columns
+        def update():
+            rec.data['a']['b'].append(3)
+            rec.title = 'title'
+
+        statements = self._updates(update)
+        self.assertEqual(len(statements), 2)
+        self.assertIn('json_set', statements[0])
+        self.assertNotIn('data', statements[1])
+
+        rec = Session.query(Test).filter_by(id=id).one()
+        self.assertEqual(rec.data['a']['b'], [1, {'c': 2}, 3])
+        self.assertEqual(rec.title, 'title')
+
+    def test_full_rewrite(self):
+        Test, id = self._create('test_partial2', a=1)
+        Session = ptah.get_session()
+
+        # replaced value
+        rec = Session.query(Test).filter_by(id=id).one()
+
+        def update():
+            rec.data = {'b': 1}
+            rec.data['c'] = 2
+
+        statements = self._updates(update)
+        self.assertEqual(len(statements), 1)
+        self.assertNotIn('json_set', statements[0])
+
+        rec = Session.query(Test).filter_by(id=id).one()
+        self.assertEqual(rec.data, {'b': 1, 'c': 2})
+
+        # root level change
+        statements = self._updates(lambda: rec.data.clear())
+        self.assertNotIn('json_set', statements[0])
+
+        rec = Session.query(Test).filter_by(id=id).one()
+        self.assertEqual(rec.data, {})
+
+    def test_unsupported_dialect(self):
+        from ptah import sqlautils
+
+        Test, id = self._create('test_partial3', a=1)
+        Session = ptah.get_session()
+        dialect = Session.get_bind().dialect
+
+        sqlautils._dialects[dialect] = None
+        try:
+            rec = Session.query(Test).filter_by(id=id).one()
+            statements = self._updates(lambda: rec.data.update(a=2))
+        finally:
+            del sqlautils._dialects[dialect]
+
+        self.assertNotIn('json_set', statements[0])
+        rec = Session.query(Test).filter_by(id=id).one()
+        self.assertEqual(rec.data, {'a': 2})
+
+
 class TestJsonSerializer(TestCase):
 
     def test_global_custom_serializer(self):
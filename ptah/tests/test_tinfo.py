@@ -440,6 +440,47 @@ class TestSqlTypeInfo(PtahTestCase):
         item = ptah.resolve(uri)
         self.assertTrue(item.id == id)
 
+    def test_uri_resolve_many(self):
+        import ptah
+        import sqlalchemy as sqla
+
+        @ptah.tinfo('mycontent', 'MyContent')
+        class MyContentSql(ptah.get_base()):
+            __tablename__ = 'tinfo_sql_test8'
+
+            id = sqla.Column(sqla.Integer, primary_key=True)
+            test = sqla.Column(sqla.Unicode)
+
+        self.init_ptah()
+
+        sa = ptah.get_session()
+        items = [MyContentSql(test='title%s'%i) for i in range(3)]
+        sa.add_all(items)
+        sa.flush()
+
+        statements = []
+
+        def before_execute(conn, clause, multiparams, params):
+            statements.append(clause)
+
+        engine = sa.get_bind()
+        sqla.event.listen(engine, 'before_execute', before_execute)
+        try:
+            uris = [items[2].__uri__, 'mycontent:0', items[0].__uri__]
+            self.assertEqual(
+                ptah.resolve_many(uris), [items[2], None, items[0]])
+        finally:
+            sqla.event.remove(engine, 'before_execute', before_execute)
+
+        self.assertEqual(len(statements), 1)
+
+        # non canonical uris
+        uris = ['mycontent:0%s' % items[1].id, 'mycontent:abc',
+                items[1].__uri__]
+        self.assertEqual(
+            ptah.resolve_many(uris), [items[1], None, items[1]])
+        self.assertIs(ptah.resolve(uris[0]), items[1])
+
 
 class TestUriProperty(TestCase):
 
@@ -1,7 +1,8 @@
 import transaction
-from datetime import timedelta
+from datetime import datetime, timedelta
 from pyramid.exceptions import ConfigurationConflictError
 
+import ptah
 from ptah.testing import PtahTestCase
 
 
@@ -33,5 +34,210 @@ class TestTokenType(PtahTestCase):
 
         self.assertRaises(ConfigurationConflictError, self.init_ptah)
 
-    def test_token_remove_expired(self):
-        pass
+    def test_token_remove(self):
+        from ptah import token
+
+        tt = token.TokenType('unique-id', timedelta(minutes=20))
+        self.init_ptah()
+
+        t1 = token.service.generate(tt, 'data1')
+        t2 = token.service.generate(tt, 'data2')
+
+        # remove doesn't affect other tokens
+        token.service.remove(t1)
+        self.assertEqual(token.service.get(t1), None)
+        self.assertEqual(token.service.get(t2), 'data2')
+
+    def test_token_expired(self):
+        from ptah import token
+
+        tt = token.TokenType('unique-id', timedelta(minutes=20))
+        self.init_ptah()
+
+        t = token.service.generate(tt, 'data')
+        rec = ptah.get_session().query(token.Token).filter_by(token=t).one()
+        rec.valid = datetime.now() - timedelta(minutes=1)
+
+        self.assertEqual(token.service.get(t), None)
+        self.assertEqual(token.service.get_bydata(tt, 'data'), None)
+
+    def test_token_sweep(self):
+        from ptah import token
+
+        tt = token.TokenType('unique-id', timedelta(minutes=20))
+        self.init_ptah()
+
+        Session = ptah.get_session()
+        tokens = [token.service.generate(tt, 'data%s' % i) for i in range(5)]
+        for rec in Session.query(token.Token).filter(
+                token.Token.token.in_(tokens[:3])):
+            rec.valid = datetime.now() - timedelta(minutes=1)
+        Session.flush()
+
+        self.assertEqual(token.service.sweep_batch(2), 2)
+        self.assertEqual(token.service.sweep(2, commit=False), 1)
+        self.assertEqual(token.service.sweep(2, commit=False), 0)
+
+        self.assertEqual(Session.query(token.Token).count(), 2)
+        self.assertEqual(token.service.get(tokens[4]), 'data4')
+
+    def test_token_periodic_sweep(self):
+        from ptah import token
+
+        tt = token.TokenType('unique-id', timedelta(minutes=20))
+        self.init_ptah()
+
+        def hooks():
+            return [hook for hook, args, kw in
+                    transaction.get().getAfterCommitHooks()
+                    if hook == token.service._start_sweep]
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH)
+        cfg['token_sweep_batch'] = 1
+
+        # disabled by default
+        token.service._last_sweep = 0
+        token.service.generate(tt, 'data')
+        self.assertEqual(hooks(), [])
+
+        # sweep is scheduled after commit once per interval
+        cfg['token_sweep_interval'] = 3600
+        token.service.generate(tt, 'data')
+        token.service.generate(tt, 'data')
+        self.assertEqual(len(hooks()), 1)
+
+        transaction.abort()
+        self.assertIsNone(token.service._start_sweep(False, 1))
+
+        # sweep runs in own transaction
+        Session = ptah.get_session()
+        for t in (token.Token(tt, 'data1'), token.Token(tt, 'data2')):
+            t.valid = datetime.now() - timedelta(minutes=1)
+            Session.add(t)
+        transaction.commit()
+
+        token.service._sweep(1)
+        self.assertEqual(ptah.get_session().query(token.Token).count(), 1)
+
+
+class TestSignedToken(PtahTestCase):
+
+    _init_ptah = False
+
+    def _init(self):
+        from ptah import token
+
+        tt = token.TokenType('signed-id', timedelta(minutes=20), signed=True)
+        self.init_ptah()
+        ptah.get_settings(ptah.CFG_ID_PTAH)['secret'] = 'secret'
+        token.service.revoked.clear()
+        return token, tt
+
+    def test_signed_token(self):
+        token, tt = self._init()
+
+        t = token.service.generate(tt, 'data')
+        self.assertEqual(token.service.get(t), 'data')
+        self.assertIsNone(token.service.get_bydata(tt, 'data'))
+
+        # no database round trip
+        self.assertEqual(ptah.get_session().query(token.Token).count(), 0)
+
+    def test_signed_token_invalid(self):
+        token, tt = self._init()
+
+        t = token.service.generate(tt, 'data')
+        msg, sig = t.rsplit('.', 1)
+        typ, data, expires = msg.split('.')
+
+        self.assertIsNone(token.service.get('%s.%s' % (msg, sig[:-2])))
+        self.assertIsNone(token.service.get('%s.%s' % (msg[1:], sig)))
+        self.assertIsNone(token.service.get('invalid.token'))
+        self.assertIsNone(token.service.get('a.b.c.d'))
+
+        # different secret
+        ptah.get_settings(ptah.CFG_ID_PTAH)['secret'] = 'other'
+        self.assertIsNone(token.service.get(t))
+
+    def test_signed_token_expired(self):
+        token, tt = self._init()
+
+        tt.timeout = timedelta(minutes=-1)
+        t = token.service.generate(tt, 'data')
+        self.assertIsNone(token.service.get(t))
+
+    def test_signed_token_unsigned_type(self):
+        token, tt = self._init()
+
+        t = token.service.generate(tt, 'data')
+        tt.signed = False
+        self.assertIsNone(token.service.get(t))
+
+    def test_signed_token_no_secret(self):
+        token, tt = self._init()
+
+        t = token.service.generate(tt, 'data')
+        ptah.get_settings(ptah.CFG_ID_PTAH)['secret'] = ''
+        self.assertRaises(RuntimeError, token.service.generate, tt, 'data')
+
+        # untrusted tokens are invalid without secret
+        self.assertIsNone(token.service.get(t))
+        self.assertIsNone(token.service.get('YQ.YQ.1.x'))
+        token.service.remove(t)
+        self.assertIsNone(token.service.verify(t))
+
+    def test_signed_token_crafted(self):
+        token, tt = self._init()
+
+        # unknown token type
+        self.assertIsNone(token.service.get('YQ.YQ.1.x'))
+
+        # token type is not signed
+        ptah.get_settings(ptah.CFG_ID_PTAH)['secret'] = ''
+        t = '%s.%s.%x.sig' % (
+            token._b64encode(token.REVOKED.id.encode('utf-8')),
+            token._b64encode(b'data'), 2**40)
+        self.assertIsNone(token.service.get(t))
+
+    def test_signed_token_remove(self):
+        token, tt = self._init()
+
+        t1 = token.service.generate(tt, 'data1')
+        t2 = token.service.generate(tt, 'data2')
+
+        token.service.remove(t1)
+        self.assertIsNone(token.service.get(t1))
+        self.assertEqual(token.service.get(t2), 'data2')
+
+        # revocation list is stored in database
+        token.service.revoked.clear()
+        self.assertIsNone(token.service.get(t1))
+        self.assertEqual(token.service.get(t2), 'data2')
+
+        # revoked tokens are removed by sweeper after expiration
+        rec = ptah.get_session().query(token.Token).one()
+        self.assertEqual(rec.typ, token.REVOKED.id)
+        rec.valid = datetime.now() - timedelta(minutes=1)
+        ptah.get_session().flush()
+        self.assertEqual(token.service.sweep(commit=False), 1)
+
+
+class TestTokenMigration(PtahTestCase):
+
+    def test_migration(self):
+        import sqlalchemy as sqla
+        from ptah.migrate import upgrade
+
+        engine = ptah.get_base().metadata.bind
+        for index in ptah.token.Token.__table__.indexes:
+            index.drop(engine)
+
+        upgrade('ptah.token')
+
+        names = [ix['name'] for ix in
+                 sqla.inspect(engine).get_indexes('ptah_tokens')]
+        self.assertEqual(
+            sorted(names),
+            ['ix_ptah_tokens_token',
+             'ix_ptah_tokens_type_data', 'ix_ptah_tokens_valid'])
+
@@ -106,15 +106,15 @@ class TestUIAction(PtahTestCase):
             __name__ = ''
 
         allow = False
-        def check_permission(permission, content, request=None, throw=False):
-            return allow
+        def check_permissions(permissions, content):
+            return [allow for p in permissions]
 
         ptah.uiaction(Content, 'action1', 'Action 1', permission='View')
 
         self.init_ptah()
 
-        orig_cp = ptah.check_permission
-        ptah.check_permission = check_permission
+        orig_cp = ptah.check_permissions
+        ptah.check_permissions = check_permissions
 
         actions = ptah.list_uiactions(Content(), self.request)
         self.assertEqual(len(actions), 0)
@@ -123,7 +123,104 @@ class TestUIAction(PtahTestCase):
         actions = ptah.list_uiactions(Content(), self.request)
         self.assertEqual(len(actions), 1)
 
-        ptah.check_permission = orig_cp
+        ptah.check_permissions = orig_cp
+
+    def test_uiaction_custom_check(self):
+        from ptah.uiactions import Action, IAction
+
+        class Content(object):
+            __name__ = ''
+
+        class CustomAction(Action):
+            allow = False
+
+            def check(self, context, request):
+                return self.allow
+
+        def check_permissions(permissions, content):
+            self.assertEqual(permissions, [])
+            return []
+
+        self.init_ptah()
+
+        action = CustomAction('custom', title='Custom', permission='View')
+        self.registry.registerAdapter(
+            action, (Content,), IAction, '-custom')
+
+        orig_cp = ptah.check_permissions
+        ptah.check_permissions = check_permissions
+        try:
+            self.assertEqual(ptah.list_uiactions(Content(), self.request), [])
+
+            action.allow = True
+            actions = ptah.list_uiactions(Content(), self.request)
+            self.assertEqual([ac['id'] for ac in actions], ['custom'])
+        finally:
+            ptah.check_permissions = orig_cp
+
+        # custom check is called without request
+        action.allow = False
+        self.assertEqual(
+            ptah.list_uiactions(Content(), registry=self.registry), [])
+
+    def test_uiaction_custom_check_super(self):
+        from ptah.uiactions import Action, IAction
+
+        class Content(object):
+            __name__ = ''
+
+        checks = []
+
+        class CustomAction(Action):
+            def check(self, context, request):
+                checks.append(self.id)
+                return super(CustomAction, self).check(context, request)
+
+        self.init_ptah()
+
+        action1 = CustomAction('action1', title='Action 1')
+        action2 = Action('action2', title='Action 2',
+                         check=lambda context, request: False)
+        self.registry.registerAdapter(
+            action1, (Content,), IAction, '-action1')
+        self.registry.registerAdapter(
+            action2, (Content,), IAction, '-action2')
+
+        actions = ptah.list_uiactions(Content(), self.request)
+        self.assertEqual([ac['id'] for ac in actions], ['action1'])
+        self.assertEqual(checks, ['action1'])
+
+        actions = ptah.list_uiactions(Content(), registry=self.registry)
+        self.assertEqual([ac['id'] for ac in actions], ['action1'])
+
+    def test_uiaction_permission_principals(self):
+        from pyramid.security import Allow
+
+        class Content(object):
+            __name__ = ''
+            __acl__ = [(Allow, 'role:test', 'View')]
+
+        ptah.uiaction(Content, 'action1', 'Action 1', permission='View')
+        ptah.uiaction(Content, 'action2', 'Action 2', permission='Edit')
+        ptah.uiaction(Content, 'action3', 'Action 3')
+
+        calls = []
+
+        @ptah.roles_provider('test-roles')
+        def roles(context, uid, registry):
+            calls.append(uid)
+            return ['role:test']
+
+        self.init_ptah()
+
+        ptah.auth_service.set_userid('test-user')
+
+        actions = ptah.list_uiactions(Content(), self.request)
+        self.assertEqual(
+            sorted(ac['id'] for ac in actions), ['action1', 'action3'])
+
+        # local roles are calculated once for all actions
+        self.assertEqual(calls, ['test-user'])
 
     def test_uiaction_sort_weight(self):
 
@@ -1,6 +1,6 @@
 from pyramid import testing
 from pyramid.exceptions import ConfigurationConflictError
-from ptah.testing import PtahTestCase
+from ptah.testing import PtahTestCase, TestCase
 
 
 class TestUri(PtahTestCase):
@@ -99,3 +99,290 @@ class TestUri(PtahTestCase):
         self.assertTrue(u1.startswith('test:'))
         self.assertTrue(u2.startswith('test:'))
         self.assertTrue(u1 != u2)
+
+
+class TestResolverCache(PtahTestCase):
+
+    _init_ptah = False
+    _auto_commit = False
+
+    def _make_resolver(self):
+        calls = []
+
+        class Ob(object):
+            pass
+
+        def resolver(uri):
+            calls.append(uri)
+            if not uri.endswith('none'):
+                return Ob()
+
+        return resolver, calls
+
+    def test_uri_cache_unknown(self):
+        import ptah
+
+        self.assertRaises(
+            ValueError, ptah.resolver, 'test', cache='unknown')
+
+    def test_uri_cache_request(self):
+        import ptah
+        from ptah.util import tldata
+
+        resolver, calls = self._make_resolver()
+        ptah.resolver.register('test', resolver, cache='request')
+        self.init_ptah()
+
+        ob = ptah.resolve('test:1')
+        self.assertIs(ptah.resolve('test:1'), ob)
+        self.assertIsNone(ptah.resolve('test:none'))
+        self.assertIsNone(ptah.resolve('test:none'))
+        self.assertEqual(calls, ['test:1', 'test:none', 'test:none'])
+
+        # new request
+        tldata.clear()
+        self.assertIsNot(ptah.resolve('test:1'), ob)
+
+    def test_uri_cache_process(self):
+        import ptah
+        from ptah.util import tldata
+
+        resolver, calls = self._make_resolver()
+        ptah.resolver.register('test', resolver, cache='process')
+        self.init_ptah()
+
+        ob = ptah.resolve('test:1')
+        tldata.clear()
+        self.assertIs(ptah.resolve('test:1'), ob)
+        self.assertEqual(calls, ['test:1'])
+
+        info = ptah.uri.get_process_cache().info()
+        self.assertEqual(info['hits'], 1)
+        self.assertEqual(info['misses'], 1)
+        self.assertEqual(info['size'], 1)
+
+    def test_uri_cache_process_settings(self):
+        import ptah
+
+        self.init_ptah()
+
+        cache = ptah.uri.get_process_cache()
+        for idx in range(5):
+            cache.set('test:%s' % idx, idx)
+
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH, self.registry)
+        cfg['resolver_cache_size'] = 2
+        cfg['resolver_cache_ttl'] = 60
+        self.registry.notify(ptah.events.SettingsGroupModified(cfg))
+
+        self.assertIs(ptah.uri.get_process_cache(), cache)
+        self.assertEqual((cache.maxsize, cache.ttl), (2, 60))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('test:4'), 4)
+
+    def test_uri_cache_process_sqla(self):
+        import ptah
+
+        class Ob(object):
+            _sa_instance_state = None
+
+        self.init_ptah()
+
+        cache = ptah.uri.get_process_cache()
+        cache.set('test:1', Ob())
+        self.assertEqual(len(cache), 0)
+
+        request_cache = ptah.uri.get_request_cache()
+        request_cache.set('test:1', Ob())
+        self.assertEqual(len(request_cache), 1)
+
+    def test_uri_cache_request_outside_request(self):
+        import ptah
+        from ptah.util import tldata
+
+        resolver, calls = self._make_resolver()
+
+        @ptah.resolver('test', cache='request')
+        def resolver1(uri):
+            return resolver(uri)
+
+        self.init_ptah()
+        self.assertIsNotNone(ptah.uri.get_request_cache())
+
+        tldata.clear()
+        self.config.end()
+        self.config.begin()
+
+        # objects are not cached outside of request
+        self.assertIsNone(ptah.uri.get_request_cache())
+        ptah.resolve('test:1')
+        ptah.resolve('test:1')
+        self.assertEqual(len(calls), 2)
+        self.assertIsNone(tldata.get(ptah.uri.RESOLVER_CACHE_KEY))
+
+    def test_uri_cache_invalidate(self):
+        import ptah
+
+        resolver, calls = self._make_resolver()
+
+        @ptah.resolver('test1', cache='request')
+        def resolver1(uri):
+            return resolver(uri)
+
+        @ptah.resolver('test2', cache='process')
+        def resolver2(uri):
+            return resolver(uri)
+
+        self.init_ptah()
+
+        ob1 = ptah.resolve('test1:1')
+        ob2 = ptah.resolve('test2:1')
+
+        self.registry.notify(ptah.events.UriInvalidateEvent('test1:1'))
+        self.registry.notify(ptah.events.UriInvalidateEvent('test2:1'))
+
+        self.assertIsNot(ptah.resolve('test1:1'), ob1)
+        self.assertIsNot(ptah.resolve('test2:1'), ob2)
+        self.assertEqual(calls, ['test1:1', 'test2:1', 'test1:1', 'test2:1'])
+
+    def test_uri_cache_pyramid(self):
+        import ptah
+
+        resolver, calls = self._make_resolver()
+
+        self.init_ptah()
+        self.config.ptah_uri_resolver('test', resolver, cache='request')
+        self.config.commit()
+
+        self.assertIs(ptah.resolve('test:1'), ptah.resolve('test:1'))
+        self.assertEqual(calls, ['test:1'])
+
+
+class TestResolveMany(PtahTestCase):
+
+    _init_ptah = False
+    _auto_commit = False
+
+    def test_resolve_many(self):
+        import ptah
+
+        calls = []
+
+        def resolver1(uri):
+            calls.append(uri)
+            return uri.upper()
+
+        def resolver2(uri):
+            raise KeyError(uri)
+
+        ptah.resolver.register('test1', resolver1)
+        ptah.resolver.register('test2', resolver2)
+        self.init_ptah()
+
+        self.assertEqual(
+            ptah.resolve_many(
+                ['test1:a', None, 'unknown', 'unknown:a',
+                 'test2:a', 'test1:b', 'test1:a']),
+            ['TEST1:A', None, None, None, None, 'TEST1:B', 'TEST1:A'])
+        self.assertEqual(calls, ['test1:a', 'test1:b'])
+        self.assertEqual(ptah.resolve_many([]), [])
+
+    def test_resolve_many_batch(self):
+        import ptah
+
+        calls = []
+
+        def resolver(uri):
+            raise AssertionError('batch resolver expected')
+
+        def batch(uris):
+            calls.append(list(uris))
+            return dict((uri, uri.upper()) for uri in uris
+                        if not uri.endswith('none'))
+
+        ptah.resolver.register('test', resolver, batch=batch)
+        self.init_ptah()
+
+        self.assertEqual(
+            ptah.resolve_many(['test:b', 'test:none', 'test:a', 'test:b']),
+            ['TEST:B', None, 'TEST:A', 'TEST:B'])
+        self.assertEqual(calls, [['test:b', 'test:none', 'test:a']])
+
+    def test_resolve_many_cache(self):
+        import ptah
+
+        calls = []
+
+        def resolver(uri):
+            """ """
+
+        def batch(uris):
+            calls.append(list(uris))
+            return dict((uri, object()) for uri in uris)
+
+        self.init_ptah()
+        self.config.ptah_uri_resolver(
+            'test', resolver, cache='request', batch=batch)
+        self.config.commit()
+
+        ob1, ob2 = ptah.resolve_many(['test:1', 'test:2'])
+        self.assertEqual(ptah.resolve_many(['test:2', 'test:3', 'test:1'])[::2],
+                         [ob2, ob1])
+        self.assertIs(ptah.resolve('test:1'), ob1)
+        self.assertEqual(calls, [['test:1', 'test:2'], ['test:3']])
+
+
+class TestResolverCacheImpl(TestCase):
+
+    def test_lru(self):
+        from ptah.uri import ResolverCache
+
+        cache = ResolverCache(2)
+        cache.set('test:1', 1)
+        cache.set('test:2', 2)
+
+        self.assertEqual(cache.get('test:1'), 1)
+
+        cache.set('test:3', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('test:2'))
+        self.assertEqual(cache.get('test:1'), 1)
+        self.assertEqual(cache.get('test:3'), 3)
+
+        cache.invalidate('test:1')
+        self.assertIsNone(cache.get('test:1'))
+
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(
+            cache.info(),
+            {'hits': 3, 'misses': 2, 'size': 0, 'maxsize': 2, 'ttl': None})
+
+    def test_configure(self):
+        from ptah.uri import ResolverCache
+
+        cache = ResolverCache()
+        for idx in range(3):
+            cache.set('test:%s' % idx, idx)
+
+        cache.configure(1, 10)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get('test:2'), 2)
+        self.assertEqual(cache.info()['ttl'], 10)
+
+    def test_ttl(self):
+        import time
+        from ptah.uri import ResolverCache
+
+        cache = ResolverCache(ttl=10)
+        cache.set('test:1', 1)
+        self.assertEqual(cache.get('test:1'), 1)
+
+        orig_time = time.time
+        time.time = lambda: orig_time() + 11
+        try:
+            self.assertIsNone(cache.get('test:1'))
+        finally:
+            time.time = orig_time
+
+        self.assertEqual(len(cache), 0)
@@ -25,3 +25,85 @@ class TestJson(TestCase):
         self.assertEqual(
             util.json.loads('{"int":10,"str":"string"}'),
             {'int': 10, 'str': 'string'})
+
+
+class TestJsonCodec(TestCase):
+
+    def tearDown(self):
+        from ptah import util
+        util.set_json_codec()
+
+    def test_codecs(self):
+        from ptah import util
+
+        data = {'date': datetime(2011, 10, 1, 1, 56),
+                'list': [1, 2.5, None, True],
+                'unknown': object(),
+                1: 'int key',
+                'str': 'string/\u0444'}
+
+        for name, codec in util.json_codecs.items():
+            self.assertEqual(
+                codec.loads(codec.dumps(data)),
+                {'date': 'Sat, 01 Oct 2011 01:56:00 -0000',
+                 'list': [1, 2.5, None, True],
+                 'unknown': None,
+                 '1': 'int key',
+                 'str': 'string/\u0444'}, name)
+
+    def test_set_codec(self):
+        from ptah import util
+
+        self.assertIn('json', util.json_codecs)
+        self.assertIn(util.get_json_codec().name, ('simplejson', 'json'))
+
+        codec = util.set_json_codec('json')
+        self.assertIs(util.get_json_codec(), codec)
+        self.assertEqual(codec.name, 'json')
+        self.assertEqual(repr(codec), "<JsonCodec 'json'>")
+        self.assertEqual(util.json.dumps({'a': [1]}), '{"a":[1]}')
+        self.assertEqual(util.json.loads('{"a":[1]}'), {'a': [1]})
+
+        self.assertRaises(KeyError, util.set_json_codec, 'unknown')
+
+        util.set_json_codec('auto')
+        self.assertTrue(util.get_json_codec().compatible)
+        self.assertIn(util.get_json_codec().name, ('simplejson', 'json'))
+
+    def test_auto_codec_compatible(self):
+        import json
+        from ptah import util
+
+        data = {'big': 2**70, 'text': '\u0444'}
+        util.set_json_codec('auto')
+        self.assertEqual(
+            util.json.dumps(data),
+            json.dumps(data, separators=(',', ':')))
+
+    def test_fast_codecs_fallback(self):
+        from ptah import util
+
+        data = {'big': 2**70, 'text': '\u0444',
+                'date': datetime(2011, 10, 1, 1, 56)}
+        for name, codec in util.json_codecs.items():
+            util.set_json_codec(name)
+            self.assertEqual(
+                util.json.loads(util.json.dumps(data)),
+                {'big': 2**70, 'text': '\u0444',
+                 'date': 'Sat, 01 Oct 2011 01:56:00 -0000'}, name)
+
+    def test_register_codec(self):
+        from ptah import util
+
+        util.register_json_codec('test', lambda ob: 'dumped', lambda s: 1)
+        try:
+            util.set_json_codec('test')
+            self.assertEqual(util.json.dumps({}), 'dumped')
+            self.assertEqual(util.json.loads('{}'), 1)
+
+            # custom parameters
+            self.assertEqual(util.json.dumps({}, sort_keys=True), '{}')
+            self.assertEqual(
+                util.json.loads('{"a":1}', object_hook=len), 1)
+        finally:
+            del util.json_codecs['test']
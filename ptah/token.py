@@ -1,16 +1,29 @@
 """ simple token service """
+import hmac
+import time
 import uuid
+import base64
+import hashlib
+import threading
+import logging
 import datetime
+import transaction
 import sqlalchemy as sqla
 
 import ptah
 from ptah import config
+from ptah.migrate import register_migration
 from ptah.sqlautils import QueryFreezer
 
 __all__ = ['TokenType', 'service']
 
 ID_TOKEN_TYPE = 'ptah:tokentype'
 
+log = logging.getLogger('ptah.token')
+
+register_migration(
+    'ptah.token', 'ptah:migrations/token', 'Ptah token storage migration')
+
 
 class TokenType(object):
     """ Token type interface
@@ -19,13 +32,19 @@ class TokenType(object):
     for token type identification in tokens storage.
 
     ``timeout`` token timout, it has to be timedelta instance.
+
+    ``signed`` issue stateless tokens, token contains type, data and
+    expiration time signed with ``ptah.secret`` setting. Such tokens
+    are not stored in database, removed tokens are stored in
+    revocation list until expiration.
     """
 
-    def __init__(self, id, timeout, title='', description=''):
+    def __init__(self, id, timeout, title='', description='', signed=False):
         self.id = id
         self.timeout = timeout
         self.title = title
         self.description = description
+        self.signed = signed
 
         info = config.DirectiveInfo()
         discr = (ID_TOKEN_TYPE, id)
@@ -38,7 +57,8 @@ class TokenType(object):
             config.Action(
                 lambda config, id, tp: \
                     config.get_cfg_storage(ID_TOKEN_TYPE).update({id: tp}),
-                (id, self), discriminator=discr, introspectables=(intr,))
+                (id, self), discriminator=discr, introspectables=(intr,),
+                storage=ID_TOKEN_TYPE)
             )
 
 
@@ -47,12 +67,21 @@ class TokenService(object):
 
     _sql_get = QueryFreezer(
         lambda: ptah.get_session().query(Token).filter(
-            Token.token == sqla.sql.bindparam('token')))
+            sqla.sql.and_(Token.token == sqla.sql.bindparam('token'),
+                          Token.valid > sqla.sql.bindparam('now'))))
 
     _sql_get_by_data = QueryFreezer(
         lambda: ptah.get_session().query(Token).filter(
-            sqla.sql.and_(Token.data == sqla.sql.bindparam('data'),
-                          Token.typ == sqla.sql.bindparam('typ'))))
+            sqla.sql.and_(Token.typ == sqla.sql.bindparam('typ'),
+                          Token.data == sqla.sql.bindparam('data'),
+                          Token.valid > sqla.sql.bindparam('now'))))
+
+    #: time of last periodic sweep
+    _last_sweep = 0
+
+    def __init__(self):
+        self.revoked = RevocationList()
+        self.sweep_lock = threading.Lock()
 
     def generate(self, typ, data):
         """ Generate and return string token.
@@ -60,31 +89,223 @@ class TokenService(object):
         ``type`` object implemented ITokenType interface.
 
         ``data`` token type specific data, it must be python string. """
+        if typ.signed:
+            return self.sign(typ, data)
 
         t = Token(typ, data)
 
         Session = ptah.get_session()
         Session.add(t)
         Session.flush()
+
+        self.periodic_sweep()
         return t.token
 
     def get(self, token):
         """ Get data for token """
-        t = self._sql_get.first(token=token)
+        if '.' in token:
+            info = self.verify(token)
+            if info is not None and info[2] not in self.revoked:
+                return info[0]
+            return None
+
+        t = self._sql_get.first(token=token, now=datetime.datetime.now())
         if t is not None:
             return t.data
 
     def get_bydata(self, typ, data):
-        """ Get token for data """
-        t = self._sql_get_by_data.first(data=data, typ=typ.id)
+        """ Get token for data, signed tokens are not stored,
+        so it always returns None for signed token type """
+        if typ.signed:
+            return None
+
+        t = self._sql_get_by_data.first(
+            data=data, typ=typ.id, now=datetime.datetime.now())
         if t is not None:
             return t.token
 
     def remove(self, token):
         """ Remove token """
+        if '.' in token:
+            info = self.verify(token)
+            if info is not None:
+                self.revoked.revoke(info[2], info[1])
+            return
+
         ptah.get_session().query(Token).filter(
-            sqla.sql.or_(Token.token == token,
-                         Token.valid > datetime.datetime.now())).delete()
+            Token.token == token).delete(synchronize_session=False)
+
+    def _secret(self):
+        return ptah.get_settings(ptah.CFG_ID_PTAH).snapshot.secret
+
+    def _signature(self, msg, secret):
+        return _b64encode(hmac.new(
+            secret.encode('utf-8'),
+            ('ptah.token:' + msg).encode('utf-8'), hashlib.sha256).digest())
+
+    def sign(self, typ, data):
+        """ Generate signed token """
+        expires = int(time.time() + typ.timeout.total_seconds())
+        msg = '%s.%s.%x' % (
+            _b64encode(typ.id.encode('utf-8')),
+            _b64encode(data.encode('utf-8')), expires)
+        secret = self._secret()
+        if not secret:
+            raise RuntimeError(
+                '"ptah.secret" setting is required for signed tokens')
+
+        return '%s.%s' % (msg, self._signature(msg, secret))
+
+    def verify(self, token):
+        """ Verify signed token, return (data, expires, signature) or
+        None if token is invalid or expired, token type is not signed
+        or ``ptah.secret`` setting is not set """
+        try:
+            msg, sig = token.rsplit('.', 1)
+            typ, data, expires = msg.split('.')
+            expires = int(expires, 16)
+            typ = _b64decode(typ)
+            data = _b64decode(data)
+        except (ValueError, TypeError):
+            return None
+
+        tp = config.get_cfg_storage(ID_TOKEN_TYPE).get(typ)
+        if tp is None or not tp.signed:
+            return None
+
+        secret = self._secret()
+        if not secret or \
+                not hmac.compare_digest(self._signature(msg, secret), sig) or \
+                expires <= time.time():
+            return None
+
+        return data, expires, sig
+
+    def sweep_batch(self, batch_size=1000, now=None):
+        """ Remove up to `batch_size` expired tokens, return number of
+        removed tokens """
+        if now is None:
+            now = datetime.datetime.now()
+
+        Session = ptah.get_session()
+        ids = [id for id, in Session.query(Token.id)
+               .filter(Token.valid <= now).limit(batch_size)]
+        if ids:
+            Session.query(Token).filter(
+                Token.id.in_(ids)).delete(synchronize_session=False)
+        return len(ids)
+
+    def sweep(self, batch_size=1000, commit=True):
+        """ Remove all expired tokens in batches of `batch_size` tokens,
+        with `commit` each batch is committed in separate transaction.
+        Return number of removed tokens """
+        now = datetime.datetime.now()
+
+        total = 0
+        while True:
+            removed = self.sweep_batch(batch_size, now)
+            total += removed
+            if commit:
+                transaction.commit()
+            if removed < batch_size:
+                return total
+
+    def periodic_sweep(self):
+        """ Schedule removal of one batch of expired tokens, at most once
+        per ``ptah.token_sweep_interval`` seconds, disabled by default.
+        It is called by :py:meth:`generate`. Batch is removed after commit
+        of current transaction in separate thread with its own
+        transaction, so request transaction does not hold locks of
+        removed rows. Use ``ptah-tokens --sweep`` script instead. """
+        cfg = ptah.get_settings(ptah.CFG_ID_PTAH).snapshot
+        interval = cfg.token_sweep_interval
+        if interval <= 0:
+            return
+
+        with self.sweep_lock:
+            now = time.time()
+            if now - self._last_sweep <= interval:
+                return
+            self._last_sweep = now
+
+        transaction.get().addAfterCommitHook(
+            self._start_sweep, (cfg.token_sweep_batch,))
+
+    def _start_sweep(self, success, batch_size):
+        if success:
+            thread = threading.Thread(
+                target=self._sweep, args=(batch_size,),
+                name='ptah-token-sweep')
+            thread.daemon = True
+            thread.start()
+            return thread
+
+    def _sweep(self, batch_size):
+        try:
+            with transaction.manager:
+                removed = self.sweep_batch(batch_size)
+            if removed:
+                log.info('Removed %s expired tokens', removed)
+        except Exception:
+            log.exception('Expired tokens sweep failed')
+        finally:
+            ptah.get_session().remove()
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(data):
+    data = data.encode('ascii')
+    return base64.urlsafe_b64decode(
+        data + b'=' * (-len(data) % 4)).decode('utf-8')
+
+
+class RevocationList(object):
+    """ Revoked signed tokens. Revoked tokens are stored in tokens table
+    until expiration, list is cached in process and reloaded
+    every `ttl` seconds """
+
+    typ = 'ptah:revoked'
+    ttl = 5
+
+    def __init__(self):
+        self.revoked = {}
+        self.loaded = 0
+        self.lock = threading.Lock()
+
+    def __contains__(self, sig):
+        if time.time() - self.loaded > self.ttl:
+            self.load()
+        return sig in self.revoked
+
+    def load(self):
+        now = datetime.datetime.now()
+        revoked = dict(
+            (t.token, t.valid) for t in
+            ptah.get_session().query(Token.token, Token.valid)
+            .filter(Token.typ == self.typ, Token.valid > now))
+
+        with self.lock:
+            self.revoked = revoked
+            self.loaded = time.time()
+
+    def revoke(self, sig, expires):
+        valid = datetime.datetime.fromtimestamp(expires)
+
+        t = Token(REVOKED, '')
+        t.token = sig
+        t.valid = valid
+        ptah.get_session().add(t)
+
+        with self.lock:
+            self.revoked[sig] = valid
+
+    def clear(self):
+        with self.lock:
+            self.revoked = {}
+            self.loaded = 0
 
 
 service = TokenService()
@@ -94,11 +315,15 @@ class Token(ptah.get_base()):
     __tablename__ = 'ptah_tokens'
 
     id = sqla.Column(sqla.Integer, primary_key=True)
-    token = sqla.Column(sqla.Unicode(48))
-    valid = sqla.Column(sqla.DateTime)
+    token = sqla.Column(sqla.Unicode(48), index=True)
+    valid = sqla.Column(sqla.DateTime, index=True)
     data = sqla.Column(sqla.Text)
     typ = sqla.Column('type', sqla.Unicode(48))
 
+    __table_args__ = (
+        sqla.Index('ix_ptah_tokens_type_data', 'type', 'data',
+                   mysql_length={'data': 255}),)
+
     def __init__(self, typ, data):
         super(Token, self).__init__()
 
@@ -106,3 +331,7 @@ class Token(ptah.get_base()):
         self.data = data
         self.valid = datetime.datetime.now() + typ.timeout
         self.token = uuid.uuid4().hex
+
+
+REVOKED = TokenType(
+    RevocationList.typ, datetime.timedelta(0), 'Revoked signed tokens')
@@ -8,10 +8,13 @@ from pyramid.exceptions import ConfigurationError
 
 import ptah
 from ptah import config
-from ptah.uri import ID_RESOLVER
+from ptah.uri import ID_RESOLVER, ID_RESOLVER_BATCH
 from ptah.security import NOT_ALLOWED
 from ptah.interfaces import ITypeInformation, Forbidden, TypeException
 
+#: Maximum number of primary keys in one `IN` clause of batch resolver
+BATCH_RESOLVE_SIZE = 500
+
 log = logging.getLogger('ptah')
 
 TYPES_DIR_ID = 'ptah:type'
@@ -126,14 +129,17 @@ class TypeInformation(object):
                 if isinstance(tinfo, string_types):
                     tinfo = all_types.get('type:%s'%tinfo)
 
-                if tinfo and tinfo.is_allowed(container):
+                if tinfo:
                     types.append(tinfo)
         else:
             for tinfo in all_types.values():
-                if tinfo.global_allow and tinfo.is_allowed(container):
+                if tinfo.global_allow:
                     types.append(tinfo)
 
-        return types
+        allowed = ptah.check_permissions(
+            [tinfo.permission for tinfo in types], container)
+
+        return [tinfo for tinfo, permitted in zip(types, allowed) if permitted]
 
 
 class tinfo(object):
@@ -229,11 +235,42 @@ def register_sqla_type(config, cls, tinfo, name, **kw):
             """Content resolver for %s type'"""%tinfo.name
             return cls.__uri_sql_get__.first(uri=uri[l:])
 
+        def batch_resolver(uris):
+            """Batch content resolver for %s type"""%tinfo.name
+            column = getattr(cls, pname)
+            try:
+                parse = column.type.python_type
+            except NotImplementedError:
+                parse = None
+
+            # uris by parsed primary key, 'type:01' and 'type:1'
+            # resolve to same object
+            keys = {}
+            for uri in uris:
+                key = uri[l:]
+                if parse is not None:
+                    try:
+                        key = parse(key)
+                    except (TypeError, ValueError):
+                        continue
+                keys.setdefault(key, []).append(uri)
+
+            result = {}
+            keys_list = list(keys)
+            for idx in range(0, len(keys_list), BATCH_RESOLVE_SIZE):
+                chunk = keys_list[idx:idx+BATCH_RESOLVE_SIZE]
+                for ob in ptah.get_session().query(cls) \
+                        .filter(column.in_(chunk)):
+                    for uri in keys.get(getattr(ob, pname), ()):
+                        result[uri] = ob
+            return result
+
         storage = config.get_cfg_storage(ID_RESOLVER)
         if tinfo.name in storage:
             raise ConfigurationError(
                 'Resolver for "%s" already registered'%tinfo.name)
         storage[tinfo.name] = resolver
+        config.get_cfg_storage(ID_RESOLVER_BATCH)[tinfo.name] = batch_resolver
 
 
 class UriProperty(object):
@@ -50,6 +50,9 @@ class Action(object):
                 self.permission, context, request):
                 return False
 
+        return self.check_condition(context, request)
+
+    def check_condition(self, context, request):
         if self.condition is not None:
             return self.condition(context, request)
 
@@ -94,6 +97,11 @@ def uiaction(context, id, title, description='',
         )
 
 
+def _plain_action(action):
+    """ Action with default `check` implementation """
+    return type(action) is Action and 'check' not in action.__dict__
+
+
 def list_uiactions(content, request=None, registry=None, category=''):
     """ List ui actions for specific content """
     if request is not None:
@@ -102,15 +110,38 @@ def list_uiactions(content, request=None, registry=None, category=''):
     else:
         url = ''
 
+    candidates = [
+        action for name, action in
+        registry.adapters.lookupAll((providedBy(content),), IAction)
+        if action.category == category]
+
+    # permissions of plain actions are checked with one batch call,
+    # custom actions are checked with their `check` method
+    if request is None:
+        allowed = iter(())
+    else:
+        allowed = iter(ptah.check_permissions(
+            [action.permission for action in candidates
+             if _plain_action(action)], content))
+
+    checked = []
+    for action in candidates:
+        if not _plain_action(action):
+            if action.check(content, request):
+                checked.append(action)
+        elif request is None or (next(allowed) and
+                                 action.check_condition(content, request)):
+            checked.append(action)
+    candidates = checked
+
     actions = []
-    for name, action in registry.adapters.lookupAll((providedBy(content),), IAction):
-        if (action.category == category) and action.check(content, request):
-            actions.append(
-                (action.sort_weight,
-                 {'id': action.id,
-                  'url': action.url(content, request, url),
-                  'title': action.title,
-                  'description': action.description,
-                  'data': action.data}))
+    for action in candidates:
+        actions.append(
+            (action.sort_weight,
+             {'id': action.id,
+              'url': action.url(content, request, url),
+              'title': action.title,
+              'description': action.description,
+              'data': action.data}))
 
     return [ac for _w, ac in sorted(actions, key=lambda action: action[0])]
@@ -1,8 +1,30 @@
 """ uri resolver """
+import time
 import uuid
+import threading
+from collections import OrderedDict
+
+from pyramid.threadlocal import get_current_request
+
 from ptah import config
+from ptah.util import tldata, CacheStats
+from ptah.events import UriInvalidateEvent, SettingsGroupModified
 
 ID_RESOLVER = 'ptah:resolver'
+ID_RESOLVER_BATCH = 'ptah:resolver-batch'
+ID_RESOLVER_CACHE = 'ptah:resolver-cache'
+ID_RESOLVER_PROCESS_CACHE = 'ptah:resolver-process-cache'
+ID_RESOLVER_TABLE = 'ptah:resolver-table'
+
+#: cache resolved objects for the duration of request
+REQUEST_CACHE = 'request'
+
+#: cache resolved objects in process wide LRU cache
+PROCESS_CACHE = 'process'
+
+RESOLVER_CACHE_KEY = '__ptah_resolver_cache__'
+
+_marker = object()
 
 
 def resolve(uri):
@@ -11,6 +33,9 @@ def resolve(uri):
     Uri contains two parts, `schema` and `uuid`. `schema` is used for
     resolver selection. `uuid` is resolver specific data. By default
     uuid is a uuid.uuid4 string.
+
+    Results of resolvers registered with `cache` flag are cached,
+    see :py:class:`ptah.resolver`.
     """
     if not uri:
         return
@@ -21,13 +46,103 @@ def resolve(uri):
         return None
 
     try:
-        return config.get_cfg_storage(ID_RESOLVER)[schema](uri)
+        entry = config.get_cfg_storage(ID_RESOLVER_TABLE).get(schema)
+        if entry is not None:
+            resolver, policy = entry
+        else:
+            # configuration is not frozen yet
+            resolver = config.get_cfg_storage(ID_RESOLVER)[schema]
+            policy = config.get_cfg_storage(ID_RESOLVER_CACHE).get(schema)
+
+        cache = _get_cache(policy)
+        if cache is None:
+            return resolver(uri)
+
+        ob = cache.get(uri, _marker)
+        if ob is _marker:
+            ob = resolver(uri)
+            if ob is not None:
+                cache.set(uri, ob)
+        return ob
     except KeyError:
         pass
 
     return None
 
 
+def resolve_many(uris):
+    """ Resolve sequence of uris, return list of resolved objects in
+    same order, ``None`` for unresolved uris.
+
+    Uris are grouped by schema, if resolver has registered `batch`
+    callable, all uris of the schema are resolved with one call,
+    otherwise resolver is called for each uri.
+    """
+    result = [None] * len(uris)
+
+    groups = OrderedDict()
+    for idx, uri in enumerate(uris):
+        if uri:
+            schema, sep, data = uri.partition(':')
+            if sep:
+                groups.setdefault(schema, []).append((idx, uri))
+
+    resolvers = config.get_cfg_storage(ID_RESOLVER)
+    batches = config.get_cfg_storage(ID_RESOLVER_BATCH)
+    policies = config.get_cfg_storage(ID_RESOLVER_CACHE)
+
+    for schema, items in groups.items():
+        resolver = resolvers.get(schema)
+        if resolver is None:
+            continue
+
+        cache = _get_cache(policies.get(schema))
+
+        resolved = {}
+        pending = []
+        for idx, uri in items:
+            if uri not in resolved:
+                ob = _marker if cache is None else cache.get(uri, _marker)
+                if ob is _marker:
+                    pending.append(uri)
+                resolved[uri] = ob
+
+        if pending:
+            batch = batches.get(schema)
+            if batch is not None:
+                data = batch(pending)
+            else:
+                data = {}
+                for uri in pending:
+                    try:
+                        data[uri] = resolver(uri)
+                    except KeyError:
+                        pass
+
+            for uri in pending:
+                ob = resolved[uri] = data.get(uri)
+                if cache is not None and ob is not None:
+                    cache.set(uri, ob)
+
+        for idx, uri in items:
+            result[idx] = resolved[uri]
+
+    return result
+
+
+def _resolver_table(registry):
+    """ Prebound resolvers table, schema -> (resolver, cache policy) """
+    policies = config.get_cfg_storage(ID_RESOLVER_CACHE, registry)
+    return dict(
+        (schema, (resolver, policies.get(schema)))
+        for schema, resolver in
+        config.get_cfg_storage(ID_RESOLVER, registry).items())
+
+
+config.prebind(
+    ID_RESOLVER_TABLE, _resolver_table, ID_RESOLVER, ID_RESOLVER_CACHE)
+
+
 def extract_uri_schema(uri):
     """ Extract schema of given uri """
     if uri:
@@ -45,6 +160,10 @@ class resolver(object):
     registration.
 
         :param schema: uri schema
+        :param cache: Resolver cache, ``None``, ``'request'`` or ``'process'``
+        :param batch: Callable object that accepts list of uris and
+           returns mapping of uri to resolved object,
+           it is used by :py:func:`ptah.resolve_many`
 
         Resolver interface :py:class:`ptah.interfaces.resolver`
 
@@ -58,39 +177,73 @@ class resolver(object):
 
           # now its possible to resolver 'custom-schema:xxx' uri's
           ptah.resolve('custom-schema:xxx')
+
+    Resolved objects can be cached with `cache` parameter,
+    :py:data:`ptah.uri.REQUEST_CACHE` caches objects for the duration
+    of request, :py:data:`ptah.uri.PROCESS_CACHE` uses process wide
+    LRU cache, its size and entries ttl are defined by
+    ``ptah.resolver_cache_size`` and ``ptah.resolver_cache_ttl``
+    settings. Cached uri is evicted by
+    :py:class:`ptah.events.UriInvalidateEvent`. Outside of request
+    objects are not cached with :py:data:`ptah.uri.REQUEST_CACHE`.
+
+    Process cache is shared between threads and sessions, use it only
+    for immutable or thread safe objects. Sqlalchemy mapped instances
+    belong to session of one thread, they are never stored in process
+    cache, use :py:data:`ptah.uri.REQUEST_CACHE` for sqlalchemy resolvers.
+
+        .. code-block:: python
+
+          @ptah.resolver('custom-schema', cache=ptah.uri.REQUEST_CACHE)
+          def my_resolver(uri):
+             ....
     """
 
-    def __init__(self, schema, __depth=1):
+    def __init__(self, schema, __depth=1, cache=None, batch=None):
         self.depth = __depth
         self.info = config.DirectiveInfo(__depth)
         self.discr = (ID_RESOLVER, schema)
 
+        if cache not in (None, REQUEST_CACHE, PROCESS_CACHE):
+            raise ValueError('Unknown resolver cache: %r' % (cache,))
+
         self.intr = config.Introspectable(
             ID_RESOLVER, self.discr, schema, 'ptah-uriresolver')
         self.intr['schema'] = schema
+        self.intr['cache'] = cache
+        self.intr['batch'] = batch
         self.intr['codeinfo'] = self.info.codeinfo
 
     def __call__(self, resolver, cfg=None):
         self.intr.title = resolver.__doc__
         self.intr['callable'] = resolver
 
+        def _register(cfg, schema, resolver, cache, batch):
+            cfg.get_cfg_storage(ID_RESOLVER).update({schema: resolver})
+            if cache is not None:
+                cfg.get_cfg_storage(ID_RESOLVER_CACHE)[schema] = cache
+            if batch is not None:
+                cfg.get_cfg_storage(ID_RESOLVER_BATCH)[schema] = batch
+
+        intr = self.intr
         self.info.attach(
             config.Action(
-                lambda cfg, schema, resolver:
-                    cfg.get_cfg_storage(ID_RESOLVER)\
-                        .update({schema: resolver}),
-                (self.intr['schema'], resolver),
-                discriminator=self.discr, introspectables=(self.intr,)),
+                _register,
+                (intr['schema'], resolver, intr['cache'], intr['batch']),
+                discriminator=self.discr, introspectables=(self.intr,),
+                storage=(ID_RESOLVER, ID_RESOLVER_CACHE, ID_RESOLVER_BATCH)),
             cfg, self.depth)
 
         return resolver
 
     @classmethod
-    def register(cls, schema, resolver):
+    def register(cls, schema, resolver, cache=None, batch=None):
         """ Register resolver for given schema
 
         :param schema: uri schema
         :param resolver: Callable object that accept one parameter.
+        :param cache: Resolver cache, ``None``, ``'request'`` or ``'process'``
+        :param batch: Batch resolver for :py:func:`ptah.resolve_many`
 
         Example:
 
@@ -107,10 +260,10 @@ class resolver(object):
           ptah.resolve('custom-schema:xxx')
 
         """
-        cls(schema, 2)(resolver)
+        cls(schema, 2, cache, batch)(resolver)
 
     @classmethod
-    def pyramid(cls, cfg, schema, resolver):
+    def pyramid(cls, cfg, schema, resolver, cache=None, batch=None):
         """ pyramid configurator directive `ptah_uri_resolver`.
 
         .. code-block:: python
@@ -123,7 +276,150 @@ class resolver(object):
 
             config.ptah_uri_resolver('custom-schema', my_resolver)
         """
-        cls(schema, 3)(resolver, cfg)
+        cls(schema, 3, cache, batch)(resolver, cfg)
+
+
+class ResolverCache(object):
+    """ Thread safe LRU cache for resolved objects
+
+    :param maxsize: Maximum number of cached objects, None is unbounded
+    :param ttl: Cached object time to live in seconds, None is forever
+    :param shared: Cache is shared between threads, sqlalchemy mapped
+        instances are not cached
+    """
+
+    def __init__(self, maxsize=None, ttl=None, shared=False):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = CacheStats()
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, uri, default=None):
+        with self.lock:
+            try:
+                ob, expires = self.data[uri]
+            except KeyError:
+                self.stats.misses += 1
+                return default
+
+            if expires is not None and expires < time.time():
+                del self.data[uri]
+                self.stats.misses += 1
+                return default
+
+            self.data.move_to_end(uri)
+            self.stats.hits += 1
+            return ob
+
+    def set(self, uri, ob):
+        if self.shared and hasattr(ob, '_sa_instance_state'):
+            return
+
+        expires = None if self.ttl is None else time.time() + self.ttl
+
+        with self.lock:
+            self.data[uri] = (ob, expires)
+            self.data.move_to_end(uri)
+            self._trim()
+
+    def _trim(self):
+        if self.maxsize is not None:
+            while len(self.data) > self.maxsize:
+                self.data.popitem(False)
+
+    def configure(self, maxsize=None, ttl=None):
+        """ Change size and ttl, evict oldest objects over new size """
+        with self.lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._trim()
+
+    def invalidate(self, uri=None):
+        """ Evict `uri` from cache, evict everything if `uri` is None """
+        with self.lock:
+            if uri is None:
+                self.data.clear()
+            else:
+                self.data.pop(uri, None)
+
+    def info(self):
+        info = self.stats.info()
+        info.update(size=len(self.data), maxsize=self.maxsize, ttl=self.ttl)
+        return info
+
+
+#: Counters of all request scoped resolver caches
+request_cache_stats = CacheStats()
+
+
+def get_request_cache():
+    """ Return request scoped resolver cache, ``None`` outside of request.
+    Thread local data is reset only on new request, objects resolved in
+    background threads are never cached. """
+    if get_current_request() is None:
+        return None
+
+    cache = tldata.get(RESOLVER_CACHE_KEY)
+    if cache is None:
+        cache = ResolverCache()
+        cache.stats = request_cache_stats
+        tldata.set(RESOLVER_CACHE_KEY, cache)
+    return cache
+
+
+def _get_cache(policy):
+    if policy is None:
+        return None
+    elif policy == PROCESS_CACHE:
+        return get_process_cache()
+    return get_request_cache()
+
+
+def get_process_cache(registry=None):
+    """ Return process wide resolver cache """
+    return config.get_cfg_storage(
+        ID_RESOLVER_PROCESS_CACHE, registry,
+        default_factory=_process_cache_factory)
+
+
+def _cache_settings(registry=None):
+    from ptah import CFG_ID_PTAH
+    from ptah.settings import get_settings
+
+    try:
+        cfg = get_settings(CFG_ID_PTAH, registry)
+        return (cfg['resolver_cache_size'] or None,
+                cfg['resolver_cache_ttl'] or None)
+    except KeyError:
+        return 1000, None
+
+
+def _process_cache_factory():
+    maxsize, ttl = _cache_settings()
+    return ResolverCache(maxsize, ttl, shared=True)
+
+
+@config.subscriber(SettingsGroupModified)
+def configure_process_cache(ev):
+    from ptah import CFG_ID_PTAH
+
+    if ev.object.__name__ == CFG_ID_PTAH:
+        registry = ev.object.__registry__
+        get_process_cache(registry).configure(*_cache_settings(registry))
+
+
+@config.subscriber(UriInvalidateEvent)
+def invalidate_resolver_cache(ev):
+    cache = tldata.get(RESOLVER_CACHE_KEY)
+    if cache is not None:
+        cache.invalidate(ev.uri)
+
+    get_process_cache().invalidate(ev.uri)
 
 
 class UriFactory(object):
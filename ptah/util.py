@@ -1,5 +1,6 @@
 import ptah
 import threading
+from collections import OrderedDict
 from datetime import datetime
 from pyramid.interfaces import INewRequest
 
@@ -23,16 +24,126 @@ except ImportError: #pragma: no cover
     # Slowest
     import json as jsonmod
 
+
+class JsonCodec(object):
+    """ JSON codec, `dumps` returns text, datetime objects are
+    encoded with :py:func:`dthandler` format. `compatible` codec
+    output is same as output of stdlib json module. """
+
+    def __init__(self, name, dumps, loads, compatible=False):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+        self.compatible = compatible
+
+    def __repr__(self):
+        return '<JsonCodec %r>' % self.name
+
+
+#: Registered json codecs, ordered by preference
+json_codecs = OrderedDict()
+
+
+def register_json_codec(name, dumps, loads, compatible=False):
+    """ Register json codec, `dumps(ob)` has to use
+    :py:func:`dthandler` for unknown objects """
+    json_codecs[name] = JsonCodec(name, dumps, loads, compatible)
+
+
+def _std_codec(mod):
+    encoder = mod.JSONEncoder(**kwargs)
+    return encoder.encode, mod.loads
+
+
+def _fallback(dumps):
+    """ Values that codec can not encode (integers above 64 bits)
+    are encoded with stdlib encoder """
+    std_dumps = _std_codec(jsonmod)[0]
+
+    def fallback(ob):
+        try:
+            return dumps(ob)
+        except (TypeError, ValueError, OverflowError):
+            return std_dumps(ob)
+
+    return fallback
+
+
+try:
+    import orjson
+    _orjson_opts = (orjson.OPT_NON_STR_KEYS |
+                    orjson.OPT_PASSTHROUGH_DATETIME)
+except (ImportError, AttributeError): # pragma: no cover
+    pass
+else:
+    register_json_codec(
+        'orjson',
+        _fallback(lambda ob: orjson.dumps(
+            ob, default=dthandler, option=_orjson_opts).decode('utf-8')),
+        orjson.loads)
+
+try:
+    import ujson
+    _probe = datetime(2000, 1, 1)
+    if ujson.dumps(_probe, default=dthandler) != '"%s"' % dthandler(_probe):
+        raise TypeError('ujson ignores default handler') # pragma: no cover
+except (ImportError, TypeError): # pragma: no cover
+    pass
+else:
+    register_json_codec(
+        'ujson',
+        _fallback(lambda ob: ujson.dumps(
+            ob, default=dthandler, escape_forward_slashes=False)),
+        ujson.loads)
+
+if jsonmod.__name__ == 'simplejson': # pragma: no cover
+    register_json_codec('simplejson', *_std_codec(jsonmod), compatible=True)
+
+import json as _stdjson
+register_json_codec('json', *_std_codec(_stdjson), compatible=True)
+
+
+def set_json_codec(name='auto'):
+    """ Select json codec by name, 'auto' selects fastest available codec
+    with stdlib compatible output (simplejson or json). orjson and ujson
+    are faster, but they write non-ASCII characters as is, they have
+    to be selected by name.
+
+    :raise KeyError: Codec is not available
+    """
+    global _codec
+
+    if name == 'auto':
+        _codec = next(codec for codec in json_codecs.values()
+                      if codec.compatible)
+    else:
+        _codec = json_codecs[name]
+    return _codec
+
+
+_codec = set_json_codec()
+
+
+def get_json_codec():
+    """ Return current json codec """
+    return _codec
+
+
 class json(object):
 
     @staticmethod
     def dumps(o, **kw):
-        kw.update(kwargs)
-        return jsonmod.dumps(o, **kw)
+        if kw:
+            params = dict(kwargs)
+            params.update(kw)
+            return jsonmod.dumps(o, **params)
+        return _codec.dumps(o)
 
     @staticmethod
     def loads(s, **kw):
-        return jsonmod.loads(s, **kw)
+        if kw:
+            return jsonmod.loads(s, **kw)
+        return _codec.loads(s)
 
 
 class ThreadLocalManager(threading.local):
@@ -52,6 +163,45 @@ class ThreadLocalManager(threading.local):
 tldata = ThreadLocalManager()
 
 
+class CacheStats(object):
+    """ Cache hits and misses counters """
+
+    hits = 0
+    misses = 0
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class LatencyStats(object):
+    """ Calls number and latency counters """
+
+    calls = 0
+    total = 0.0
+    max = 0.0
+
+    def add(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    def reset(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def info(self):
+        return {'calls': self.calls,
+                'total': self.total,
+                'avg': self.total / self.calls if self.calls else 0.0,
+                'max': self.max}
+
+
 @ptah.subscriber(INewRequest)
 def resetThreadLocalData(ev):
     tldata.clear()
@@ -63,6 +63,9 @@ setup(name='ptah',
               'ptah-migrate = ptah.scripts.migrate:main',
               'ptah-populate = ptah.scripts.populate:main',
               'ptah-settings = ptah.scripts.settings:main',
+              'ptah-tokens = ptah.scripts.tokens:main',
+              'ptah-password = ptah.scripts.password:main',
+              'ptah-profile = ptah.scripts.profile:main',
               'ptah-layers = ptah.renderer.script:main',
               ],
           'pyramid.scaffold': [